@@ -79,7 +79,10 @@ class BayesBridge():
 
         # Initalize the regression coefficient sampler with the previous state.
         self.reg_coef_sampler = SparseRegressionCoefficientSampler(
-            self.n_pred, self.prior_sd_for_unshrunk, coef_sampler_type
+            self.n_pred, self.prior_sd_for_unshrunk, coef_sampler_type,
+            cg_mixed_precision=mcmc_output['options'].get(
+                'cg_mixed_precision', False
+            )
         )
         self.reg_coef_sampler.set_internal_state(mcmc_output['_reg_coef_sampler_state'])
 
@@ -111,13 +114,15 @@ class BayesBridge():
             number of burn-in samples to be discarded
         n_post_burnin : int
             number of posterior draws to be saved
-        coef_sampler_type : {None, 'cholesky', 'cg', 'hmc'}
+        coef_sampler_type : {None, 'cholesky', 'sparse_cholesky', 'cg', 'hmc'}
             Specifies the sampling method used to update regression coefficients.
             If None, the method is chosen via a crude heuristic based on the
             model type, as well as size and sparsity level of design matrix.
             For linear and logistic models with large and sparse design matrix,
             the conjugate gradient sampler ('cg') is preferred over the
-            Cholesky decomposition based sampler ('cholesky'). For other
+            Cholesky decomposition based sampler ('cholesky'). When X'X is
+            sparse and the design uncentered, 'sparse_cholesky' samples
+            exactly via a sparse Cholesky factorization. For other
             models, only Hamiltonian Monte Carlo ('hmc') can be used.
         n_init_optim : int
             If > 0, the Markov chain will be run after the specified number of
@@ -167,7 +172,7 @@ class BayesBridge():
             self.reg_coef_sampler = SparseRegressionCoefficientSampler(
                 self.n_pred, self.prior_sd_for_unshrunk,
                 options.coef_sampler_type, options.curvature_est_stabilized,
-                self.prior.slab_size
+                self.prior.slab_size, options.cg_mixed_precision
             )
 
         if params_to_save == 'all':
@@ -178,6 +183,8 @@ class BayesBridge():
                 params_to_save += ('obs_prec', )
 
         n_status_update = min(n_iter, n_status_update)
+        if options.matvec_cache_size > 0:
+            self.model.design.memoize_dot(True, options.matvec_cache_size)
         start_time = time.time()
         self.manager.stamp_time(start_time)
 
@@ -230,6 +237,11 @@ class BayesBridge():
             self.manager.print_status(n_status_update, mcmc_iter, n_iter)
 
         runtime = time.time() - start_time
+        if options.matvec_cache_size > 0:
+            matvec_cache_info = self.model.design.cache_info()._asdict()
+            self.model.design.memoize_dot(False)
+        else:
+            matvec_cache_info = None
 
         if self.prior._gscale_paramet == 'coef_magnitude':
             gscale, lscale = \
@@ -258,6 +270,7 @@ class BayesBridge():
             'runtime': runtime,
             'options': options.get_info(),
             'initial_optimization_info': initial_optim_info,
+            'matvec_cache_info': matvec_cache_info,
             '_reg_coef_sampling_info': sampling_info,
             '_markov_chain_state': _markov_chain_state,
             '_random_gen_state': self.rg.get_state(),
@@ -292,7 +305,7 @@ class BayesBridge():
             if not len(obs_prec) == self.n_obs:
                 raise ValueError('An invalid initial state.')
         elif self.model.name == 'linear':
-            obs_prec = np.mean((self.model.y - self.model.design.dot(coef)) ** 2) ** -1
+            obs_prec = (self.model.compute_resid_sq_norm(coef) / self.n_obs) ** -1
         elif self.model.name == 'logit':
             obs_prec = LogisticModel.compute_polya_gamma_mean(
                 self.model.n_trial, self.model.design.dot(coef)
@@ -368,17 +381,33 @@ class BayesBridge():
 
     def update_regress_coef(self, coef, obs_prec, gscale, lscale, sampling_method):
 
-        if sampling_method in ('cholesky', 'cg'):
+        if sampling_method in ('cholesky', 'sparse_cholesky', 'cg'):
 
-            if self.model.name == 'linear':
+            workspace = self.model.workspace
+            fisher_info, fisher_info_sqrt, v = None, None, None
+            if self.model.name == 'linear' \
+                    and self.model.sufficient_stat is not None \
+                    and sampling_method != 'sparse_cholesky':
                 y_gaussian = self.model.y
-                obs_prec = obs_prec * np.ones(self.n_obs)
+                fisher_info = obs_prec * self.model.sufficient_stat['XtX']
+                fisher_info_sqrt = np.sqrt(obs_prec) \
+                    * self.model.sufficient_stat['XtX_sqrt']
+                v = obs_prec * self.model.sufficient_stat['Xty']
+            elif self.model.name == 'linear':
+                y_gaussian = self.model.y
+                obs_prec_vec = workspace.get('obs_prec', self.n_obs)
+                obs_prec_vec.fill(obs_prec)
+                obs_prec = obs_prec_vec
             elif self.model.name == 'logit':
-                y_gaussian = (self.model.n_success - self.model.n_trial / 2) / obs_prec
+                y_gaussian = workspace.get('y_gaussian', self.n_obs)
+                np.multiply(self.model.n_trial, -.5, out=y_gaussian)
+                y_gaussian += self.model.n_success
+                y_gaussian /= obs_prec
 
             coef, info = self.reg_coef_sampler.sample_gaussian_posterior(
                 y_gaussian, self.model.design, obs_prec, gscale, lscale,
-                sampling_method
+                sampling_method, workspace, fisher_info=fisher_info,
+                fisher_info_sqrt=fisher_info_sqrt, v=v
             )
 
         elif sampling_method in ['hmc', 'nuts']:
@@ -395,14 +424,11 @@ class BayesBridge():
 
         obs_prec = None
         if self.model.name == 'linear':
-            resid = self.model.y - self.model.design.dot(coef)
-            scale = np.sum(resid ** 2) / 2
+            scale = self.model.compute_resid_sq_norm(coef) / 2
             obs_var = scale / self.rg.np_random.gamma(self.n_obs / 2, 1)
             obs_prec = 1 / obs_var
         elif self.model.name == 'logit':
-            obs_prec = self.rg.polya_gamma(
-                self.model.n_trial.astype(np.intc), self.model.design.dot(coef)
-            )
+            obs_prec = self.model.sample_polya_gamma(coef, self.rg)
 
         return obs_prec
 
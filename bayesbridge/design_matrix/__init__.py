@@ -1,2 +1,10 @@
 from .sparse_matrix import SparseDesignMatrix
-from .dense_matrix import DenseDesignMatrix
\ No newline at end of file
+from .dense_matrix import DenseDesignMatrix
+from .binary_matrix import BinaryDesignMatrix
+from .categorical_matrix import CategoricalDesignMatrix
+from .chunked_matrix import ChunkedDesignMatrix
+from .compact_matrix import CompactSparseDesignMatrix
+from .composite_matrix import CompositeDesignMatrix
+from .builder import DesignMatrixBuilder
+from .sharded_matrix import ShardedDesignMatrix
+from .column_partitioned_matrix import ColumnPartitionedDesignMatrix
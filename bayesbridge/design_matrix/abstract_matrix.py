@@ -3,48 +3,271 @@ import numpy as np
 import scipy as sp
 import scipy.sparse
 import warnings
+from .matvec_cache import MatvecCache
 
 class AbstractDesignMatrix():
 
+    _single_precision_copy = None
+    has_sparse_fisher_info = False
+        # Whether 'compute_main_sparse_fisher_info' is implemented.
+
     def __init__(self):
         self.dot_count = 0
         self.Tdot_count = 0
-        self.memoized = False
-        self.X_dot_v = None # For memoization
-        self.v_prev = None # For memoization
+        self.matvec_cache = None
 
     @property
     @abc.abstractmethod
     def shape(self):
         pass
 
+    def dot(self, v, out=None):
+        """
+        The centering, scaling, intercept, and memoization are handled here, so
+        the subclasses only need to implement 'main_dot' and 'main_Tdot'.
+
+        Params:
+        ------
+        out : None, numpy array
+            If given, the result is stored in this (C-contiguous, float64)
+            array instead of a newly allocated one and is returned.
+        """
+
+        if self.memoized:
+            result = self.matvec_cache.get('dot', v)
+            if result is not None:
+                return self.store_result(result, out)
+
+        main_v = v[int(self.intercept_added):]
+        if self.scaled:
+            main_v = self.column_scale * main_v
+        result = self.main_dot(main_v, out=out)
+        if self.intercept_added:
+            result += v[0]
+        if self.memoized:
+            self.matvec_cache.put('dot', v, result)
+        self.dot_count += 1
+
+        return result
+
+    def Tdot(self, v, out=None):
+        """ Multiply by the transpose of the matrix. """
+
+        if self.memoized:
+            result = self.matvec_cache.get('Tdot', v)
+            if result is not None:
+                return self.store_result(result, out)
+
+        result = np.empty(self.shape[1]) if out is None else out
+        main_result = result[int(self.intercept_added):]
+        self.main_Tdot(v, out=main_result)
+        if self.scaled:
+            main_result *= self.column_scale
+        if self.intercept_added:
+            result[0] = np.sum(v)
+        if self.memoized:
+            self.matvec_cache.put('Tdot', v, result)
+        self.Tdot_count += 1
+        return result
+
     @abc.abstractmethod
-    def dot(self, v):
+    def main_dot(self, v, out=None):
+        """ Multiply by the main effect part of the design matrix, with the
+        centering but not the scaling applied. """
         pass
 
     @abc.abstractmethod
-    def Tdot(self, v):
-        """ Multiply by the transpose of the matrix. """
+    def main_Tdot(self, v, out=None):
+        """ Counterpart of 'main_dot' for the transpose. """
         pass
 
+    def dot_block(self, V):
+        """ Multiplies a block of vectors, given as the columns of a numpy
+        array of shape (n_pred, k), in a single pass over the matrix. """
+        main_V = V[int(self.intercept_added):]
+        if self.scaled:
+            main_V = self.column_scale[:, np.newaxis] * main_V
+        result = self.main_dot_block(main_V)
+        if self.intercept_added:
+            result += V[0]
+        self.dot_count += V.shape[1]
+        return result
+
+    def Tdot_block(self, U):
+        """ Counterpart of 'dot_block' for the transpose, with U of shape
+        (n_obs, k). """
+        result = np.empty((self.shape[1], U.shape[1]))
+        main_result = result[int(self.intercept_added):]
+        main_result[:] = self.main_Tdot_block(U)
+        if self.scaled:
+            main_result *= self.column_scale[:, np.newaxis]
+        if self.intercept_added:
+            result[0] = np.sum(U, axis=0)
+        self.Tdot_count += U.shape[1]
+        return result
+
+    def main_dot_block(self, V):
+        """ Falls back to the column-by-column multiplication unless the
+        subclass provides a kernel for multiple vectors. """
+        return np.stack([
+            self.main_dot(np.ascontiguousarray(V[:, j])) for j in range(V.shape[1])
+        ], axis=1)
+
+    def main_Tdot_block(self, U):
+        return np.stack([
+            self.main_Tdot(np.ascontiguousarray(U[:, j])) for j in range(U.shape[1])
+        ], axis=1)
+
+    @staticmethod
+    def store_result(result, out=None):
+        if out is None:
+            return result
+        out[:] = result
+        return out
+
+    def as_single_precision(self):
+        """ Returns a design matrix representing the same matrix but storing
+        it and computing the products in float32, with the inputs and 'out'
+        arrays expected to be float32 as well. The designs without such a
+        version return themselves.
+        """
+        return self
+
     @property
     @abc.abstractmethod
     def is_sparse(self):
         pass
 
-    def memoize_dot(self, flag=True):
-        self.memoized = flag
-        if self.v_prev is None:
-            self.v_prev = np.full(self.shape[1], float('nan'))
+    @property
+    def memoized(self):
+        return self.matvec_cache is not None
+
+    def memoize_dot(self, flag=True, cache_size=4):
+        """ Turns on (or off) the caching of the results of 'dot' and 'Tdot'
+        for the 'cache_size' most recently used input vectors. """
         if not flag:
-            self.X_dot_v = None
-            self.v_prev = None
+            self.matvec_cache = None
+        elif self.matvec_cache is None \
+                or self.matvec_cache.maxsize != cache_size:
+            self.matvec_cache = MatvecCache(cache_size)
+
+    def cache_info(self):
+        """ Returns the hit and miss counts of the matvec cache, or None if
+        the cache is not in use. """
+        return self.matvec_cache.info() if self.memoized else None
+
+    def compute_fisher_info(self, weight, diag_only=False):
+        """ Computes X' diag(weight) X and returns it as a numpy array.
+
+        The centering, scaling, and intercept are accounted for analytically, so the
+        subclasses only need to implement the uncentered computations
+        'compute_main_fisher_info' and 'compute_main_fisher_diag'.
+        """
+
+        if diag_only:
+            return self.compute_fisher_diag(weight)
+
+        main_fisher_info, weighted_col_sum \
+            = self.compute_main_fisher_info(weight)
+
+        n_pred = self.shape[1]
+        fisher_info = np.zeros((n_pred, n_pred))
+        if self.intercept_added:
+            fisher_info[0, 0] = np.sum(weight)
+            fisher_info[0, 1:] \
+                = weighted_col_sum - np.sum(weight) * self.column_offset
+            fisher_info[1:, 0] = fisher_info[0, 1:]
+            fisher_info_wo_intercept = fisher_info[1:, 1:]
+        else:
+            fisher_info_wo_intercept = fisher_info
+
+        fisher_info_wo_intercept += main_fisher_info
+        if self.centered:
+            outer_prod_term = np.outer(self.column_offset, weighted_col_sum)
+            fisher_info_wo_intercept -= outer_prod_term + outer_prod_term.T
+            fisher_info_wo_intercept \
+                += np.sum(weight) * np.outer(self.column_offset, self.column_offset)
+
+        if self.scaled:
+            fisher_info_wo_intercept \
+                *= np.outer(self.column_scale, self.column_scale)
+            if self.intercept_added:
+                fisher_info[0, 1:] *= self.column_scale
+                fisher_info[1:, 0] = fisher_info[0, 1:]
+
+        return fisher_info
+
+    def compute_fisher_diag(self, weight):
+
+        diag, weighted_col_sum = self.compute_main_fisher_diag(weight)
+        if self.centered:
+            diag -= 2 * self.column_offset * weighted_col_sum
+            diag += np.sum(weight) * self.column_offset ** 2
+        if self.scaled:
+            diag *= self.column_scale ** 2
+        if self.intercept_added:
+            diag = np.concatenate(([np.sum(weight)], diag))
+
+        return diag
+
+    def compute_sparse_fisher_info(self, weight):
+        """ Computes X' diag(weight) X as a scipy CSC matrix. Only available
+        for the uncentered designs, as the centering makes it dense.
+        """
+        if self.centered:
+            raise ValueError(
+                "The sparse Fisher information requires an uncentered design."
+            )
+        main_fisher_info, weighted_col_sum \
+            = self.compute_main_sparse_fisher_info(weight)
+        if self.scaled:
+            scale_mat = sp.sparse.diags(self.column_scale)
+            main_fisher_info = scale_mat.dot(main_fisher_info).dot(scale_mat)
+            weighted_col_sum = self.column_scale * weighted_col_sum
+        if self.intercept_added:
+            main_fisher_info = sp.sparse.bmat([
+                [np.atleast_2d(np.sum(weight)), weighted_col_sum[np.newaxis, :]],
+                [weighted_col_sum[:, np.newaxis], main_fisher_info]
+            ])
+        return sp.sparse.csc_matrix(main_fisher_info)
+
+    def compute_main_sparse_fisher_info(self, weight):
+        """ Sparse counterpart of 'compute_main_fisher_info', implemented
+        only by the designs with 'has_sparse_fisher_info == True'. """
+        raise NotImplementedError(
+            "The sparse Fisher information is not supported by this design."
+        )
+
+    @abc.abstractmethod
+    def compute_main_fisher_info(self, weight):
+        """ Computes X' diag(weight) X for the uncentered main effect part of
+        the design matrix, along with the weighted column sum X' weight for
+        applying the centering and intercept corrections.
+        """
+        pass
 
     @abc.abstractmethod
-    def compute_fisher_info(self, weight, diag_only):
-        """ Computes X' diag(weight) X and returns it as a numpy array. """
+    def compute_main_fisher_diag(self, weight):
+        """ Counterpart of 'compute_main_fisher_info' for the diagonal. The
+        weighted column sum may be None if the matrix is not centered.
+        """
         pass
 
+    def unscale_coef(self, coef):
+        """ Maps the coefficients of the scaled predictors to those of the
+        predictors in their original scale (but still centered if the design
+        matrix is).
+
+        Params:
+        ------
+        coef : numpy array of shape (n_pred, ) or (n_pred, n_sample)
+        """
+        coef = coef.copy()
+        column_scale = self.column_scale if coef.ndim == 1 \
+            else self.column_scale[:, np.newaxis]
+        coef[int(self.intercept_added):] *= column_scale
+        return coef
+
     @property
     def n_matvec(self):
         return self.dot_count + self.Tdot_count
@@ -64,18 +287,65 @@ class AbstractDesignMatrix():
         pass
 
     @staticmethod
-    def remove_intercept_indicator(X):
-        if sp.sparse.issparse(X):
-            col_variance = np.squeeze(np.array(
-                X.power(2).mean(axis=0) - np.power(X.mean(axis=0), 2)
-            ))
-        else:
-            col_variance = np.var(X, axis=0)
-        has_zero_variance = (col_variance < X.shape[0] * 2 ** -52)
+    def remove_intercept_indicator(X, col_variance=None):
+        if col_variance is None:
+            _, col_variance = AbstractDesignMatrix.compute_column_moments(X)
+        has_zero_variance = \
+            AbstractDesignMatrix.has_zero_variance(X.shape[0], col_variance)
         if np.any(has_zero_variance):
-            warnings.warn(
-                "Intercept column (or numerically indistinguishable from "
-                "such) detected. Do not add intercept manually. Removing...."
-            )
+            AbstractDesignMatrix.warn_intercept_removal()
             X = X[:, np.logical_not(has_zero_variance)]
-        return X
\ No newline at end of file
+        return X
+
+    @staticmethod
+    def warn_intercept_removal():
+        warnings.warn(
+            "Intercept column (or numerically indistinguishable from "
+            "such) detected. Do not add intercept manually. Removing...."
+        )
+
+    @staticmethod
+    def has_zero_variance(n_obs, col_variance):
+        return col_variance < n_obs * 2 ** -52
+
+    @staticmethod
+    def compute_column_moments(X, n_row_per_chunk=None):
+        """ Computes the column means and variances in a single pass over
+        chunks of rows, so that the whole of X (possibly memory-mapped) is
+        never copied at once.
+        """
+        n_obs, n_pred = X.shape
+        if n_row_per_chunk is None:
+            n_row_per_chunk = max(1, 2 ** 22 // max(1, n_pred))
+        col_mean = np.zeros(n_pred)
+        if sp.sparse.issparse(X):
+            X = X.tocsr()
+            col_sq_mean = np.zeros(n_pred)
+            for start in range(0, n_obs, n_row_per_chunk):
+                nz_start = X.indptr[start]
+                nz_end = X.indptr[min(start + n_row_per_chunk, n_obs)]
+                data = np.asarray(X.data[nz_start:nz_end], dtype=np.float64)
+                indices = X.indices[nz_start:nz_end]
+                col_mean += np.bincount(indices, data, minlength=n_pred)
+                col_sq_mean += np.bincount(indices, data ** 2, minlength=n_pred)
+            col_mean /= n_obs
+            col_variance = col_sq_mean / n_obs - col_mean ** 2
+        else:
+            # Chan et al.'s pairwise update for numerical stability.
+            sum_sq_dev = np.zeros(n_pred)
+            n_seen = 0
+            for start in range(0, n_obs, n_row_per_chunk):
+                X_chunk = np.asarray(
+                    X[start:(start + n_row_per_chunk)], dtype=np.float64
+                )
+                n_chunk = X_chunk.shape[0]
+                chunk_mean = np.mean(X_chunk, axis=0)
+                chunk_sum_sq_dev = np.sum((X_chunk - chunk_mean) ** 2, axis=0)
+                delta = chunk_mean - col_mean
+                n_total = n_seen + n_chunk
+                col_mean += delta * n_chunk / n_total
+                sum_sq_dev += chunk_sum_sq_dev \
+                              + delta ** 2 * n_seen * n_chunk / n_total
+                n_seen = n_total
+            col_variance = sum_sq_dev / n_obs
+        return col_mean, col_variance
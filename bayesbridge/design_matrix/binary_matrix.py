@@ -0,0 +1,154 @@
+import numpy as np
+import scipy.sparse as sparse
+from .abstract_matrix import AbstractDesignMatrix
+from .sparse_matrix import SparseDesignMatrix
+try:
+    from .cython_matmal.binary_matmul import binary_matmul, binary_Tmatmul
+except ImportError:
+    binary_matmul, binary_Tmatmul = None, None
+
+
+class BinaryDesignMatrix(SparseDesignMatrix):
+    """ Sparse design matrix whose non-zero entries all equal one, so that
+    only the pattern (i.e. the CSR indices and indptr) needs to be stored.
+    """
+
+    def __init__(self, X, center_predictor=False, add_intercept=True,
+                 scale_predictor=False, copy_array=False):
+        """
+        Params:
+        ------
+        X : scipy sparse matrix with all the non-zero entries equal to one
+        """
+        if copy_array:
+            X = X.copy()
+        X = X.tocsr()
+        if not self.is_binary(X):
+            raise ValueError(
+                "The non-zero entries of a binary design matrix must all be one."
+            )
+        X = self.remove_intercept_indicator(X)
+        super(SparseDesignMatrix, self).__init__()
+        self.use_mkl = False
+        self.use_cython = (binary_matmul is not None)
+
+        index_dtype = self.choose_index_dtype(X.nnz, X.shape[1])
+        self.indices = X.indices.astype(index_dtype, copy=False)
+        self.indptr = X.indptr.astype(index_dtype, copy=False)
+        self.main_shape = X.shape
+        del X # Only the pattern is kept from here on.
+
+        col_mean = self.column_count / self.main_shape[0]
+        self.centered = center_predictor
+        if center_predictor:
+            self.column_offset = col_mean
+        else:
+            self.column_offset = np.zeros(self.main_shape[1])
+        self.scaled = scale_predictor
+        if scale_predictor:
+            self.column_scale = 1 / np.sqrt(col_mean * (1 - col_mean))
+        else:
+            self.column_scale = np.ones(self.main_shape[1])
+        self.intercept_added = add_intercept
+
+    @staticmethod
+    def is_binary(X):
+        return np.all(X.data == 1)
+
+    @property
+    def shape(self):
+        shape = self.main_shape
+        return shape[0], shape[1] + int(self.intercept_added)
+
+    @property
+    def nnz(self):
+        return len(self.indices)
+
+    @property
+    def column_count(self):
+        return np.bincount(
+            self.indices, minlength=self.main_shape[1]
+        ).astype('float64')
+
+    def main_dot(self, v, out=None):
+        v = np.ascontiguousarray(v, dtype=np.float64)
+        if self.use_cython:
+            result = self.store_result(
+                binary_matmul(self.indices, self.indptr, v), out
+            )
+        else:
+            result = np.zeros(self.main_shape[0]) if out is None else out
+            result[:] = 0.
+            row_start = self.indptr[:-1]
+            is_nonempty = (self.indptr[1:] > row_start)
+            if np.any(is_nonempty):
+                result[is_nonempty] = np.add.reduceat(
+                    v[self.indices], row_start[is_nonempty]
+                )
+        result -= np.inner(self.column_offset, v)
+        return result
+
+    def main_Tdot(self, v, out=None):
+        result = self.store_result(self.main_uncentered_Tdot(v), out)
+        result -= np.sum(v) * self.column_offset
+        return result
+
+    def main_uncentered_Tdot(self, v):
+        v = np.ascontiguousarray(v, dtype=np.float64)
+        if self.use_cython:
+            return binary_Tmatmul(
+                self.indices, self.indptr, v, self.main_shape[1]
+            )
+        row_nnz = np.diff(self.indptr)
+        return np.bincount(
+            self.indices, weights=np.repeat(v, row_nnz),
+            minlength=self.main_shape[1]
+        )
+
+    def main_dot_block(self, V):
+        result = self.to_csr().dot(V)
+        result -= self.column_offset.dot(V)
+        return result
+
+    def main_Tdot_block(self, U):
+        result = self.to_csr().T.dot(U)
+        result -= np.outer(self.column_offset, np.sum(U, axis=0))
+        return result
+
+    # With no matrix entries to store, float32 would not save any bandwidth.
+    as_single_precision = AbstractDesignMatrix.as_single_precision
+
+    def compute_main_fisher_info(self, weight):
+        # Requires the weight to be non-negative, as is the case for the
+        # Fisher information of the supported models.
+        sqrt_weighted_X = self.to_csr(np.sqrt(weight))
+        main_fisher_info = sqrt_weighted_X.T.dot(sqrt_weighted_X).toarray()
+        return main_fisher_info, self.main_uncentered_Tdot(weight)
+
+    def compute_main_sparse_fisher_info(self, weight):
+        sqrt_weighted_X = self.to_csr(np.sqrt(weight))
+        main_fisher_info = sqrt_weighted_X.T.dot(sqrt_weighted_X).tocsc()
+        return main_fisher_info, self.main_uncentered_Tdot(weight)
+
+    def compute_main_fisher_diag(self, weight):
+        # Squaring a binary matrix leaves it unchanged.
+        weighted_col_sum = self.main_uncentered_Tdot(weight)
+        return weighted_col_sum.copy(), weighted_col_sum
+
+    def to_csr(self, row_value=None):
+        """ Returns a scipy CSR matrix with the same pattern, optionally
+        scaling each row by 'row_value'. """
+        if row_value is None:
+            data = np.ones(self.nnz)
+        else:
+            data = np.repeat(row_value, np.diff(self.indptr))
+        return sparse.csr_matrix(
+            (data, self.indices, self.indptr), shape=self.main_shape
+        )
+
+    def toarray(self):
+        X = self.to_csr().toarray() - self.column_offset[np.newaxis, :]
+        X *= self.column_scale[np.newaxis, :]
+        if self.intercept_added:
+            X = np.hstack((np.ones((X.shape[0], 1)), X))
+        return X
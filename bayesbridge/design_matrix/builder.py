@@ -0,0 +1,257 @@
+import warnings
+import numpy as np
+import scipy.sparse as sparse
+from .abstract_matrix import AbstractDesignMatrix
+from .sparse_matrix import SparseDesignMatrix
+
+
+class DesignMatrixBuilder():
+    """ Assembles a CSR design matrix from batches of rows without ever
+    holding more than about one copy of the data.
+
+    The column moments and the statistics for detecting constant, all-zero,
+    and duplicate columns are accumulated as the batches arrive. The final
+    CSR arrays are then filled batch by batch, dropping the detected columns
+    and releasing each batch once it has been copied.
+
+    Usage:
+    ------
+    builder = DesignMatrixBuilder(n_col)
+    for X_batch in batches:
+        builder.add_rows(X_batch)
+    X = builder.build() # or builder.build_design_matrix(**kwargs)
+    """
+
+    def __init__(self, n_col, dtype=np.float64, seed=0):
+        """
+        Params:
+        ------
+        n_col : int
+        dtype : numpy dtype
+            Storage type of the non-zero entries of the output.
+        seed : int
+            Seed for the random row weights used to fingerprint the columns.
+        """
+        self.n_col = n_col
+        self.dtype = np.dtype(dtype)
+        self.n_row = 0
+        self._batches = []
+        self._col_sum = np.zeros(n_col)
+        self._col_sq_sum = np.zeros(n_col)
+        self._col_nnz = np.zeros(n_col, dtype=np.int64)
+        self._col_fingerprint = np.zeros(n_col)
+        self._random_gen = np.random.RandomState(seed)
+        self._built = False
+        self.column_index = None
+        self.removed_columns = None
+
+    def add_rows(self, X_batch):
+        """
+        Params:
+        ------
+        X_batch : numpy array or scipy sparse matrix of shape (n, n_col)
+        """
+        if X_batch.shape[1] != self.n_col:
+            raise ValueError("The batch has an incompatible number of columns.")
+        X_batch = sparse.coo_matrix(X_batch)
+        return self.add_coo(X_batch.row, X_batch.col, X_batch.data, X_batch.shape[0])
+
+    def add_coo(self, row, col, data, n_row):
+        """ Appends 'n_row' rows given as a COO chunk, with the row indices
+        relative to the first row of the chunk. As in Scipy, the repeated
+        entries of the same (row, col) are summed. """
+        if self._built:
+            raise RuntimeError("The design matrix has already been built.")
+        row, col, data = (np.asarray(arr) for arr in (row, col, data))
+        if len(row) > 0:
+            if np.min(row) < 0 or np.max(row) >= n_row:
+                raise ValueError("Row indices out of range.")
+            if np.min(col) < 0 or np.max(col) >= self.n_col:
+                raise ValueError("Column indices out of range.")
+
+        X_chunk = sparse.coo_matrix((data, (row, col)), shape=(n_row, self.n_col))
+        X_chunk.sum_duplicates() # Also sorts the entries in the row-major order.
+        is_nonzero = (X_chunk.data != 0)
+        row, col = X_chunk.row[is_nonzero], X_chunk.col[is_nonzero]
+        data = X_chunk.data[is_nonzero].astype(self.dtype, copy=False)
+        del X_chunk
+
+        data_float = data.astype(np.float64, copy=False)
+        row_weight = self._random_gen.randn(n_row)
+        self._col_sum += np.bincount(col, data_float, minlength=self.n_col)
+        self._col_sq_sum += np.bincount(col, data_float ** 2, minlength=self.n_col)
+        self._col_nnz += np.bincount(col, minlength=self.n_col)
+        self._col_fingerprint += np.bincount(
+            col, data_float * row_weight[row], minlength=self.n_col
+        )
+
+        index_dtype = np.int32 if self.n_col < 2 ** 31 else np.int64
+        row_nnz = np.bincount(row, minlength=n_row)
+        self._batches.append((col.astype(index_dtype), data, row_nnz))
+        self.n_row += n_row
+        return self
+
+    @property
+    def col_mean(self):
+        return self._col_sum / self.n_row
+
+    @property
+    def col_variance(self):
+        return self._col_sq_sum / self.n_row - self.col_mean ** 2
+
+    def find_zero_columns(self):
+        return np.flatnonzero(self._col_nnz == 0)
+
+    def find_constant_columns(self):
+        """ Returns the columns that are constant but not all zero. """
+        is_constant = AbstractDesignMatrix.has_zero_variance(
+            self.n_row, self.col_variance
+        )
+        return np.flatnonzero(is_constant & (self._col_nnz > 0))
+
+    def find_duplicate_columns(self, candidate=None):
+        """ Returns a dict mapping each duplicate column to the first column
+        identical to it. The columns with matching fingerprints are compared
+        entry-wise, so the result is exact.
+        """
+        if candidate is None:
+            candidate = np.flatnonzero(self._col_nnz > 0)
+        keys = np.vstack([
+            arr[candidate] for arr in
+            (self._col_nnz, self._col_sum, self._col_sq_sum, self._col_fingerprint)
+        ])
+        sort_index = np.lexsort(keys[::-1])
+        keys, candidate = keys[:, sort_index], candidate[sort_index]
+        is_same_as_prev = np.all(keys[:, 1:] == keys[:, :-1], axis=0)
+        if not np.any(is_same_as_prev):
+            return {}
+
+        is_in_group = np.zeros(len(candidate), dtype=bool)
+        is_in_group[1:] |= is_same_as_prev
+        is_in_group[:-1] |= is_same_as_prev
+        group_cols = np.sort(candidate[is_in_group])
+        X_group = self._extract_columns(group_cols)
+        group_start = np.flatnonzero(np.concatenate((
+            [True], np.logical_not(is_same_as_prev)
+        )))
+        group_end = np.append(group_start[1:], len(candidate))
+
+        duplicate_of = {}
+        for start, end in zip(group_start, group_end):
+            if end - start < 2:
+                continue
+            cols = np.sort(candidate[start:end])
+            for k, j in enumerate(cols):
+                if j in duplicate_of:
+                    continue
+                col_j = self._get_column(X_group, np.searchsorted(group_cols, j))
+                for l in cols[(k + 1):]:
+                    if l in duplicate_of:
+                        continue
+                    col_l = self._get_column(X_group, np.searchsorted(group_cols, l))
+                    if all(np.array_equal(a, b) for a, b in zip(col_j, col_l)):
+                        duplicate_of[l] = j
+        return duplicate_of
+
+    def _extract_columns(self, cols):
+        """ Returns the specified columns as a CSC matrix via a pass over
+        the batches. """
+        is_extracted = np.zeros(self.n_col, dtype=bool)
+        is_extracted[cols] = True
+        new_index = np.zeros(self.n_col, dtype=np.intp)
+        new_index[cols] = np.arange(len(cols))
+        rows, new_cols, values = [], [], []
+        row_offset = 0
+        for indices, data, row_nnz in self._batches:
+            mask = is_extracted[indices]
+            row = np.repeat(np.arange(len(row_nnz)), row_nnz)
+            rows.append(row_offset + row[mask])
+            new_cols.append(new_index[indices[mask]])
+            values.append(data[mask])
+            row_offset += len(row_nnz)
+        return sparse.csc_matrix(
+            (np.concatenate(values), (np.concatenate(rows), np.concatenate(new_cols))),
+            shape=(self.n_row, len(cols))
+        )
+
+    @staticmethod
+    def _get_column(X_csc, j):
+        col_slice = slice(X_csc.indptr[j], X_csc.indptr[j + 1])
+        return X_csc.indices[col_slice], X_csc.data[col_slice]
+
+    def build(self, drop_constant=True, drop_zero=True, drop_duplicate=True):
+        """ Returns the design matrix as a scipy CSR matrix, after which the
+        builder is exhausted. The original indices of the retained columns
+        are stored in 'column_index' and those of the dropped ones in
+        'removed_columns'.
+        """
+        if self._built:
+            raise RuntimeError("The design matrix has already been built.")
+
+        is_kept = np.ones(self.n_col, dtype=bool)
+        self.removed_columns = {}
+        if drop_zero:
+            zero_cols = self.find_zero_columns()
+            if len(zero_cols) > 0:
+                warnings.warn("All-zero columns detected. Removing....")
+            self.removed_columns['zero'] = zero_cols
+            is_kept[zero_cols] = False
+        if drop_constant:
+            constant_cols = self.find_constant_columns()
+            if len(constant_cols) > 0:
+                AbstractDesignMatrix.warn_intercept_removal()
+            self.removed_columns['constant'] = constant_cols
+            is_kept[constant_cols] = False
+        if drop_duplicate:
+            duplicate_of = self.find_duplicate_columns(np.flatnonzero(
+                is_kept & (self._col_nnz > 0)
+            ))
+            if len(duplicate_of) > 0:
+                warnings.warn("Duplicate columns detected. Removing....")
+            self.removed_columns['duplicate'] = duplicate_of
+            is_kept[list(duplicate_of.keys())] = False
+
+        self.column_index = np.flatnonzero(is_kept)
+        new_index = np.cumsum(is_kept) - 1
+        nnz = np.sum(self._col_nnz[is_kept])
+        index_dtype = np.int32 \
+            if max(nnz, self.n_col) < 2 ** 31 else np.int64
+        data_out = np.empty(nnz, dtype=self.dtype)
+        indices_out = np.empty(nnz, dtype=index_dtype)
+        indptr_out = np.zeros(self.n_row + 1, dtype=index_dtype)
+
+        # Fill in the output while releasing the batches one by one.
+        self._batches.reverse()
+        nz_start, row_start = 0, 0
+        while self._batches:
+            indices, data, row_nnz = self._batches.pop()
+            mask = is_kept[indices]
+            n_kept = np.count_nonzero(mask)
+            nz_slice = slice(nz_start, nz_start + n_kept)
+            data_out[nz_slice] = data[mask]
+            indices_out[nz_slice] = new_index[indices[mask]]
+            row = np.repeat(np.arange(len(row_nnz)), row_nnz)
+            indptr_out[(row_start + 1):(row_start + len(row_nnz) + 1)] \
+                = nz_start + np.cumsum(np.bincount(row[mask], minlength=len(row_nnz)))
+            del indices, data, mask, row
+            nz_start += n_kept
+            row_start += len(row_nnz)
+        self._built = True
+
+        return sparse.csr_matrix(
+            (data_out, indices_out, indptr_out),
+            shape=(self.n_row, len(self.column_index)), copy=False
+        )
+
+    def build_design_matrix(self, drop_duplicate=True, **kwargs):
+        """ Returns a SparseDesignMatrix wrapping the built CSR matrix without
+        copying it; 'kwargs' are passed on to the constructor. The column
+        moments accumulated by the builder are passed on as well, saving the
+        constructor a pass over the matrix. """
+        col_mean, col_variance = self.col_mean, self.col_variance
+        X = self.build(drop_duplicate=drop_duplicate)
+        return SparseDesignMatrix(
+            X, copy_array=False, column_moments=(
+                col_mean[self.column_index], col_variance[self.column_index]
+            ), **kwargs
+        )
@@ -0,0 +1,210 @@
+import warnings
+import numpy as np
+import scipy.sparse as sparse
+from .abstract_matrix import AbstractDesignMatrix
+from .sparse_matrix import SparseDesignMatrix
+
+
+class CategoricalDesignMatrix(SparseDesignMatrix):
+    """ Design matrix of one-hot encoded categorical predictors, represented
+    by the category codes of each observation instead of the indicators.
+
+    The category coded as 0 is treated as the baseline and does not have its
+    own column, so a factor with K categories contributes K - 1 columns. The
+    non-baseline categories never observed are dropped as they would give
+    all-zero columns; 'category_index[j]' holds the original codes of the
+    columns of the j-th factor.
+    """
+
+    def __init__(self, codes, n_category=None, center_predictor=False,
+                 add_intercept=True, scale_predictor=False, copy_array=False):
+        """
+        Params:
+        ------
+        codes : 2-d numpy integer array of shape (n_obs, n_factor)
+            Each column contains the category codes 0, 1, ..., K - 1 of a factor.
+        n_category : None, 1-d numpy array of length n_factor
+            If None, inferred from the largest code of each factor.
+        """
+        if copy_array:
+            codes = codes.copy()
+        super(SparseDesignMatrix, self).__init__()
+        self.use_mkl = False
+
+        if codes.ndim == 1:
+            codes = codes[:, np.newaxis]
+        if np.any(codes < 0):
+            raise ValueError("Category codes must be non-negative.")
+        if n_category is None:
+            n_category = np.max(codes, axis=0) + 1
+        n_category = np.asarray(n_category, dtype=np.intp)
+        if np.any(np.max(codes, axis=0) >= n_category):
+            raise ValueError("Category codes must be smaller than n_category.")
+        codes, n_category, self.category_index = \
+            self.drop_unobserved_categories(codes, n_category)
+
+        code_dtype = np.min_scalar_type(np.max(n_category) - 1)
+        self.codes = np.asfortranarray(codes, dtype=code_dtype)
+            # Column-major so that each factor is contiguous in memory.
+        self.n_category = n_category
+        self.column_start = np.concatenate((
+            [0], np.cumsum(n_category - 1)
+        ))
+        self.main_shape = (codes.shape[0], self.column_start[-1])
+
+        column_count = self.main_uncentered_Tdot(np.ones(codes.shape[0]))
+        if np.any(column_count == codes.shape[0]):
+            raise ValueError(
+                "Some non-baseline category is observed for all the "
+                "observations and is indistinguishable from intercept. "
+                "Use a category with positive frequency as the baseline."
+            )
+
+        col_mean = column_count / codes.shape[0]
+        self.centered = center_predictor
+        if center_predictor:
+            self.column_offset = col_mean
+        else:
+            self.column_offset = np.zeros(self.main_shape[1])
+        self.scaled = scale_predictor
+        if scale_predictor:
+            self.column_scale = 1 / np.sqrt(col_mean * (1 - col_mean))
+        else:
+            self.column_scale = np.ones(self.main_shape[1])
+        self.intercept_added = add_intercept
+
+    @staticmethod
+    def drop_unobserved_categories(codes, n_category):
+        """ Relabels the codes so that the observed non-baseline categories
+        of each factor are numbered consecutively from 1. """
+        is_observed = [
+            np.bincount(codes[:, j], minlength=n_category[j]) > 0
+            for j in range(codes.shape[1])
+        ]
+        for is_observed_j in is_observed:
+            is_observed_j[0] = True # Baseline is kept regardless.
+        category_index = [
+            np.flatnonzero(is_observed_j)[1:] for is_observed_j in is_observed
+        ]
+        if all(np.all(is_observed_j) for is_observed_j in is_observed):
+            return codes, n_category, category_index
+
+        warnings.warn("Unobserved categories detected. Removing....")
+        relabeled_codes = np.empty(codes.shape, dtype=np.intp)
+        for j, is_observed_j in enumerate(is_observed):
+            new_code = np.cumsum(is_observed_j) - 1
+            relabeled_codes[:, j] = new_code[codes[:, j]]
+        n_category = np.array([
+            len(category_index_j) + 1 for category_index_j in category_index
+        ])
+        return relabeled_codes, n_category, category_index
+
+    @property
+    def n_factor(self):
+        return self.codes.shape[1]
+
+    @property
+    def shape(self):
+        shape = self.main_shape
+        return shape[0], shape[1] + int(self.intercept_added)
+
+    @property
+    def nnz(self):
+        return np.count_nonzero(self.codes)
+
+    def factor_slice(self, j):
+        return slice(self.column_start[j], self.column_start[j + 1])
+
+    def main_dot(self, v, out=None):
+        result = np.zeros(self.main_shape[0]) if out is None else out
+        result[:] = 0.
+        for j in range(self.n_factor):
+            v_with_baseline = np.concatenate(([0.], v[self.factor_slice(j)]))
+            result += v_with_baseline[self.codes[:, j]]
+        result -= np.inner(self.column_offset, v)
+        return result
+
+    def main_Tdot(self, v, out=None):
+        result = self.store_result(self.main_uncentered_Tdot(v), out)
+        result -= np.sum(v) * self.column_offset
+        return result
+
+    def main_uncentered_Tdot(self, v):
+        result = np.zeros(self.main_shape[1])
+        for j in range(self.n_factor):
+            result[self.factor_slice(j)] = np.bincount(
+                self.codes[:, j], weights=v, minlength=self.n_category[j]
+            )[1:]
+        return result
+
+    def main_dot_block(self, V):
+        result = np.zeros((self.main_shape[0], V.shape[1]))
+        for j in range(self.n_factor):
+            V_with_baseline = np.vstack((
+                np.zeros((1, V.shape[1])), V[self.factor_slice(j)]
+            ))
+            result += V_with_baseline[self.codes[:, j]]
+        result -= self.column_offset.dot(V)
+        return result
+
+    # The bincount of each vector is already a single pass over the codes.
+    main_Tdot_block = AbstractDesignMatrix.main_Tdot_block
+
+    # Only the codes are stored, so float32 would not save any bandwidth.
+    as_single_precision = AbstractDesignMatrix.as_single_precision
+
+    def compute_main_fisher_info(self, weight):
+        weighted_col_sum = self.main_uncentered_Tdot(weight)
+        main_fisher_info = np.diag(weighted_col_sum)
+            # Categories of the same factor never co-occur.
+        for j in range(self.n_factor):
+            for k in range(j + 1, self.n_factor):
+                n_cat_j, n_cat_k = self.n_category[j], self.n_category[k]
+                joint_code = self.codes[:, j].astype(np.intp) * n_cat_k \
+                             + self.codes[:, k]
+                cross_tab = np.bincount(
+                    joint_code, weights=weight, minlength=n_cat_j * n_cat_k
+                ).reshape(n_cat_j, n_cat_k)[1:, 1:]
+                main_fisher_info[self.factor_slice(j), self.factor_slice(k)] \
+                    = cross_tab
+                main_fisher_info[self.factor_slice(k), self.factor_slice(j)] \
+                    = cross_tab.T
+        return main_fisher_info, weighted_col_sum
+
+    def compute_main_sparse_fisher_info(self, weight):
+        X = self.to_indicator_matrix()
+        weighted_X = self.create_diag_matrix(weight).dot(X)
+        return X.T.dot(weighted_X).tocsc(), self.main_uncentered_Tdot(weight)
+
+    def to_indicator_matrix(self):
+        """ Returns the uncentered one-hot encoding as a CSR matrix. """
+        row_index, col_index = [], []
+        for j in range(self.n_factor):
+            is_nonbaseline = (self.codes[:, j] > 0)
+            row_index.append(np.flatnonzero(is_nonbaseline))
+            col_index.append(
+                self.column_start[j] + self.codes[is_nonbaseline, j] - 1
+            )
+        row_index = np.concatenate(row_index)
+        X = sparse.coo_matrix(
+            (np.ones(len(row_index)), (row_index, np.concatenate(col_index))),
+            shape=self.main_shape
+        )
+        return X.tocsr()
+
+    def compute_main_fisher_diag(self, weight):
+        # Squaring an indicator leaves it unchanged.
+        weighted_col_sum = self.main_uncentered_Tdot(weight)
+        return weighted_col_sum.copy(), weighted_col_sum
+
+    def toarray(self):
+        X = np.zeros(self.main_shape)
+        for j in range(self.n_factor):
+            is_nonbaseline = (self.codes[:, j] > 0)
+            col_index = self.column_start[j] + self.codes[is_nonbaseline, j] - 1
+            X[is_nonbaseline, col_index] = 1.
+        X -= self.column_offset[np.newaxis, :]
+        X *= self.column_scale[np.newaxis, :]
+        if self.intercept_added:
+            X = np.hstack((np.ones((X.shape[0], 1)), X))
+        return X
@@ -0,0 +1,205 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import scipy.sparse as sparse
+from .abstract_matrix import AbstractDesignMatrix
+
+
+class ChunkedDesignMatrix(AbstractDesignMatrix):
+    """ Design matrix stored on disk as row shards, which are streamed into
+    memory one at a time (with the next one read ahead on a background
+    thread) during each matrix-vector operation.
+    """
+
+    def __init__(self, shard_files, center_predictor=False, add_intercept=True,
+                 scale_predictor=False):
+        """
+        Params:
+        ------
+        shard_files : list of str
+            Paths to the row shards in order, each either a dense numpy array
+            saved as .npy or a scipy sparse matrix saved as .npz (via
+            scipy.sparse.save_npz). All the shards must have the same number
+            of columns.
+        scale_predictor : bool
+            If True, the columns are (lazily) scaled to have unit variance.
+        """
+        super().__init__()
+        if len(shard_files) == 0:
+            raise ValueError("At least one shard is required.")
+        self.shard_files = list(shard_files)
+
+        # Single streaming pass to collect the shard sizes and column moments.
+        n_row = []
+        col_mean, col_variance = None, None
+        nnz = 0
+        for X_shard in self.iterate_shards():
+            shard_mean, shard_variance = \
+                self.compute_column_moments(X_shard)
+            if col_mean is None:
+                n_col = X_shard.shape[1]
+                col_mean, col_variance = shard_mean, shard_variance
+            elif X_shard.shape[1] != n_col:
+                raise ValueError("All the shards must have the same number of columns.")
+            else:
+                col_mean, col_variance = self.combine_column_moments(
+                    sum(n_row), col_mean, col_variance,
+                    X_shard.shape[0], shard_mean, shard_variance
+                )
+            n_row.append(X_shard.shape[0])
+            nnz += X_shard.nnz if sparse.issparse(X_shard) else X_shard.size
+        self.row_start = np.concatenate(([0], np.cumsum(n_row)))
+        self._is_sparse = sparse.issparse(X_shard)
+        self._nnz = nnz
+
+        # Constant columns are excluded on the fly since the shards on disk
+        # cannot be modified.
+        has_zero_variance = self.has_zero_variance(self.row_start[-1], col_variance)
+        self.n_raw_col = n_col
+        if np.any(has_zero_variance):
+            self.warn_intercept_removal()
+            self.column_index = np.flatnonzero(np.logical_not(has_zero_variance))
+        else:
+            self.column_index = None
+        n_main_col = n_col if self.column_index is None else len(self.column_index)
+
+        self.centered = center_predictor
+        if center_predictor:
+            self.column_offset = self.select_columns(col_mean)
+        else:
+            self.column_offset = np.zeros(n_main_col)
+        self.scaled = scale_predictor
+        if scale_predictor:
+            self.column_scale = 1 / np.sqrt(self.select_columns(col_variance))
+        else:
+            self.column_scale = np.ones(n_main_col)
+        self.intercept_added = add_intercept
+
+    @staticmethod
+    def load_shard(filename):
+        if filename.endswith('.npz'):
+            return sparse.load_npz(filename).tocsr()
+        return np.load(filename)
+
+    def iterate_shards(self):
+        """ Yields the shards in order while reading the next one ahead. """
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            next_shard = executor.submit(self.load_shard, self.shard_files[0])
+            for k in range(len(self.shard_files)):
+                X_shard = next_shard.result()
+                if k + 1 < len(self.shard_files):
+                    next_shard = executor.submit(
+                        self.load_shard, self.shard_files[k + 1]
+                    )
+                yield X_shard
+
+    @staticmethod
+    def combine_column_moments(n_a, mean_a, var_a, n_b, mean_b, var_b):
+        n_total = n_a + n_b
+        delta = mean_b - mean_a
+        mean = mean_a + delta * n_b / n_total
+        var = (n_a * var_a + n_b * var_b + delta ** 2 * n_a * n_b / n_total) \
+              / n_total
+        return mean, var
+
+    def select_columns(self, v):
+        return v if self.column_index is None else v[self.column_index]
+
+    def expand_columns(self, v):
+        """ Inverse of 'select_columns', padding the excluded columns by 0. """
+        if self.column_index is None:
+            return v
+        v_expanded = np.zeros((self.n_raw_col, ) + v.shape[1:])
+        v_expanded[self.column_index] = v
+        return v_expanded
+
+    @property
+    def shape(self):
+        return self.row_start[-1], len(self.column_offset) + int(self.intercept_added)
+
+    @property
+    def is_sparse(self):
+        return self._is_sparse
+
+    @property
+    def nnz(self):
+        return self._nnz
+
+    @property
+    def n_shard(self):
+        return len(self.shard_files)
+
+    def main_dot(self, v, out=None):
+        result = np.empty(self.shape[0]) if out is None else out
+        v_expanded = self.expand_columns(v)
+        for k, X_shard in enumerate(self.iterate_shards()):
+            result[self.row_start[k]:self.row_start[k + 1]] = X_shard.dot(v_expanded)
+        result -= np.inner(self.column_offset, v)
+        return result
+
+    def main_Tdot(self, v, out=None):
+        result = self.store_result(
+            self.select_columns(self.main_uncentered_Tdot(v)), out
+        )
+        result -= np.sum(v) * self.column_offset
+        return result
+
+    def main_uncentered_Tdot(self, v):
+        result = np.zeros(self.n_raw_col)
+        for k, X_shard in enumerate(self.iterate_shards()):
+            result += X_shard.T.dot(v[self.row_start[k]:self.row_start[k + 1]])
+        return result
+
+    def main_dot_block(self, V):
+        result = np.empty((self.shape[0], V.shape[1]))
+        V_expanded = self.expand_columns(V)
+        for k, X_shard in enumerate(self.iterate_shards()):
+            result[self.row_start[k]:self.row_start[k + 1]] = X_shard.dot(V_expanded)
+        result -= self.column_offset.dot(V)
+        return result
+
+    def main_Tdot_block(self, U):
+        result = np.zeros((self.n_raw_col, U.shape[1]))
+        for k, X_shard in enumerate(self.iterate_shards()):
+            result += X_shard.T.dot(U[self.row_start[k]:self.row_start[k + 1]])
+        result = self.select_columns(result)
+        result -= np.outer(self.column_offset, np.sum(U, axis=0))
+        return result
+
+    def compute_main_fisher_info(self, weight):
+        fisher_info = np.zeros((self.n_raw_col, self.n_raw_col))
+        weighted_col_sum = np.zeros(self.n_raw_col)
+        for k, X_shard in enumerate(self.iterate_shards()):
+            shard_weight = weight[self.row_start[k]:self.row_start[k + 1]]
+            if self.is_sparse:
+                weighted_X = X_shard.multiply(shard_weight[:, np.newaxis]).tocsc()
+                fisher_info += X_shard.T.dot(weighted_X).toarray()
+            else:
+                weighted_X = shard_weight[:, np.newaxis] * X_shard
+                fisher_info += X_shard.T.dot(weighted_X)
+            weighted_col_sum += np.squeeze(np.asarray(weighted_X.sum(0)))
+        if self.column_index is not None:
+            fisher_info = fisher_info[np.ix_(self.column_index, self.column_index)]
+        return fisher_info, self.select_columns(weighted_col_sum)
+
+    def compute_main_fisher_diag(self, weight):
+        diag = np.zeros(self.n_raw_col)
+        weighted_col_sum = np.zeros(self.n_raw_col)
+        for k, X_shard in enumerate(self.iterate_shards()):
+            shard_weight = weight[self.row_start[k]:self.row_start[k + 1]]
+            X_sq = X_shard.power(2) if self.is_sparse else X_shard ** 2
+            diag += X_sq.T.dot(shard_weight)
+            weighted_col_sum += X_shard.T.dot(shard_weight)
+        return self.select_columns(diag), self.select_columns(weighted_col_sum)
+
+    def toarray(self):
+        X = np.vstack([
+            X_shard.toarray() if self.is_sparse else X_shard
+            for X_shard in self.iterate_shards()
+        ])
+        if self.column_index is not None:
+            X = X[:, self.column_index]
+        X = X - self.column_offset[np.newaxis, :]
+        X *= self.column_scale[np.newaxis, :]
+        if self.intercept_added:
+            X = np.hstack((np.ones((X.shape[0], 1)), X))
+        return X
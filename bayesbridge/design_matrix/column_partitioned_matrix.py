@@ -0,0 +1,140 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import scipy.sparse as sparse
+from .abstract_matrix import AbstractDesignMatrix
+from .sparse_matrix import SparseDesignMatrix
+
+
+class ColumnPartitionedDesignMatrix(SparseDesignMatrix):
+    """ Sparse design matrix split into CSC column blocks of about equal nnz,
+    which are multiplied on separate threads; meant for designs with many
+    more columns than rows.
+
+    Each thread writes its own slice of the output of 'Tdot', so there is no
+    write contention, while the output of 'dot' is reduced from the partial
+    sums of the threads. Scipy's sparse matrix-vector routines release the
+    GIL, so the blocks are processed in parallel.
+    """
+
+    def __init__(self, X, n_thread=None, center_predictor=False,
+                 add_intercept=True, scale_predictor=False, copy_array=False):
+        """
+        Params:
+        ------
+        X : scipy sparse matrix
+        n_thread : int, None
+            Number of threads and column blocks; defaults to the number of
+            CPUs.
+        """
+        super().__init__(
+            X, use_mkl=False, center_predictor=center_predictor,
+            add_intercept=add_intercept, scale_predictor=scale_predictor,
+            copy_array=copy_array
+        )
+        X = self.X_main.tocsc()
+        del self.X_main
+
+        if n_thread is None:
+            n_thread = os.cpu_count() or 1
+        self.main_shape = X.shape
+        self.block_start = self.choose_block_boundary(X, n_thread)
+        self.blocks = [
+            X[:, self.block_slice(b)] for b in range(len(self.block_start) - 1)
+        ]
+        self._squared_blocks = None # Created on the first use.
+        self._executor = ThreadPoolExecutor(max_workers=self.n_block)
+
+    @staticmethod
+    def choose_block_boundary(X_csc, n_block):
+        n_col = X_csc.shape[1]
+        n_block = max(1, min(n_block, n_col))
+        block_start = np.searchsorted(
+            X_csc.indptr, np.linspace(0, X_csc.nnz, n_block + 1), side='left'
+        )
+        block_start[0], block_start[-1] = 0, n_col
+        return np.unique(block_start)
+
+    @property
+    def shape(self):
+        return self.main_shape[0], self.main_shape[1] + int(self.intercept_added)
+
+    @property
+    def nnz(self):
+        return sum(X_block.nnz for X_block in self.blocks)
+
+    @property
+    def n_block(self):
+        return len(self.blocks)
+
+    def block_slice(self, b):
+        return slice(self.block_start[b], self.block_start[b + 1])
+
+    @property
+    def squared_blocks(self):
+        if self._squared_blocks is None:
+            self._squared_blocks = [
+                sparse.csc_matrix(
+                    (np.square(X_block.data), X_block.indices, X_block.indptr),
+                    shape=X_block.shape, copy=False
+                ) for X_block in self.blocks
+            ]
+        return self._squared_blocks
+
+    def to_csr(self):
+        return sparse.hstack(self.blocks).tocsr()
+
+    def main_dot(self, v, out=None):
+        partial_sums = list(self._executor.map(
+            lambda b: self.blocks[b].dot(v[self.block_slice(b)]),
+            range(self.n_block)
+        ))
+        result = self.store_result(partial_sums[0], out)
+        for partial_sum in partial_sums[1:]:
+            result += partial_sum
+        result -= np.inner(self.column_offset, v)
+        return result
+
+    def main_uncentered_Tdot(self, v, squared=False, out=None):
+        result = np.empty(self.main_shape[1]) if out is None else out
+        blocks = self.squared_blocks if squared else self.blocks
+        def compute_block_Tdot(b):
+            result[self.block_slice(b)] = blocks[b].T.dot(v)
+        list(self._executor.map(compute_block_Tdot, range(self.n_block)))
+        return result
+
+    def main_dot_block(self, V):
+        partial_sums = list(self._executor.map(
+            lambda b: self.blocks[b].dot(V[self.block_slice(b)]),
+            range(self.n_block)
+        ))
+        result = sum(partial_sums[1:], partial_sums[0])
+        result -= self.column_offset.dot(V)
+        return result
+
+    def main_Tdot_block(self, U):
+        result = np.empty((self.main_shape[1], U.shape[1]))
+        def compute_block_Tdot(b):
+            result[self.block_slice(b)] = self.blocks[b].T.dot(U)
+        list(self._executor.map(compute_block_Tdot, range(self.n_block)))
+        result -= np.outer(self.column_offset, np.sum(U, axis=0))
+        return result
+
+    def compute_main_fisher_info(self, weight):
+        X = self.to_csr()
+        weighted_X = self.create_diag_matrix(weight).dot(X).tocsc()
+        return X.T.dot(weighted_X).toarray(), self.main_uncentered_Tdot(weight)
+
+    def compute_main_sparse_fisher_info(self, weight):
+        X = self.to_csr()
+        weighted_X = self.create_diag_matrix(weight).dot(X)
+        return X.T.dot(weighted_X).tocsc(), self.main_uncentered_Tdot(weight)
+
+    as_single_precision = AbstractDesignMatrix.as_single_precision
+
+    def toarray(self):
+        X = self.to_csr().toarray() - self.column_offset[np.newaxis, :]
+        X *= self.column_scale[np.newaxis, :]
+        if self.intercept_added:
+            X = np.hstack((np.ones((X.shape[0], 1)), X))
+        return X
@@ -0,0 +1,204 @@
+from warnings import warn
+import numpy as np
+import scipy.sparse as sparse
+from .abstract_matrix import AbstractDesignMatrix
+from .sparse_matrix import SparseDesignMatrix
+try:
+    from .cython_matmal.compact_matmul \
+        import csr_matvec_add, csr_Tmatvec, csr_sq_Tmatvec
+except ImportError:
+    csr_matvec_add, csr_Tmatvec, csr_sq_Tmatvec = None, None, None
+try:
+    from .cython_matmal.sparse_fisher import csr_weighted_gram
+except ImportError:
+    csr_weighted_gram = None
+
+
+class CompactSparseDesignMatrix(SparseDesignMatrix):
+    """ Sparse design matrix stored with narrow data and index types to
+    reduce the memory bandwidth per matrix-vector multiplication.
+
+    The matrix is split into column blocks of at most 2 ** 16 columns so that
+    the column indices within each block fit in uint16. The entries are
+    upcast to float64 on the fly by the compiled kernels.
+    """
+
+    max_block_width = 2 ** 16
+    max_chunk_nnz = 2 ** 22
+        # Number of nonzeros upcast to float64 at a time when the Fisher
+        # information cannot be computed from the compact storage directly.
+
+    def __init__(self, X, data_dtype=np.float32, compact_index=True,
+                 center_predictor=False, add_intercept=True,
+                 scale_predictor=False, copy_array=False):
+        """
+        Params:
+        ------
+        X : scipy sparse matrix
+        data_dtype : numpy dtype, {float64, float32, int8, uint8}
+            Integer types are allowed only if all the entries are exactly
+            representable.
+        compact_index : bool
+            If True, store the column indices as uint16 within column blocks.
+        """
+        super().__init__(
+            X, use_mkl=False, center_predictor=center_predictor,
+            add_intercept=add_intercept, scale_predictor=scale_predictor,
+            copy_array=copy_array
+        )
+        X = self.X_main
+        del self.X_main
+
+        data_dtype = np.dtype(data_dtype)
+        if data_dtype not in map(np.dtype, ['float64', 'float32', 'int8', 'uint8']):
+            raise ValueError("Unsupported data type for the design matrix.")
+        if data_dtype.kind in 'iu' \
+                and np.any(X.data.astype(data_dtype).astype(X.dtype) != X.data):
+            raise ValueError(
+                "The entries of the design matrix cannot be exactly "
+                "represented in {:s}.".format(data_dtype.name)
+            )
+
+        self.use_cython = (csr_matvec_add is not None)
+        if not self.use_cython:
+            warn(
+                "Could not load the compiled kernels for compact storage. Will "
+                "use Scipy's 'dot', which upcasts the entries every time."
+            )
+
+        self.main_shape = X.shape
+        block_width = self.max_block_width if compact_index else X.shape[1]
+        index_dtype = np.uint16 if compact_index else X.indices.dtype
+        self.block_start = np.append(
+            np.arange(0, X.shape[1], max(1, block_width)), X.shape[1]
+        )
+        self.blocks = []
+        for b in range(len(self.block_start) - 1):
+            X_block = X[:, self.block_start[b]:self.block_start[b + 1]]
+            self.blocks.append((
+                X_block.data.astype(data_dtype),
+                X_block.indices.astype(index_dtype),
+                X_block.indptr
+            ))
+
+    @property
+    def shape(self):
+        shape = self.main_shape
+        return shape[0], shape[1] + int(self.intercept_added)
+
+    @property
+    def nnz(self):
+        return sum(len(data) for data, _, _ in self.blocks)
+
+    def block_slice(self, b):
+        return slice(self.block_start[b], self.block_start[b + 1])
+
+    def to_csr_block(self, b, data_dtype=np.float64, row_start=0, row_end=None):
+        data, indices, indptr = self.blocks[b]
+        if row_end is None:
+            row_end = self.main_shape[0]
+        nz_start, nz_end = indptr[row_start], indptr[row_end]
+        block_shape = (
+            row_end - row_start, self.block_start[b + 1] - self.block_start[b]
+        )
+        return sparse.csr_matrix(
+            (data[nz_start:nz_end].astype(data_dtype),
+             indices[nz_start:nz_end].astype(indptr.dtype),
+             indptr[row_start:(row_end + 1)] - nz_start),
+            shape=block_shape
+        )
+
+    def to_csr(self):
+        return sparse.hstack([
+            self.to_csr_block(b) for b in range(len(self.blocks))
+        ]).tocsr()
+
+    def iterate_upcast_row_chunks(self):
+        """ Yields the row ranges and float64 CSR copies of consecutive row
+        chunks with about 'max_chunk_nnz' nonzeros, so that the upcast copy
+        of the whole matrix is never held at once. """
+        n_obs = self.main_shape[0]
+        n_row_per_chunk = max(
+            1, self.max_chunk_nnz * n_obs // max(1, self.nnz)
+        )
+        for row_start in range(0, n_obs, n_row_per_chunk):
+            row_end = min(row_start + n_row_per_chunk, n_obs)
+            X_chunk = sparse.hstack([
+                self.to_csr_block(b, row_start=row_start, row_end=row_end)
+                for b in range(len(self.blocks))
+            ], format='csr')
+            yield slice(row_start, row_end), X_chunk
+
+    def main_dot(self, v, out=None):
+        v = np.ascontiguousarray(v, dtype=np.float64)
+        result = np.zeros(self.main_shape[0]) if out is None else out
+        result[:] = 0.
+        for b in range(len(self.blocks)):
+            v_block = v[self.block_slice(b)]
+            if self.use_cython:
+                csr_matvec_add(*self.blocks[b], v_block, result)
+            else:
+                result += self.to_csr_block(b).dot(v_block)
+        result -= np.inner(self.column_offset, v)
+        return result
+
+    def main_Tdot(self, v, out=None):
+        result = self.main_uncentered_Tdot(v, out=out)
+        result -= np.sum(v) * self.column_offset
+        return result
+
+    def main_uncentered_Tdot(self, v, squared=False, out=None):
+        v = np.ascontiguousarray(v, dtype=np.float64)
+        result = np.zeros(self.main_shape[1]) if out is None else out
+        Tmatvec = csr_sq_Tmatvec if squared else csr_Tmatvec
+        for b in range(len(self.blocks)):
+            if self.use_cython:
+                Tmatvec(*self.blocks[b], v, result[self.block_slice(b)])
+            else:
+                X_block = self.to_csr_block(b)
+                if squared:
+                    X_block = X_block.power(2)
+                result[self.block_slice(b)] = X_block.T.dot(v)
+        return result
+
+    # Upcasting the entries for a sparse-dense matrix product would defeat
+    # the purpose of compact storage, so the vectors are multiplied one by one.
+    main_dot_block = AbstractDesignMatrix.main_dot_block
+    main_Tdot_block = AbstractDesignMatrix.main_Tdot_block
+
+    # The entries are already stored compactly and upcast by the kernels.
+    as_single_precision = AbstractDesignMatrix.as_single_precision
+
+    def compute_main_fisher_info(self, weight):
+        if csr_weighted_gram is not None and len(self.blocks) == 1:
+            # The kernel upcasts the compact entries and indices on the fly.
+            data, indices, indptr = self.blocks[0]
+            return csr_weighted_gram(
+                data, indices, indptr,
+                np.ascontiguousarray(weight, dtype=np.float64), self.main_shape[1]
+            )
+        fisher_info = np.zeros((self.main_shape[1], self.main_shape[1]))
+        for row_slice, X_chunk in self.iterate_upcast_row_chunks():
+            weighted_X = self.create_diag_matrix(weight[row_slice]).dot(X_chunk)
+            fisher_info += X_chunk.T.dot(weighted_X).toarray()
+        return fisher_info, self.main_uncentered_Tdot(weight)
+
+    def compute_main_sparse_fisher_info(self, weight):
+        fisher_info = sparse.csc_matrix((self.main_shape[1], self.main_shape[1]))
+        for row_slice, X_chunk in self.iterate_upcast_row_chunks():
+            weighted_X = self.create_diag_matrix(weight[row_slice]).dot(X_chunk)
+            fisher_info = fisher_info + X_chunk.T.dot(weighted_X).tocsc()
+        return fisher_info, self.main_uncentered_Tdot(weight)
+
+    def compute_main_fisher_diag(self, weight):
+        diag = self.main_uncentered_Tdot(weight, squared=True)
+        weighted_col_sum = self.main_uncentered_Tdot(weight) \
+            if self.centered else None
+        return diag, weighted_col_sum
+
+    def toarray(self):
+        X = self.to_csr().toarray() - self.column_offset[np.newaxis, :]
+        X *= self.column_scale[np.newaxis, :]
+        if self.intercept_added:
+            X = np.hstack((np.ones((X.shape[0], 1)), X))
+        return X
@@ -0,0 +1,153 @@
+import numpy as np
+from .abstract_matrix import AbstractDesignMatrix
+
+
+class CompositeDesignMatrix(AbstractDesignMatrix):
+    """ Column-wise concatenation of design matrices of possibly different
+    types, e.g. a few dense covariates next to a large sparse matrix.
+
+    Each block is multiplied with its own kernels and the concatenation is
+    never formed. The centering and scaling are delegated to the blocks,
+    which must be constructed without intercept.
+    """
+
+    max_cross_workspace_size = 2 ** 22
+        # Number of entries of the (n_obs x width) workspace used for the
+        # cross terms of the Fisher information.
+
+    def __init__(self, blocks, add_intercept=True):
+        """
+        Params:
+        ------
+        blocks : list of AbstractDesignMatrix
+        """
+        super().__init__()
+        if len(blocks) == 0:
+            raise ValueError("At least one block is required.")
+        if any(block.intercept_added for block in blocks):
+            raise ValueError(
+                "The blocks must not have intercept; use the 'add_intercept' "
+                "option of the composite matrix instead."
+            )
+        if len(set(block.shape[0] for block in blocks)) > 1:
+            raise ValueError("All the blocks must have the same number of rows.")
+
+        self.blocks = list(blocks)
+        self.block_start = np.concatenate((
+            [0], np.cumsum([block.shape[1] for block in blocks])
+        ))
+        n_main_col = self.block_start[-1]
+        self.centered = False
+        self.column_offset = np.zeros(n_main_col)
+        self.scaled = False
+        self.column_scale = np.ones(n_main_col)
+        self.intercept_added = add_intercept
+
+    @property
+    def shape(self):
+        return self.blocks[0].shape[0], \
+               self.block_start[-1] + int(self.intercept_added)
+
+    @property
+    def is_sparse(self):
+        return any(block.is_sparse for block in self.blocks)
+
+    @property
+    def nnz(self):
+        return sum(
+            block.nnz if block.is_sparse else block.shape[0] * block.shape[1]
+            for block in self.blocks
+        )
+
+    @property
+    def n_block(self):
+        return len(self.blocks)
+
+    def block_slice(self, b):
+        return slice(self.block_start[b], self.block_start[b + 1])
+
+    def main_dot(self, v, out=None):
+        result = self.blocks[0].dot(v[self.block_slice(0)], out=out)
+        if self.n_block > 1:
+            block_result = np.empty(self.shape[0])
+            for b in range(1, self.n_block):
+                result += self.blocks[b].dot(
+                    v[self.block_slice(b)], out=block_result
+                )
+        return result
+
+    def main_Tdot(self, v, out=None):
+        result = np.empty(self.block_start[-1]) if out is None else out
+        for b in range(self.n_block):
+            self.blocks[b].Tdot(v, out=result[self.block_slice(b)])
+        return result
+
+    def main_dot_block(self, V):
+        result = self.blocks[0].dot_block(V[self.block_slice(0)])
+        for b in range(1, self.n_block):
+            result += self.blocks[b].dot_block(V[self.block_slice(b)])
+        return result
+
+    def main_Tdot_block(self, U):
+        return np.vstack([block.Tdot_block(U) for block in self.blocks])
+
+    def compute_main_fisher_info(self, weight):
+        fisher_info = np.zeros((self.block_start[-1], self.block_start[-1]))
+        for b in range(self.n_block):
+            fisher_info[self.block_slice(b), self.block_slice(b)] \
+                = self.blocks[b].compute_fisher_info(weight)
+            for c in range(b + 1, self.n_block):
+                cross_term = self.compute_cross_fisher_info(b, c, weight)
+                fisher_info[self.block_slice(b), self.block_slice(c)] = cross_term
+                fisher_info[self.block_slice(c), self.block_slice(b)] = cross_term.T
+        return fisher_info, self.main_Tdot(weight)
+
+    def compute_cross_fisher_info(self, b, c, weight):
+        """ Computes X_b' diag(weight) X_c by multiplying the larger block by
+        the weighted columns of the smaller one. The columns are extracted
+        a bounded number at a time so that the workspace stays within
+        'max_cross_workspace_size' entries regardless of the block sizes.
+        """
+        b_is_smaller = self.blocks[b].shape[1] < self.blocks[c].shape[1]
+        X_small, X_large = (self.blocks[b], self.blocks[c]) if b_is_smaller \
+            else (self.blocks[c], self.blocks[b])
+        n_small_col = X_small.shape[1]
+        width = max(1, min(
+            n_small_col, self.max_cross_workspace_size // self.shape[0]
+        ))
+        cross_term = np.empty((X_large.shape[1], n_small_col))
+        for start in range(0, n_small_col, width):
+            end = min(start + width, n_small_col)
+            unit_vecs = np.zeros((n_small_col, end - start))
+            unit_vecs[start:end, :] = np.eye(end - start)
+            weighted_cols = X_small.dot_block(unit_vecs)
+            weighted_cols *= weight[:, np.newaxis]
+            cross_term[:, start:end] = X_large.Tdot_block(weighted_cols)
+        return cross_term.T if b_is_smaller else cross_term
+
+    def compute_main_fisher_diag(self, weight):
+        diag = np.concatenate([
+            block.compute_fisher_info(weight, diag_only=True)
+            for block in self.blocks
+        ])
+        return diag, None
+
+    def unscale_coef(self, coef):
+        coef = coef.copy()
+        n_intercept = int(self.intercept_added)
+        for b, block in enumerate(self.blocks):
+            block_index = slice(
+                n_intercept + self.block_start[b],
+                n_intercept + self.block_start[b + 1]
+            )
+            coef[block_index] = block.unscale_coef(coef[block_index])
+        return coef
+
+    def toarray(self):
+        X = np.hstack([block.toarray() for block in self.blocks])
+        if self.intercept_added:
+            X = np.hstack((np.ones((X.shape[0], 1)), X))
+        return X
+
+    def extract_matrix(self, order=None):
+        return self.toarray()
@@ -4,18 +4,31 @@ import cython
 cimport cython
 from cython.parallel cimport prange
 
-ctypedef np.int32_t INT_t
+# The indices and indptr share the type, which is int64 only if nnz or the
+# number of columns exceeds the range of int32.
+ctypedef fused INDEX_t:
+    np.int32_t
+    np.int64_t
 ctypedef np.float_t FLOAT_t
 FLOAT = np.float64
 
-def binary_matmul(X_csr, v):
-  return c_binary_matmul_parallel(X_csr.indices, X_csr.indptr, v)
+def binary_matmul(np.ndarray[INDEX_t, ndim=1] indices,
+                  np.ndarray[INDEX_t, ndim=1] indptr,
+                  np.ndarray[FLOAT_t, ndim=1] v):
+  """ Multiply a vector by a binary CSR matrix given only by its pattern. """
+  return c_binary_matmul_parallel(indices, indptr, v)
+
+def binary_Tmatmul(np.ndarray[INDEX_t, ndim=1] indices,
+                   np.ndarray[INDEX_t, ndim=1] indptr,
+                   np.ndarray[FLOAT_t, ndim=1] v, Py_ssize_t n_col):
+  """ Multiply a vector by the transpose of a binary CSR matrix. """
+  return c_binary_Tmatmul(indices, indptr, v, n_col)
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cdef c_binary_matmul(np.ndarray[INT_t, ndim=1] indices, np.ndarray[INT_t, ndim=1] indptr, np.ndarray[FLOAT_t, ndim=1] v):
-    cdef int i, k
-    cdef int m = indptr.shape[0] - 1
+cdef c_binary_matmul(np.ndarray[INDEX_t, ndim=1] indices, np.ndarray[INDEX_t, ndim=1] indptr, np.ndarray[FLOAT_t, ndim=1] v):
+    cdef Py_ssize_t i, k
+    cdef Py_ssize_t m = indptr.shape[0] - 1
     cdef FLOAT_t val
     cdef np.ndarray[FLOAT_t, ndim=1] Xv = np.zeros(m, dtype=FLOAT)
     for i in range(m):
@@ -27,12 +40,26 @@ cdef c_binary_matmul(np.ndarray[INT_t, ndim=1] indices, np.ndarray[INT_t, ndim=1
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cdef c_binary_matmul_parallel(np.ndarray[INT_t, ndim=1] indices, np.ndarray[INT_t, ndim=1] indptr, np.ndarray[FLOAT_t, ndim=1] v):
-    cdef int i, k
-    cdef int m = indptr.shape[0] - 1
+cdef c_binary_matmul_parallel(np.ndarray[INDEX_t, ndim=1] indices, np.ndarray[INDEX_t, ndim=1] indptr, np.ndarray[FLOAT_t, ndim=1] v):
+    cdef Py_ssize_t i, k
+    cdef Py_ssize_t m = indptr.shape[0] - 1
     cdef FLOAT_t val
     cdef np.ndarray[FLOAT_t, ndim=1] Xv = np.zeros(m, dtype=FLOAT)
     for i in prange(m, nogil=True):
         for k in range(indptr[i], indptr[i + 1]):
             Xv[i] += v[indices[k]]
     return Xv
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef c_binary_Tmatmul(np.ndarray[INDEX_t, ndim=1] indices, np.ndarray[INDEX_t, ndim=1] indptr, np.ndarray[FLOAT_t, ndim=1] v, Py_ssize_t n_col):
+    # Scatter along the rows; done serially to avoid write contention.
+    cdef Py_ssize_t i, k
+    cdef Py_ssize_t m = indptr.shape[0] - 1
+    cdef FLOAT_t val
+    cdef np.ndarray[FLOAT_t, ndim=1] XTv = np.zeros(n_col, dtype=FLOAT)
+    for i in range(m):
+        val = v[i]
+        for k in range(indptr[i], indptr[i + 1]):
+            XTv[indices[k]] += val
+    return XTv
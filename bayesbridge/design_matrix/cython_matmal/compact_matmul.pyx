@@ -0,0 +1,68 @@
+import numpy as np
+cimport numpy as np
+import cython
+cimport cython
+from cython.parallel cimport prange
+
+# Storage types of the CSR arrays; the products are always accumulated in
+# double precision by upcasting the entries on the fly.
+ctypedef fused DATA_t:
+    np.float64_t
+    np.float32_t
+    np.int8_t
+    np.uint8_t
+
+ctypedef fused INDEX_t:
+    np.uint16_t
+    np.int32_t
+    np.int64_t
+
+ctypedef fused INDPTR_t:
+    np.int32_t
+    np.int64_t
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def csr_matvec_add(const DATA_t[:] data, const INDEX_t[:] indices, const INDPTR_t[:] indptr,
+                   const double[:] v, double[:] out):
+    """ Adds A.dot(v) to 'out' in place. """
+    cdef Py_ssize_t i, k
+    cdef Py_ssize_t m = indptr.shape[0] - 1
+    cdef double val
+    for i in prange(m, nogil=True):
+        val = 0
+        for k in range(indptr[i], indptr[i + 1]):
+            val = val + <double> data[k] * v[indices[k]]
+        out[i] += val
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def csr_Tmatvec(const DATA_t[:] data, const INDEX_t[:] indices, const INDPTR_t[:] indptr,
+                const double[:] v, double[:] out):
+    """ Stores A.T.dot(v) in 'out'. Done serially to avoid write contention. """
+    cdef Py_ssize_t i, k
+    cdef Py_ssize_t m = indptr.shape[0] - 1
+    cdef double val
+    out[:] = 0
+    for i in range(m):
+        val = v[i]
+        for k in range(indptr[i], indptr[i + 1]):
+            out[indices[k]] += <double> data[k] * val
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def csr_sq_Tmatvec(const DATA_t[:] data, const INDEX_t[:] indices, const INDPTR_t[:] indptr,
+                   const double[:] v, double[:] out):
+    """ Stores (A ** 2).T.dot(v) in 'out' without forming A ** 2. """
+    cdef Py_ssize_t i, k
+    cdef Py_ssize_t m = indptr.shape[0] - 1
+    cdef double val, entry
+    out[:] = 0
+    for i in range(m):
+        val = v[i]
+        for k in range(indptr[i], indptr[i + 1]):
+            entry = <double> data[k]
+            out[indices[k]] += entry * entry * val
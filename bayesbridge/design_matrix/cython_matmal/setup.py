@@ -15,6 +15,14 @@ ext_modules = [
         ["binary_matmul.pyx"],
 #        extra_compile_args=['-Xpreprocessor -fopenmp -lomp'],
 #        extra_link_args=['-Xpreprocessor -fopenmp -lomp'],
+    ),
+    Extension(
+        "compact_matmul",
+        ["compact_matmul.pyx"],
+    ),
+    Extension(
+        "sparse_fisher",
+        ["sparse_fisher.pyx"],
     )
 ]
 
@@ -0,0 +1,86 @@
+import os
+import numpy as np
+cimport numpy as np
+import cython
+cimport cython
+from cython.parallel cimport prange
+
+ctypedef fused DATA_t:
+    np.float64_t
+    np.float32_t
+    np.int8_t
+    np.uint8_t
+
+ctypedef fused COL_INDEX_t:
+    np.uint16_t
+    np.int32_t
+    np.int64_t
+
+ctypedef fused INDEX_t:
+    np.int32_t
+    np.int64_t
+
+def csr_weighted_gram(const DATA_t[:] data, const COL_INDEX_t[:] indices,
+                      const INDEX_t[:] indptr, const double[:] weight,
+                      Py_ssize_t n_col, int n_thread=0):
+    """
+    Computes X' diag(weight) X for a CSR matrix X as a dense array, together
+    with the weighted column sum X' weight. The entries are upcast to float64
+    on the fly, so the narrow data and index types of the compact storage can
+    be passed as is.
+
+    Each thread owns a disjoint range of the rows of the upper triangle,
+    balanced by the column nnz, and accumulates them directly into the
+    shared output; hence no per-thread copies of the p x p output are needed
+    and all the threads can be used regardless of p.
+    """
+    if n_thread <= 0:
+        n_thread = os.cpu_count() or 1
+    n_thread = max(1, min(n_thread, n_col))
+    col_nnz_cumsum = np.concatenate((
+        [0], np.cumsum(np.bincount(np.asarray(indices), minlength=n_col))
+    ))
+    col_bound = np.searchsorted(
+        col_nnz_cumsum, np.linspace(0, col_nnz_cumsum[-1], n_thread + 1),
+        side='left'
+    ).astype(np.intp)
+    col_bound[0], col_bound[-1] = 0, n_col
+    gram = np.zeros((n_col, n_col))
+    col_sum = np.zeros(n_col)
+    cdef double[:, ::1] gram_view = gram
+    cdef double[::1] col_sum_view = col_sum
+    cdef Py_ssize_t[::1] col_bound_view = col_bound
+    _accumulate_weighted_gram(
+        data, indices, indptr, weight, gram_view, col_sum_view,
+        col_bound_view, n_thread
+    )
+    gram += np.triu(gram, 1).T
+    return gram, col_sum
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _accumulate_weighted_gram(
+        const DATA_t[:] data, const COL_INDEX_t[:] indices, const INDEX_t[:] indptr,
+        const double[:] weight, double[:, ::1] gram, double[::1] col_sum,
+        const Py_ssize_t[::1] col_bound, int n_thread):
+    cdef Py_ssize_t t, i, k1, k2, j1, j2, col_lo, col_hi
+    cdef Py_ssize_t m = indptr.shape[0] - 1
+    cdef double weighted_entry
+    for t in prange(n_thread, nogil=True, num_threads=n_thread,
+                    schedule='static', chunksize=1):
+        col_lo = col_bound[t]
+        col_hi = col_bound[t + 1]
+        for i in range(m):
+            for k1 in range(indptr[i], indptr[i + 1]):
+                j1 = indices[k1]
+                if j1 < col_lo or j1 >= col_hi:
+                    continue
+                weighted_entry = weight[i] * <double> data[k1]
+                col_sum[j1] += weighted_entry
+                # Pairing with every entry of the row, including k1 itself,
+                # also handles the duplicate entries of a non-canonical CSR.
+                for k2 in range(indptr[i], indptr[i + 1]):
+                    j2 = indices[k2]
+                    if j2 >= j1:
+                        gram[j1, j2] += weighted_entry * <double> data[k2]
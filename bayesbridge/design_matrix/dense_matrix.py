@@ -1,61 +1,162 @@
+import copy
 import numpy as np
+import scipy.linalg
 from .abstract_matrix import AbstractDesignMatrix
 
 
 class DenseDesignMatrix(AbstractDesignMatrix):
-    
+
+    max_chunk_size = 2 ** 22
+        # Number of entries in each chunk of rows for out-of-core X.
+
     def __init__(self, X, center_predictor=False, add_intercept=True,
-                 copy_array=False):
+                 scale_predictor=False, copy_array=False):
         """
         Params:
         ------
         X : numpy array
+            Can be a (read-only) numpy.memmap, as the centering and intercept
+            are applied lazily without modifying or copying X. The Fisher
+            information of a memmap is computed over chunks of rows, so that
+            no workspace of the size of X is kept in memory.
+        scale_predictor : bool
+            If True, the columns are (lazily) scaled to have unit variance.
         """
         if copy_array:
             X = X.copy()
         super().__init__()
-        X = self.remove_intercept_indicator(X)
+        col_mean, col_variance = self.compute_column_moments(X)
+        is_nonconstant = np.logical_not(
+            self.has_zero_variance(X.shape[0], col_variance)
+        )
+        X = self.remove_intercept_indicator(X, col_variance)
+        self.centered = center_predictor
         if center_predictor:
-            X -= np.mean(X, axis=0)[np.newaxis, :]
-        if add_intercept:
-            X = np.hstack((np.ones((X.shape[0], 1)), X))
-        self.X = X
+            self.column_offset = col_mean[is_nonconstant]
+        else:
+            self.column_offset = np.zeros(X.shape[1])
+        self.scaled = scale_predictor
+        if scale_predictor:
+            self.column_scale = 1 / np.sqrt(col_variance[is_nonconstant])
+        else:
+            self.column_scale = np.ones(X.shape[1])
+        self.X_main = X
         self.intercept_added = add_intercept
-        self.centered = center_predictor
+        self.is_out_of_core = isinstance(X, np.memmap)
+        self._fisher_workspace = None # Allocated on the first use.
+        self._X_main_squared = None
+
+    @classmethod
+    def from_npy(cls, filename, **kwargs):
+        """ Constructs the design matrix from a memory-mapped .npy file. """
+        X = np.load(filename, mmap_mode='r')
+        return cls(X, **kwargs)
+
+    def as_single_precision(self):
+        if self._single_precision_copy is None:
+            design = copy.copy(self)
+            design.X_main = self.X_main.astype(np.float32)
+            design.column_offset = self.column_offset.astype(np.float32)
+            design.column_scale = self.column_scale.astype(np.float32)
+            design._fisher_workspace = None
+            design._X_main_squared = None
+            design.matvec_cache = None
+            design._single_precision_copy = design
+            self._single_precision_copy = design
+        return self._single_precision_copy
 
     @property
     def shape(self):
-        return self.X.shape
+        shape = self.X_main.shape
+        return shape[0], shape[1] + int(self.intercept_added)
 
     @property
     def is_sparse(self):
         return False
 
-    def dot(self, v):
+    def main_dot(self, v, out=None):
+        """ Multiply by the main effect part of the design matrix. """
+        result = np.dot(self.X_main, v, out=out)
+        result -= np.inner(self.column_offset, v)
+        return result
 
-        if self.memoized and np.all(self.v_prev == v):
-            return self.X_dot_v
+    def main_Tdot(self, v, out=None):
+        result = np.dot(self.X_main.T, v, out=out)
+        result -= np.sum(v) * self.column_offset
+        return result
 
-        result = self.X.dot(v)
-        if self.memoized:
-            self.X_dot_v = result
-            self.v_prev = v
-        self.dot_count += 1
+    def main_dot_block(self, V):
+        result = self.X_main.dot(V)
+        result -= self.column_offset.dot(V)
+        return result
 
+    def main_Tdot_block(self, U):
+        result = self.X_main.T.dot(U)
+        result -= np.outer(self.column_offset, np.sum(U, axis=0))
         return result
 
-    def Tdot(self, v):
-        self.Tdot_count += 1
-        return self.X.T.dot(v)
+    def iterate_row_chunks(self):
+        """ Yields slices of rows whose chunk of X has at most about
+        'max_chunk_size' entries. """
+        n_obs, n_pred = self.X_main.shape
+        n_row_per_chunk = max(1, self.max_chunk_size // max(1, n_pred))
+        for start in range(0, n_obs, n_row_per_chunk):
+            yield slice(start, min(start + n_row_per_chunk, n_obs))
+
+    def compute_main_fisher_info(self, weight):
+        X = self.X_main
+        if self.is_out_of_core:
+            fisher_info = np.zeros((X.shape[1], X.shape[1]))
+            for rows in self.iterate_row_chunks():
+                X_chunk = np.array(X[rows], dtype=np.float64)
+                    # Copied since the chunks of a memmap are read-only.
+                fisher_info += self.compute_weighted_gram(
+                    X_chunk, weight[rows], workspace=X_chunk
+                )
+            return fisher_info, X.T.dot(weight)
 
-    def compute_fisher_info(self, weight, diag_only=False):
-        if diag_only:
-            return np.sum(weight[:, np.newaxis] * self.X ** 2, 0)
+        # Reuse the workspace for W^{1/2} X across the calls.
+        if self._fisher_workspace is None and not np.any(weight < 0):
+            self._fisher_workspace = np.empty(X.shape)
+        fisher_info = self.compute_weighted_gram(
+            X, weight, workspace=self._fisher_workspace
+        )
+        return fisher_info, X.T.dot(weight)
+
+    @staticmethod
+    def compute_weighted_gram(X, weight, workspace):
+        if np.any(weight < 0):
+            return X.T.dot(weight[:, np.newaxis] * X)
+
+        # Compute (W^{1/2} X)' (W^{1/2} X) via the symmetric rank-k update.
+        sqrt_weighted_X = workspace
+        np.multiply(np.sqrt(weight)[:, np.newaxis], X, out=sqrt_weighted_X)
+        gram = scipy.linalg.blas.dsyrk(1., sqrt_weighted_X.T, lower=0)
+            # The transpose of a C-contiguous array is passed to BLAS as is.
+        gram += np.triu(gram, 1).T
+        return gram
+
+    def compute_main_fisher_diag(self, weight):
+        if self.is_out_of_core:
+            # The squares are not cached so as not to hold a copy of X.
+            diag = np.zeros(self.X_main.shape[1])
+            for rows in self.iterate_row_chunks():
+                X_chunk = np.array(self.X_main[rows], dtype=np.float64)
+                np.square(X_chunk, out=X_chunk)
+                diag += X_chunk.T.dot(weight[rows])
         else:
-            return self.X.T.dot(weight[:, np.newaxis] * self.X)
+            if self._X_main_squared is None:
+                self._X_main_squared = self.X_main ** 2
+            diag = self._X_main_squared.T.dot(weight)
+        weighted_col_sum = self.X_main.T.dot(weight) if self.centered else None
+        return diag, weighted_col_sum
 
     def toarray(self):
-        return self.X
+        X = self.X_main - self.column_offset[np.newaxis, :]
+        X *= self.column_scale[np.newaxis, :]
+        if self.intercept_added:
+            X = np.hstack((np.ones((X.shape[0], 1)), X))
+        return X
 
     def extract_matrix(self, order=None):
-        return self.X
+        return self.toarray()
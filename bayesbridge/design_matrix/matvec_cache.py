@@ -0,0 +1,64 @@
+from collections import OrderedDict, namedtuple
+import numpy as np
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class MatvecCache():
+    """ Least-recently-used cache of matrix-vector products.
+
+    The entries are looked up by a fingerprint made of a few evenly spaced
+    elements of the input vector, and a hit is confirmed by comparing the
+    whole vector. Both the inputs and outputs are stored as copies and a copy
+    is returned on hit, so the callers are free to modify them in place.
+    """
+
+    def __init__(self, maxsize=4, n_probe=8):
+        if maxsize < 1:
+            raise ValueError("The cache size must be a positive integer.")
+        self.maxsize = maxsize
+        self.n_probe = n_probe
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._probe_index = {} # Keyed on the vector length.
+
+    def fingerprint(self, v):
+        n = len(v)
+        if n not in self._probe_index:
+            self._probe_index[n] = np.unique(
+                np.linspace(0, n - 1, min(n, self.n_probe)).astype(np.intp)
+            )
+        return n, v[self._probe_index[n]].tobytes()
+
+    def get(self, op, v):
+        """ Returns the cached result of the operation 'op' (e.g. 'dot' or
+        'Tdot') on 'v', or None if not found. """
+        v = np.asarray(v)
+        key = (op, self.fingerprint(v))
+        entry = self._entries.get(key)
+        if entry is not None and np.array_equal(entry[0], v):
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1].copy()
+        self.misses += 1
+        return None
+
+    def put(self, op, v, result):
+        v = np.asarray(v)
+        key = (op, self.fingerprint(v))
+        self._entries[key] = (v.copy(), result.copy())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        return CacheInfo(
+            self.hits, self.misses, self.maxsize, len(self._entries)
+        )
@@ -1,3 +1,9 @@
+""" Wrappers of MKL's sparse matrix-vector routines through the LP64
+interface, which takes 32-bit indices only; the CSR matrices with int64
+indices are rejected with TypeError rather than silently truncated. ILP64
+MKL is not supported.
+"""
+
 import platform
 import numpy as np
 import scipy as sp
@@ -14,17 +20,22 @@ except:
     raise ImportError("Could not load Intel MKL Library.")
 
 
-def mkl_csr_matvec(A, x, transpose=False):
+def mkl_csr_matvec(A, x, transpose=False, out=None):
     """
     Parameters
     ----------
     A : scipy.sparse csr matrix
     x : numpy 1d array
+    out : None, C-contiguous numpy 1d array of float64
+        If given, the result is stored in this array.
     """
 
     if not sp.sparse.isspmatrix_csr(A):
         raise TypeError("The matrix must be a scipy sparse CSR matrix.")
 
+    if A.indices.dtype != np.int32 or A.indptr.dtype != np.int32:
+        raise TypeError("Only 32-bit indices are supported.")
+
     if x.ndim != 1:
         raise TypeError("The vector to be multiplied must be a 1d array.")
 
@@ -32,7 +43,7 @@ def mkl_csr_matvec(A, x, transpose=False):
         x = x.astype(np.double, copy=True)
 
     # Allocate the result of the matrix-vector multiplication.
-    result = np.empty(A.shape[transpose])
+    result = np.empty(A.shape[transpose]) if out is None else out
 
     # Set the parameters for simply computing A.dot(x) for a general matrix A.
     alpha = byref(c_double(1.0))
@@ -54,3 +65,47 @@ def mkl_csr_matvec(A, x, transpose=False):
         data_ptr, indices_ptr, indptr_begin, indptr_end, x_ptr, beta, result_ptr
     )
     return result
+
+
+def mkl_csr_matmat(A, B, transpose=False):
+    """
+    Parameters
+    ----------
+    A : scipy.sparse csr matrix
+    B : numpy 2d array
+    """
+
+    if not sp.sparse.isspmatrix_csr(A):
+        raise TypeError("The matrix must be a scipy sparse CSR matrix.")
+
+    if A.indices.dtype != np.int32 or A.indptr.dtype != np.int32:
+        raise TypeError("Only 32-bit indices are supported.")
+
+    if B.ndim != 2:
+        raise TypeError("The matrix to be multiplied must be a 2d array.")
+
+    # With the zero-based indexing, MKL assumes the row-major layout.
+    B = np.ascontiguousarray(B, dtype=np.double)
+    n_vec = B.shape[1]
+    result = np.empty((A.shape[transpose], n_vec))
+
+    alpha = byref(c_double(1.0))
+    beta = byref(c_double(0.0))
+    matrix_description = c_char_p(bytes('G  C  ', 'utf-8'))
+
+    data_ptr = A.data.ctypes.data_as(POINTER(c_double))
+    indices_ptr = A.indices.ctypes.data_as(POINTER(c_int))
+    indptr_begin = A.indptr[:-1].ctypes.data_as(POINTER(c_int))
+    indptr_end = A.indptr[1:].ctypes.data_as(POINTER(c_int))
+    B_ptr = B.ctypes.data_as(POINTER(c_double))
+    result_ptr = result.ctypes.data_as(POINTER(c_double))
+
+    transpose_flag = byref(c_char(bytes(['n', 't'][transpose], 'utf-8')))
+    n_row, n_col = [byref(c_int(size)) for size in A.shape]
+    leading_dim = byref(c_int(n_vec))
+    mkl.mkl_dcsrmm(
+        transpose_flag, n_row, byref(c_int(n_vec)), n_col, alpha,
+        matrix_description, data_ptr, indices_ptr, indptr_begin, indptr_end,
+        B_ptr, leading_dim, beta, result_ptr, leading_dim
+    )
+    return result
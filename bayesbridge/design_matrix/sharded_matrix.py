@@ -0,0 +1,335 @@
+import multiprocessing
+import os
+import weakref
+import numpy as np
+import scipy.sparse as sparse
+from .abstract_matrix import AbstractDesignMatrix
+
+
+class ShardedDesignMatrix(AbstractDesignMatrix):
+    """ Design matrix split into row shards, each owned by a worker process
+    that computes its part of the matrix-vector and Fisher information
+    computations; the partial results are reduced by the calling process.
+
+    For the logistic model, the workers also hold the outcomes of their
+    shards (see 'set_logit_outcome') so that the log-likelihood terms and
+    the Polya-Gamma draws are computed per shard as well.
+
+    The input and output vectors are exchanged through shared memory, so
+    only the short commands and the (p x p) Fisher information pass through
+    the pipes. The workers are shut down by 'close' or when the object is
+    garbage collected.
+    """
+
+    def __init__(self, X, n_worker=None, center_predictor=False,
+                 add_intercept=True, scale_predictor=False, start_method=None):
+        """
+        Params:
+        ------
+        X : numpy array or scipy sparse matrix
+            Only the shards are retained by the workers; the caller can
+            release X afterward.
+        n_worker : int, None
+            Defaults to the number of CPUs.
+        start_method : str, None
+            Passed to 'multiprocessing.get_context'.
+        """
+        super().__init__()
+        if n_worker is None:
+            n_worker = os.cpu_count() or 1
+        self._is_sparse = sparse.issparse(X)
+        if self._is_sparse:
+            X = X.tocsr()
+        col_mean, col_variance = self.compute_column_moments(X)
+        is_nonconstant = np.logical_not(
+            self.has_zero_variance(X.shape[0], col_variance)
+        )
+        X = self.remove_intercept_indicator(X, col_variance)
+        self._nnz = X.nnz if self._is_sparse else X.size
+
+        self.centered = center_predictor
+        if center_predictor:
+            self.column_offset = col_mean[is_nonconstant]
+        else:
+            self.column_offset = np.zeros(X.shape[1])
+        self.scaled = scale_predictor
+        if scale_predictor:
+            self.column_scale = 1 / np.sqrt(col_variance[is_nonconstant])
+        else:
+            self.column_scale = np.ones(X.shape[1])
+        self.intercept_added = add_intercept
+
+        self.main_shape = X.shape
+        self.row_start = self.choose_shard_boundary(X, n_worker)
+        n_row, n_col = X.shape
+        n_worker = len(self.row_start) - 1
+
+        context = multiprocessing.get_context(start_method)
+        raw_buffers = (
+            context.RawArray('d', n_col), # Input to 'dot'
+            context.RawArray('d', n_row), # Input to 'Tdot' and weights
+            context.RawArray('d', n_row), # Output of 'dot'
+            context.RawArray('d', n_worker * n_col) # Outputs of 'Tdot'
+        )
+        self._col_input, self._row_input, self._row_output, self._col_output = (
+            np.frombuffer(buffer, dtype=np.float64) for buffer in raw_buffers
+        )
+        self._col_output = self._col_output.reshape((n_worker, n_col))
+
+        self._conns = []
+        self._workers = []
+        for k in range(n_worker):
+            row_slice = slice(self.row_start[k], self.row_start[k + 1])
+            conn, worker_conn = context.Pipe()
+            worker = context.Process(
+                target=_serve_shard,
+                args=(worker_conn, X[row_slice], k, row_slice, raw_buffers, n_col),
+                daemon=True
+            )
+            worker.start()
+            worker_conn.close()
+            self._conns.append(conn)
+            self._workers.append(worker)
+        self._finalizer = weakref.finalize(
+            self, _shut_down_workers, self._conns, self._workers
+        )
+
+    @staticmethod
+    def choose_shard_boundary(X, n_worker):
+        """ Splits the rows so that the shards have about the same number of
+        non-zeros (or rows if X is dense). """
+        n_row = X.shape[0]
+        n_worker = max(1, min(n_worker, n_row))
+        if sparse.issparse(X):
+            row_start = np.searchsorted(
+                X.indptr, np.linspace(0, X.nnz, n_worker + 1), side='left'
+            )
+        else:
+            row_start = np.linspace(0, n_row, n_worker + 1).astype(np.intp)
+        row_start[0], row_start[-1] = 0, n_row
+        return np.unique(row_start)
+
+    @property
+    def shape(self):
+        return self.main_shape[0], self.main_shape[1] + int(self.intercept_added)
+
+    @property
+    def is_sparse(self):
+        return self._is_sparse
+
+    @property
+    def nnz(self):
+        return self._nnz
+
+    @property
+    def n_worker(self):
+        return len(self._workers)
+
+    def close(self):
+        """ Shuts down the worker processes. """
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def broadcast(self, command):
+        """ Runs the command on all the shards and returns their replies. """
+        return self.scatter([command] * self.n_worker)
+
+    def scatter(self, commands):
+        """ Runs the k-th command on the k-th shard and returns the replies. """
+        if not self._finalizer.alive:
+            raise RuntimeError("The worker processes have been shut down.")
+        for conn, command in zip(self._conns, commands):
+            conn.send(command)
+        replies = [conn.recv() for conn in self._conns]
+        for reply in replies:
+            if isinstance(reply, Exception):
+                raise reply
+        return replies
+
+    def row_slice(self, k):
+        return slice(self.row_start[k], self.row_start[k + 1])
+
+    def set_logit_outcome(self, n_success, n_trial):
+        """ Hands each worker the binomial outcomes of its shard. """
+        self.scatter([
+            ('set_logit_outcome', n_success[self.row_slice(k)], n_trial[self.row_slice(k)])
+            for k in range(self.n_worker)
+        ])
+
+    def compute_logit_loglik(self, beta, resid_out=None):
+        """ Computes the logistic log-likelihood as the sum of those of the
+        shards and, if 'resid_out' is given, stores the residual
+        n_success - n_trial * predicted_prob in it. """
+        shift = self.set_linear_predictor_input(beta)
+        partial_loglik = self.broadcast(
+            ('logit_loglik', shift, resid_out is not None)
+        )
+        self.dot_count += 1
+        if resid_out is not None:
+            resid_out[:] = self._row_input
+        return sum(partial_loglik)
+
+    def sample_polya_gamma(self, beta, np_random):
+        """ Samples the Polya-Gamma variables with the shape n_trial and the
+        tilt X beta, each worker drawing those of its shard with a seed
+        generated by 'np_random'.
+
+        The draws are reproducible for a given seed of 'np_random' and a
+        given 'n_worker', but change with the number of workers, since it
+        determines the shards and the number of seeds drawn; the Markov
+        chains hence differ from the unsharded ones, though all of them
+        target the same posterior.
+        """
+        shift = self.set_linear_predictor_input(beta)
+        seeds = np_random.randint(
+            1, 1 + np.iinfo(np.int32).max, size=self.n_worker
+        )
+        self.scatter([('polya_gamma', shift, seed) for seed in seeds])
+        self.dot_count += 1
+        return self._row_output.copy()
+
+    def set_linear_predictor_input(self, v):
+        """ Stores the input for the workers to compute X v as the product
+        with their shards plus the returned constant shift, which accounts
+        for the centering, scaling, and intercept. """
+        main_v = v[int(self.intercept_added):]
+        if self.scaled:
+            main_v = self.column_scale * main_v
+        self._col_input[:] = main_v
+        shift = - np.inner(self.column_offset, main_v)
+        if self.intercept_added:
+            shift += v[0]
+        return shift
+
+    def main_dot(self, v, out=None):
+        self._col_input[:] = v
+        self.broadcast('dot')
+        # Copied to be detached from the shared buffer.
+        result = self._row_output.copy() if out is None \
+            else self.store_result(self._row_output, out)
+        result -= np.inner(self.column_offset, v)
+        return result
+
+    def main_Tdot(self, v, out=None):
+        result = self.main_uncentered_Tdot(v, out=out)
+        result -= np.sum(v) * self.column_offset
+        return result
+
+    def main_uncentered_Tdot(self, v, squared=False, out=None):
+        self._row_input[:] = v
+        self.broadcast('Tdot_squared' if squared else 'Tdot')
+        return np.sum(self._col_output, axis=0, out=out)
+
+    def compute_main_fisher_info(self, weight):
+        self._row_input[:] = weight
+        fisher_info = sum(self.broadcast('fisher_info'))
+        return fisher_info, np.sum(self._col_output, axis=0)
+
+    def compute_main_fisher_diag(self, weight):
+        diag = self.main_uncentered_Tdot(weight, squared=True)
+        weighted_col_sum = self.main_uncentered_Tdot(weight) \
+            if self.centered else None
+        return diag, weighted_col_sum
+
+    def toarray(self):
+        X = np.vstack(self.broadcast('toarray'))
+        X = X - self.column_offset[np.newaxis, :]
+        X *= self.column_scale[np.newaxis, :]
+        if self.intercept_added:
+            X = np.hstack((np.ones((X.shape[0], 1)), X))
+        return X
+
+    def extract_matrix(self, order=None):
+        return self.toarray()
+
+
+def _serve_shard(conn, X_shard, k, row_slice, raw_buffers, n_col):
+    """ Loop run by each worker process on its row shard. """
+    col_input, row_input, row_output, col_output = (
+        np.frombuffer(buffer, dtype=np.float64) for buffer in raw_buffers
+    )
+    col_output = col_output.reshape((-1, n_col))[k]
+    is_sparse = sparse.issparse(X_shard)
+    X_shard_squared = None
+    n_success, n_trial = None, None
+    polya_gamma_dist = None
+
+    while True:
+        try:
+            command = conn.recv()
+        except EOFError:
+            break
+        if command == 'close':
+            break
+        args = ()
+        if isinstance(command, tuple):
+            command, *args = command
+        try:
+            reply = None
+            shard_input = row_input[row_slice]
+            if command == 'set_logit_outcome':
+                n_success, n_trial = args
+            elif command == 'logit_loglik':
+                from ..model.logistic_model import LogisticModel
+                    # Imported here as the model module depends on this one.
+                shift, compute_resid = args
+                logit_prob = row_output[row_slice]
+                logit_prob[:] = X_shard.dot(col_input)
+                logit_prob += shift
+                reply = LogisticModel.compute_loglik_from_logit(
+                    logit_prob, n_success, n_trial,
+                    resid_out=shard_input if compute_resid else None
+                )
+            elif command == 'polya_gamma':
+                if polya_gamma_dist is None:
+                    from ..random.polya_gamma import PolyaGammaDist
+                    polya_gamma_dist = PolyaGammaDist()
+                shift, seed = args
+                polya_gamma_dist.set_seed(int(seed))
+                logit_prob = X_shard.dot(col_input)
+                logit_prob += shift
+                row_output[row_slice] = polya_gamma_dist.rand_polyagamma(
+                    n_trial.astype(np.intc), logit_prob
+                )
+            elif command == 'dot':
+                row_output[row_slice] = X_shard.dot(col_input)
+            elif command == 'Tdot':
+                col_output[:] = X_shard.T.dot(shard_input)
+            elif command == 'Tdot_squared':
+                if X_shard_squared is None:
+                    X_shard_squared = X_shard.power(2) if is_sparse \
+                        else X_shard ** 2
+                col_output[:] = X_shard_squared.T.dot(shard_input)
+            elif command == 'fisher_info':
+                if is_sparse:
+                    weighted_X = X_shard.multiply(shard_input[:, np.newaxis]).tocsc()
+                    reply = X_shard.T.dot(weighted_X).toarray()
+                    col_output[:] = np.squeeze(np.asarray(weighted_X.sum(0)))
+                else:
+                    reply = X_shard.T.dot(shard_input[:, np.newaxis] * X_shard)
+                    col_output[:] = X_shard.T.dot(shard_input)
+            elif command == 'toarray':
+                reply = X_shard.toarray() if is_sparse else np.asarray(X_shard)
+            else:
+                raise ValueError("Unknown command: {}".format(command))
+        except Exception as e:
+            reply = e
+        conn.send(reply)
+    conn.close()
+
+
+def _shut_down_workers(conns, workers):
+    for conn in conns:
+        try:
+            conn.send('close')
+        except (BrokenPipeError, OSError):
+            pass
+    for worker in workers:
+        worker.join(timeout=5)
+        if worker.is_alive():
+            worker.terminate()
@@ -1,21 +1,65 @@
+import copy
 from warnings import warn
 import numpy as np
 import scipy.sparse as sparse
+from scipy.sparse.csgraph import reverse_cuthill_mckee
 from .abstract_matrix import AbstractDesignMatrix
 try:
-    from .mkl_matvec import mkl_csr_matvec
+    from .mkl_matvec import mkl_csr_matvec, mkl_csr_matmat
 except:
-    mkl_csr_matvec = None
+    mkl_csr_matvec, mkl_csr_matmat = None, None
+try:
+    from .cython_matmal.sparse_fisher import csr_weighted_gram
+except ImportError:
+    csr_weighted_gram = None
+try:
+    from .cython_matmal.compact_matmul import csr_matvec_add, csr_Tmatvec
+except ImportError:
+    csr_matvec_add, csr_Tmatvec = None, None
 
 
 class SparseDesignMatrix(AbstractDesignMatrix):
+    """ Design matrix backed by a scipy CSR matrix.
+
+    Matrices with 2 ** 31 or more nonzeros (or columns) require 64-bit
+    indices. These are supported by the compiled kernels and by Scipy, but
+    not by the MKL matrix-vector routines, which are linked against the
+    LP64 interface with 32-bit indices. Such matrices hence never use MKL,
+    even if 'use_mkl=True'.
+    """
+
+    max_int32_index = np.iinfo(np.int32).max
+    row_perm = None
+    col_perm = None
+    has_sparse_fisher_info = True
 
     def __init__(self, X, use_mkl=True, center_predictor=False, add_intercept=True,
-                 copy_array=False, dot_format='csr', Tdot_format='csr'):
+                 scale_predictor=False, copy_array=False, dot_format='csr',
+                 Tdot_format='csr', reorder=None, column_moments=None):
         """
         Params:
         ------
         X : scipy sparse matrix
+        use_mkl : bool
+            If True, the matrix-vector products are computed by MKL's
+            'mkl_dcsrmv' when the library can be loaded. MKL is only used
+            with 32-bit indices; if X has int64 indices, a warning is issued
+            and the compiled kernels (or Scipy) are used instead.
+        scale_predictor : bool
+            If True, the columns are scaled to have unit variance. As with
+            the centering, the scaling is applied lazily within the matrix
+            operations and X itself is left untouched.
+        reorder : {None, 'rcm', 'nnz'}
+            If specified, the rows and columns of X are stored in a permuted
+            order for better memory locality of the matrix operations:
+            'rcm' applies the reverse Cuthill-McKee ordering to the bipartite
+            graph of X, concentrating the non-zeros near the diagonal, and
+            'nnz' sorts the columns in the decreasing number of non-zeros.
+            The permutation is internal; all the inputs and outputs of the
+            matrix operations remain in the original order.
+        column_moments : None, tuple of numpy arrays
+            Column means and variances of X if already known, e.g. from
+            DesignMatrixBuilder, in which case they are not recomputed.
         """
         if copy_array:
             X = X.copy()
@@ -25,21 +69,142 @@ class SparseDesignMatrix(AbstractDesignMatrix):
                 "Current dot operations are only implemented for the CSR format."
             )
         X = X.tocsr()
-        X = self.remove_intercept_indicator(X)
+        col_mean, col_variance = self.compute_column_moments(X) \
+            if column_moments is None else column_moments
+        is_nonconstant = np.logical_not(
+            self.has_zero_variance(X.shape[0], col_variance)
+        )
+        X = self.remove_intercept_indicator(X, col_variance)
+        col_mean = col_mean[is_nonconstant]
+        col_variance = col_variance[is_nonconstant]
+        if reorder is not None:
+            self.row_perm, self.col_perm = self.compute_reordering(X, reorder)
+            X = self.permute_csr(X, self.row_perm, self.col_perm)
 
         if use_mkl and (mkl_csr_matvec is None):
             warn("Could not load MKL Library. Will use Scipy's 'dot'.")
             use_mkl = False
+        if use_mkl and X.indices.dtype != np.int32:
+            warn(
+                "MKL's sparse matrix-vector routine only supports 32-bit "
+                "indices. Will use Scipy's 'dot'."
+            )
+            use_mkl = False
         self.use_mkl = use_mkl
+        self.use_cython = (csr_weighted_gram is not None)
+        self.use_matvec_kernel = self.is_supported_by_matvec_kernel(X)
 
         self.centered = center_predictor
         if center_predictor:
-            self.column_offset = np.squeeze(np.array(X.mean(axis=0)))
+            self.column_offset = col_mean
         else:
             self.column_offset = np.zeros(X.shape[1])
 
+        self.scaled = scale_predictor
+        if scale_predictor:
+            self.column_scale = 1 / np.sqrt(col_variance)
+        else:
+            self.column_scale = np.ones(X.shape[1])
+
         self.intercept_added = add_intercept
-        self.X_main = X.tocsr()
+        self.X_main = X
+        self._X_main_squared = None # Created on the first use.
+
+    @staticmethod
+    def compute_reordering(X, method):
+        """ Returns the row and column permutations, either of which may be
+        None if the original order is to be kept.
+
+        Params:
+        ------
+        X : scipy CSR matrix
+        method : {'rcm', 'nnz'}
+        """
+        n_row, n_col = X.shape
+        if method == 'rcm':
+            # The bipartite graph [[0, X], [X', 0]] yields simultaneous row and
+            # column orderings while avoiding the formation of X'X.
+            pattern = sparse.csr_matrix(
+                (np.ones(X.nnz, dtype=np.int8), X.indices, X.indptr),
+                shape=X.shape
+            )
+            graph = sparse.bmat([[None, pattern], [pattern.T, None]], format='csr')
+            perm = reverse_cuthill_mckee(graph, symmetric_mode=True)
+            is_row = perm < n_row
+            row_perm = perm[is_row].astype(np.intp)
+            col_perm = (perm[~is_row] - n_row).astype(np.intp)
+        elif method == 'nnz':
+            col_nnz = np.bincount(X.indices, minlength=n_col)
+            row_perm = None
+            col_perm = np.argsort(- col_nnz, kind='stable')
+        else:
+            raise ValueError("Unsupported reordering method: {}".format(method))
+        return row_perm, col_perm
+
+    @staticmethod
+    def permute_csr(X, row_perm, col_perm):
+        """ Returns X[row_perm, :][:, col_perm] with the column indices sorted
+        within each row. """
+        if row_perm is not None:
+            X = X[row_perm, :]
+        if col_perm is not None:
+            new_index = np.empty(len(col_perm), dtype=X.indices.dtype)
+            new_index[col_perm] = np.arange(len(col_perm), dtype=X.indices.dtype)
+            X = sparse.csr_matrix(
+                (X.data, new_index[X.indices], X.indptr), shape=X.shape
+            )
+            X.has_sorted_indices = False
+            X.sort_indices()
+        return X
+
+    def to_internal_order(self, v, perm):
+        """ Gathers an input vector (or the rows of an array) into the
+        internal order of the rows or columns of X_main. """
+        return v if perm is None else v[perm]
+
+    def to_original_order(self, v, perm, out=None):
+        """ Scatters the result computed in the internal order back to the
+        original one. """
+        if perm is None:
+            return self.store_result(v, out)
+        result = np.empty(v.shape) if out is None else out
+        result[perm] = v
+        return result
+
+    def as_single_precision(self):
+        if self._single_precision_copy is None:
+            design = copy.copy(self)
+            X = self.X_main
+            design.X_main = sparse.csr_matrix(
+                (X.data.astype(np.float32), X.indices, X.indptr),
+                shape=X.shape, copy=False
+            )
+            design.column_offset = self.column_offset.astype(np.float32)
+            design.column_scale = self.column_scale.astype(np.float32)
+            design.use_mkl = False
+            design.use_matvec_kernel = False
+            design._X_main_squared = None
+            design.matvec_cache = None
+            design._single_precision_copy = design
+            self._single_precision_copy = design
+        return self._single_precision_copy
+
+    @classmethod
+    def from_npy(cls, data, indices, indptr, shape, **kwargs):
+        """ Constructs the design matrix directly from the CSR arrays without
+        copying them, memory-mapping those given as paths to .npy files.
+
+        Params:
+        ------
+        data, indices, indptr : str or numpy array (e.g. numpy.memmap)
+        shape : tuple of int
+        """
+        data, indices, indptr = (
+            np.load(arr, mmap_mode='r') if isinstance(arr, str) else arr
+            for arr in (data, indices, indptr)
+        )
+        X = sparse.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+        return cls(X, **kwargs)
 
     @property
     def shape(self):
@@ -58,103 +223,160 @@ class SparseDesignMatrix(AbstractDesignMatrix):
         """
         return self.X_main.nnz
 
-    def dot(self, v):
-
-        if self.memoized:
-            if np.all(self.v_prev == v):
-                return self.X_dot_v
-            self.v_prev = v.copy()
-
-        intercept_effect = 0.
-        if self.intercept_added:
-            intercept_effect += v[0]
-            v = v[1:]
-        result = intercept_effect + self.main_dot(v)
-        
-        if self.memoized:
-            self.X_dot_v = result
-        self.dot_count += 1
+    @classmethod
+    def choose_index_dtype(cls, nnz, n_col):
+        """ Returns int32 unless nnz or the number of columns requires int64
+        for the CSR indices and indptr. """
+        if max(nnz, n_col) > cls.max_int32_index:
+            return np.int64
+        return np.int32
 
-        return result
+    @staticmethod
+    def is_supported_by_matvec_kernel(X):
+        """ Whether the compiled kernels can write the products of X directly
+        into the output arrays. """
+        return (csr_matvec_add is not None) \
+            and X.indices.dtype in map(np.dtype, ['int32', 'int64']) \
+            and X.data.dtype in map(np.dtype, ['float64', 'float32'])
 
-    def main_dot(self, v):
+    def main_dot(self, v, out=None):
         """ Multiply by the main effect part of the design matrix. """
-        X = self.X_main
-        result = mkl_csr_matvec(X, v) if self.use_mkl else X.dot(v)
+        if self.row_perm is None:
+            result = self.main_internal_dot(v, out=out)
+        else:
+            result = self.to_original_order(
+                self.main_internal_dot(v), self.row_perm, out
+            )
         result -= np.inner(self.column_offset, v)
-        if self.memoized:
-            self.X_dot_v = result
         return result
 
-    def Tdot(self, v):
-        result = self.main_Tdot(v)
-        if self.intercept_added:
-            result = np.concatenate(([np.sum(v)], result))
-        self.Tdot_count += 1
+    def main_internal_dot(self, v, out=None):
+        """ Uncentered product with the rows in the internal order. """
+        X = self.X_main
+        v = self.to_internal_order(v, self.col_perm)
+        if self.use_mkl:
+            result = mkl_csr_matvec(X, v, out=out)
+        elif self.use_matvec_kernel:
+            result = np.zeros(X.shape[0]) if out is None else out
+            if out is not None:
+                result[:] = 0.
+            csr_matvec_add(
+                X.data, X.indices, X.indptr,
+                np.asarray(v, dtype=np.float64), result
+            )
+        else:
+            result = self.store_result(X.dot(v), out)
         return result
 
-    def main_Tdot(self, v):
-        X = self.X_main
-        result = mkl_csr_matvec(X, v, transpose=True) \
-            if self.use_mkl else X.T.dot(v)
+    def main_Tdot(self, v, out=None):
+        result = self.main_uncentered_Tdot(v, out=out)
         result -= np.sum(v) * self.column_offset
         return result
 
-    def compute_fisher_info(self, weight, diag_only=False):
-        """ Compute $X^T W X$ where W is the diagonal matrix of a given weight."""
-
-        if diag_only:
-            return self.compute_fisher_diag(weight)
-
-        weight_mat = self.create_diag_matrix(weight)
-        X = self.X_main
-        X_T = X.T
-        weighted_X = weight_mat.dot(X).tocsc()
+    def main_uncentered_Tdot(self, v, squared=False, out=None):
+        v = self.to_internal_order(v, self.row_perm)
+        if self.col_perm is None:
+            return self.main_internal_Tdot(v, squared, out)
+        return self.to_original_order(
+            self.main_internal_Tdot(v, squared), self.col_perm, out
+        )
 
-        n_pred = self.shape[1]
-        fisher_info = np.zeros((n_pred, n_pred))
-        if self.intercept_added:
-            fisher_info[0, 0] = np.sum(weight)
-            fisher_info[0, 1:] \
-                = weighted_X.sum(0) - np.sum(weight) * self.column_offset
-            fisher_info[1:, 0] = fisher_info[0, 1:]
-            fisher_info_wo_intercept = fisher_info[1:, 1:]
-        else:
-            fisher_info_wo_intercept = fisher_info
+    def main_internal_Tdot(self, v, squared=False, out=None):
+        """ Uncentered transposed product with the columns in the internal
+        order. """
+        X = self.X_main_squared if squared else self.X_main
+        if self.use_mkl:
+            return mkl_csr_matvec(X, v, transpose=True, out=out)
+        elif self.use_matvec_kernel:
+            result = np.empty(X.shape[1]) if out is None else out
+            csr_Tmatvec(
+                X.data, X.indices, X.indptr,
+                np.asarray(v, dtype=np.float64), result
+            )
+            return result
+        return self.store_result(X.T.dot(v), out)
 
-        fisher_info_wo_intercept += X_T.dot(weighted_X).toarray()
-        if self.centered:
-            outer_prod_term = np.outer(
-                self.column_offset, weighted_X.sum(0)
+    @property
+    def X_main_squared(self):
+        """ Entry-wise square of X_main, sharing its indices and indptr. """
+        if self._X_main_squared is None:
+            X = self.X_main
+            self._X_main_squared = sparse.csr_matrix(
+                (np.square(X.data), X.indices, X.indptr),
+                shape=X.shape, copy=False
             )
-            fisher_info_wo_intercept -= outer_prod_term + outer_prod_term.T
-            fisher_info_wo_intercept \
-                += np.sum(weight) * np.outer(self.column_offset, self.column_offset)
+        return self._X_main_squared
 
-        return fisher_info
+    def main_dot_block(self, V):
+        X = self.X_main
+        V_internal = self.to_internal_order(V, self.col_perm)
+        result = mkl_csr_matmat(X, V_internal) \
+            if self.use_mkl else X.dot(V_internal)
+        result = self.to_original_order(result, self.row_perm)
+        result -= self.column_offset.dot(V)
+        return result
 
-    def compute_fisher_diag(self, weight):
+    def main_Tdot_block(self, U):
+        X = self.X_main
+        U_internal = self.to_internal_order(U, self.row_perm)
+        result = mkl_csr_matmat(X, U_internal, transpose=True) \
+            if self.use_mkl else X.T.dot(U_internal)
+        result = self.to_original_order(result, self.col_perm)
+        result -= np.outer(self.column_offset, np.sum(U, axis=0))
+        return result
 
+    def compute_main_fisher_info(self, weight):
+        fisher_info, weighted_col_sum = self.compute_internal_fisher_info(
+            self.to_internal_order(weight, self.row_perm)
+        )
+        if self.col_perm is not None:
+            inverse_perm = np.argsort(self.col_perm)
+            fisher_info = fisher_info[np.ix_(inverse_perm, inverse_perm)]
+            weighted_col_sum = weighted_col_sum[inverse_perm]
+        return fisher_info, weighted_col_sum
+
+    def compute_internal_fisher_info(self, weight):
+        X = self.X_main
+        if self.use_cython:
+            return csr_weighted_gram(
+                X.data, X.indices, X.indptr,
+                np.ascontiguousarray(weight, dtype=np.float64), X.shape[1]
+            )
         weight_mat = self.create_diag_matrix(weight)
-        diag = weight_mat.dot(self.X_main.power(2)).sum(0)
-        if self.centered:
-            weighted_X = weight_mat.dot(self.X_main).tocsc()
-            diag -= 2 * self.column_offset \
-                    * np.squeeze(np.asarray(weighted_X.sum(0)))
-            diag += np.sum(weight) * self.column_offset ** 2
-        diag = np.squeeze(np.asarray(diag))
-        if self.intercept_added:
-            diag = np.concatenate(([np.sum(weight)], diag))
+        weighted_X = weight_mat.dot(X).tocsc()
+        weighted_col_sum = np.squeeze(np.asarray(weighted_X.sum(0)))
+        return X.T.dot(weighted_X).toarray(), weighted_col_sum
+
+    def compute_main_sparse_fisher_info(self, weight):
+        X = self.X_main
+        weight_mat = self.create_diag_matrix(
+            self.to_internal_order(weight, self.row_perm)
+        )
+        fisher_info = X.T.dot(weight_mat.dot(X)).tocsc()
+        if self.col_perm is not None:
+            inverse_perm = np.argsort(self.col_perm)
+            fisher_info = fisher_info[inverse_perm, :][:, inverse_perm]
+        return fisher_info, self.main_uncentered_Tdot(weight)
 
-        return diag
+    def compute_main_fisher_diag(self, weight):
+        diag = self.main_uncentered_Tdot(weight, squared=True)
+        weighted_col_sum = self.main_uncentered_Tdot(weight) \
+            if self.centered else None
+        return diag, weighted_col_sum
 
     def create_diag_matrix(self, v):
         return sparse.dia_matrix((v, 0), (len(v), len(v)))
 
     def toarray(self):
-        X = self.X_main.toarray() - self.column_offset[np.newaxis, :]
+        X = self.X_main.toarray()
+        if self.row_perm is not None:
+            X = self.to_original_order(X, self.row_perm)
+        if self.col_perm is not None:
+            X = self.to_original_order(X.T, self.col_perm).T
+        X = X - self.column_offset[np.newaxis, :]
+        X *= self.column_scale[np.newaxis, :]
         if self.intercept_added:
-            X = np.hstack((np.ones(X.shape[0]), X))
+            X = np.hstack((np.ones((X.shape[0], 1)), X))
         return X
 
     def extract_matrix(self, order=None):
@@ -8,25 +8,38 @@ class SamplerOptions():
 
     def __init__(self, coef_sampler_type,
                  global_scale_update='sample',
-                 hmc_curvature_est_stabilized=False):
+                 hmc_curvature_est_stabilized=False,
+                 matvec_cache_size=0,
+                 cg_mixed_precision=False):
         """
         Parameters
         ----------
-        coef_sampler_type : {'cholesky', 'cg', 'hmc'}
+        coef_sampler_type : {'cholesky', 'sparse_cholesky', 'cg', 'hmc'}
         global_scale_update : str, {'sample', 'optimize', None}
         hmc_curvature_est_stabilized : bool
+        matvec_cache_size : int
+            If positive, the results of the design matrix-vector
+            multiplications are cached for as many recent input vectors
+            throughout the sampler run.
+        cg_mixed_precision : bool
+            If True, the CG sampler computes the matrix-vector products in
+            float32 and refines the solution in float64 to the same tolerance.
         """
-        if coef_sampler_type not in ('cholesky', 'cg', 'hmc'):
+        if coef_sampler_type not in ('cholesky', 'sparse_cholesky', 'cg', 'hmc'):
             raise ValueError("Unsupported regression coefficient sampler.")
         self.coef_sampler_type = coef_sampler_type
         self.gscale_update = global_scale_update
         self.curvature_est_stabilized = hmc_curvature_est_stabilized
+        self.matvec_cache_size = matvec_cache_size
+        self.cg_mixed_precision = cg_mixed_precision
 
     def get_info(self):
         return {
             'coef_sampler_type': self.coef_sampler_type,
             'global_scale_update': self.gscale_update,
-            'hmc_curvature_est_stabilized': self.curvature_est_stabilized
+            'hmc_curvature_est_stabilized': self.curvature_est_stabilized,
+            'matvec_cache_size': self.matvec_cache_size,
+            'cg_mixed_precision': self.cg_mixed_precision
         }
 
     @staticmethod
@@ -43,7 +56,8 @@ class SamplerOptions():
                      "regression coefficient. Will use the dictionary one.")
             coef_sampler_type = options['coef_sampler_type']
 
-        if coef_sampler_type not in (None, 'cholesky', 'cg', 'hmc'):
+        if coef_sampler_type not in (
+                None, 'cholesky', 'sparse_cholesky', 'cg', 'hmc'):
             raise ValueError("Unsupported sampler type.")
 
         if model_name in ('linear', 'logit'):
@@ -63,9 +77,24 @@ class SamplerOptions():
             if n_pred > n_obs:
                 warn("Sampler has not been optimized for 'small n' problem.")
 
+            if coef_sampler_type == 'sparse_cholesky':
+                if not design.is_sparse:
+                    warn("The 'sparse_cholesky' sampler is designed for sparse "
+                         "design matrices. Will use 'cholesky' instead.")
+                    coef_sampler_type = 'cholesky'
+                elif not design.has_sparse_fisher_info:
+                    warn("The design matrix does not support the sparse Fisher "
+                         "information. Will use 'cholesky' instead.")
+                    coef_sampler_type = 'cholesky'
+                elif design.centered:
+                    raise ValueError(
+                        "The 'sparse_cholesky' sampler requires an uncentered "
+                        "design matrix; set 'center_predictor=False'."
+                    )
+
             if coef_sampler_type is None:
                 coef_sampler_type = preferred_method
-            elif coef_sampler_type not in ('hmc', preferred_method):
+            elif coef_sampler_type not in ('hmc', 'sparse_cholesky', preferred_method):
                 warn("Specified sampler may not be optimal. Worth experimenting "
                      "with the '{:s}' option.".format(preferred_method))
 
@@ -1,8 +1,16 @@
 import abc
+from ..util.workspace import WorkspacePool
 
 
 class AbstractModel():
 
+    @property
+    def workspace(self):
+        """ Pool of scratch arrays shared by the model and the samplers. """
+        if getattr(self, '_workspace', None) is None:
+            self._workspace = WorkspacePool()
+        return self._workspace
+
     @property
     def n_obs(self):
         return self.design.shape[0]
@@ -6,7 +6,7 @@ from warnings import warn
 
 class CoxModel(AbstractModel):
 
-    def __init__(self, event_time, censoring_time, design):
+    def __init__(self, event_time, censoring_time, design, group_ties=False):
         """
 
         Parameters
@@ -16,6 +16,12 @@ class CoxModel(AbstractModel):
             indicates right-censoring.
         censoring_time : numpy array
             float('inf') indicates uncensored observations.
+        group_ties : bool
+            If True, the tied events share a single risk set weighted by
+            the number of ties, so that the cost of the likelihood, gradient,
+            and Hessian evaluations scales with the number of unique event
+            times rather than of events. The ties are handled by Breslow's
+            approximation either way.
         """
 
         if np.any(event_time[:-1] > event_time[1:]):
@@ -37,6 +43,12 @@ class CoxModel(AbstractModel):
                 event_time[:n_event],
                 np.flip(censoring_time[n_event:])
             )
+        n_tied_event = None
+        if group_ties:
+            risk_set_start_index, risk_set_end_index, n_tied_event = \
+                CoxModel._group_tied_risk_sets(
+                    risk_set_start_index, risk_set_end_index
+                )
         n_appearance = CoxModel.count_risk_set_appearance(
             len(event_time), risk_set_start_index, risk_set_end_index
         )
@@ -51,6 +63,8 @@ class CoxModel(AbstractModel):
         self.n_appearance_in_risk_set = n_appearance
         self.risk_set_start_index = risk_set_start_index
         self.risk_set_end_index = risk_set_end_index
+        self.n_tied_event = n_tied_event
+            # Number of events sharing each risk set; None if not grouped.
         self.design = design
         self.name = 'cox'
 
@@ -143,40 +157,49 @@ class CoxModel(AbstractModel):
 
     @staticmethod
     def np_rank_by_value(arr):
-        sort_arguments = np.argsort(arr)
-        rank = np.arange(len(arr))[np.argsort(sort_arguments)]
-        return rank.astype('float')
+        rank = np.empty(len(arr))
+        rank[np.argsort(arr)] = np.arange(len(arr))
+        return rank
 
     @staticmethod
     def count_risk_set_appearance(n_obs, start_index, end_index):
         """ This function assumes that the observations are already sorted in
-        the way required by the class. """
-
-        # The calculation can be done more efficiently.
-        n_appearance = np.zeros(n_obs, dtype=np.int)
-        for i in range(len(start_index)):
-            if start_index[i] <= end_index[i]:
-                n_appearance[start_index[i]:(end_index[i] + 1)] += 1
+        the way required by the class. The counts are accumulated through a
+        difference array in O(n_obs + n_event) operations. """
+        is_nonempty = (start_index <= end_index)
+        n_entering = np.bincount(start_index[is_nonempty], minlength=n_obs + 1)
+        n_leaving = np.bincount(end_index[is_nonempty] + 1, minlength=n_obs + 1)
+        n_appearance = np.cumsum(n_entering[:n_obs] - n_leaving[:n_obs])
         return n_appearance
 
     def _find_risk_set_index(self, event_time, censoring_time):
         """ The parameters are assumed to have 'inf' removed and in the ascending order. """
 
-        n_event = len(event_time)
-        start_index = np.zeros(n_event, dtype=np.int)
-        for i in range(1, n_event):
-            if event_time[i - 1] == event_time[i]:
-                start_index[i] = start_index[i - 1]
-            else:
-                start_index[i] = i
-
-        n_censored = np.array([
-            np.searchsorted(censoring_time, t) for t in event_time
-        ], dtype=np.int) # Tied censoring time is considered to be in the risk set.
+        # Tied events share the risk set starting at the first of them.
+        is_first_of_ties = np.ones(len(event_time), dtype=bool)
+        is_first_of_ties[1:] = (event_time[1:] != event_time[:-1])
+        start_index = np.where(is_first_of_ties, np.arange(len(event_time)), 0)
+        np.maximum.accumulate(start_index, out=start_index)
+
+        n_censored = np.searchsorted(censoring_time, event_time)
+            # Tied censoring time is considered to be in the risk set.
         end_index = len(event_time) + len(censoring_time) - 1 - n_censored
 
         return start_index, end_index
 
+    @staticmethod
+    def _group_tied_risk_sets(start_index, end_index):
+        """ Returns the risk set indices of the unique event times along with
+        the numbers of events at each of them. The tied events have
+        identical risk sets, which start at the first of the ties. """
+        is_first_of_ties = np.ones(len(start_index), dtype=bool)
+        is_first_of_ties[1:] = (start_index[1:] != start_index[:-1])
+        n_tied_event = np.diff(np.append(
+            np.flatnonzero(is_first_of_ties), len(start_index)
+        ))
+        return start_index[is_first_of_ties], end_index[is_first_of_ties], \
+            n_tied_event
+
     def compute_loglik_and_gradient(self, beta, loglik_only=False):
 
         grad = None # defalt return value
@@ -187,28 +210,36 @@ class CoxModel(AbstractModel):
             loglik = - float('inf')
             return loglik, grad
 
-        loglik = np.sum(
-            log_rel_hazard[:self.n_event] - np.log(hazard_sum_over_risk_set)
-        )
+        log_hazard_sum = np.log(hazard_sum_over_risk_set)
+        loglik = np.sum(log_rel_hazard[:self.n_event])
+        if self.n_tied_event is None:
+            loglik -= np.sum(log_hazard_sum)
+        else:
+            loglik -= np.inner(self.n_tied_event, log_hazard_sum)
 
         if not loglik_only:
             hazard_matrix = self._HazardMultinomialProbMatrix(
                 rel_hazard, hazard_sum_over_risk_set,
-                self.risk_set_start_index, self.risk_set_end_index, self.n_appearance_in_risk_set
+                self.risk_set_start_index, self.risk_set_end_index, self.n_appearance_in_risk_set,
+                self.n_tied_event
             )
-            v = np.zeros(self.design.shape[0])
-            v[:self.n_event] = 1
-            v -= hazard_matrix.sum_over_events()
+            v = self.workspace.get('grad_work', self.n_obs)
+            np.negative(hazard_matrix.sum_over_events(), out=v)
+            v[:self.n_event] += 1
             grad = self.design.Tdot(v)
 
         return loglik, grad
 
     def _compute_relative_hazard(self, beta):
 
-        log_rel_hazard = self.design.dot(beta)
+        log_rel_hazard = self.design.dot(
+            beta, out=self.workspace.get('log_rel_hazard', self.n_obs)
+        )
         log_rel_hazard = CoxModel._shift_log_hazard(log_rel_hazard)
 
-        rel_hazard = np.exp(log_rel_hazard)
+        rel_hazard = np.exp(
+            log_rel_hazard, out=self.workspace.get('rel_hazard', self.n_obs)
+        )
 
         hazard_sum_over_risk_set = self._sum_over_start_end(
             rel_hazard, self.risk_set_start_index, self.risk_set_end_index
@@ -228,7 +259,7 @@ class CoxModel(AbstractModel):
             np.cumsum(arr[start_index[-1]:])[end_index - start_index[-1]]
         sum_from_left = np.concatenate((
             CoxModel.np_reverse_cumsum(arr[:start_index[-1]]), [0]
-        ))
+        ))[start_index]
         total_sum = sum_from_right + sum_from_left
         return total_sum
 
@@ -252,6 +283,8 @@ class CoxModel(AbstractModel):
 
         _, rel_hazard, hazard_sum_over_risk_set \
             = self._compute_relative_hazard(beta)
+        rel_hazard = rel_hazard.copy()
+            # The workspace array is overwritten by the next likelihood evaluation.
         if np.any(hazard_sum_over_risk_set == 0.):
             raise ValueError(
                 'Hessian operator cannot be computed likely due to an '
@@ -261,14 +294,19 @@ class CoxModel(AbstractModel):
             )
         W = self._HazardMultinomialProbMatrix(
             rel_hazard, hazard_sum_over_risk_set,
-            self.risk_set_start_index, self.risk_set_end_index, self.n_appearance_in_risk_set
+            self.risk_set_start_index, self.risk_set_end_index, self.n_appearance_in_risk_set,
+            self.n_tied_event
         )
+        W_row_sum = W.sum_over_events()
+        X_beta = self.workspace.get('hessian_X_v', self.n_obs)
         def hessian_op(beta):
-            X_beta = self.design.dot(beta)
-            result_vec = - self.design.Tdot(
-                W.sum_over_events() * X_beta - W.Tdot(W.dot(X_beta))
-            )
-            return result_vec
+            self.design.dot(beta, out=X_beta)
+            W_X_beta = W.dot(X_beta)
+            if self.n_tied_event is not None:
+                W_X_beta *= self.n_tied_event
+            result_vec = W.Tdot(W_X_beta)
+            result_vec -= W_row_sum * X_beta
+            return self.design.Tdot(result_vec)
 
         return hessian_op
 
@@ -309,15 +347,19 @@ class CoxModel(AbstractModel):
         """
         Defines operations by a matrix whose each row represents the conditional
         probabilities of the event happening to the individuals in the risk set.
+        With the tied events grouped, each row corresponds to a unique event
+        time and counts 'n_tied_event' times in the sum over events.
         """
 
         def __init__(self, rel_hazard, hazard_sum_over_risk_set,
-                     risk_set_start_index, risk_set_end_index, n_appearance_in_risk_set):
+                     risk_set_start_index, risk_set_end_index, n_appearance_in_risk_set,
+                     n_tied_event=None):
             self.rel_hazard = rel_hazard
             self.hazard_sum_over_risk_set = hazard_sum_over_risk_set
             self.risk_set_start_index = risk_set_start_index
             self.risk_set_end_index = risk_set_end_index
             self.n_appearance_in_risk_set = n_appearance_in_risk_set
+            self.n_tied_event = n_tied_event
             self.n_event = len(hazard_sum_over_risk_set)
 
 
@@ -325,9 +367,13 @@ class CoxModel(AbstractModel):
             """
             Returns the same value as the row sum of the explicitly computed
             the matrix (e.g. via the 'compute_matrix' method) but do it more
-            efficiently.
+            efficiently. The rows are weighted by the numbers of tied events
+            if grouped.
             """
-            normalizer_cumsum = np.cumsum(self.hazard_sum_over_risk_set ** -1)
+            inv_normalizer = self.hazard_sum_over_risk_set ** -1
+            if self.n_tied_event is not None:
+                inv_normalizer *= self.n_tied_event
+            normalizer_cumsum = np.cumsum(inv_normalizer)
             row_sum = normalizer_cumsum[self.n_appearance_in_risk_set - 1] \
                       * self.rel_hazard
             return row_sum
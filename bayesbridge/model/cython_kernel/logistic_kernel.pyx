@@ -0,0 +1,65 @@
+import numpy as np
+cimport numpy as np
+import cython
+cimport cython
+from cython.parallel cimport prange
+from libc.math cimport exp, log1p, fabs
+
+
+cdef inline double softplus(double x) nogil:
+    """ Computes log(1 + exp(x)) without overflow. """
+    if x > 0:
+        return x + log1p(exp(-x))
+    return log1p(exp(x))
+
+
+cdef inline double sigmoid(double x) nogil:
+    cdef double exp_neg_abs_x = exp(-fabs(x))
+    if x >= 0:
+        return 1. / (1. + exp_neg_abs_x)
+    return exp_neg_abs_x / (1. + exp_neg_abs_x)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def logit_loglik(const double[:] logit_prob, const double[:] n_success,
+                 const double[:] n_trial):
+    """ Returns sum(n_success * logit_prob - n_trial * softplus(logit_prob)). """
+    cdef Py_ssize_t i
+    cdef Py_ssize_t n = logit_prob.shape[0]
+    cdef double loglik = 0
+    for i in prange(n, nogil=True, schedule='static'):
+        loglik += n_success[i] * logit_prob[i] - n_trial[i] * softplus(logit_prob[i])
+    return loglik
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def logit_loglik_and_resid(const double[:] logit_prob, const double[:] n_success,
+                           const double[:] n_trial, double[:] resid):
+    """ Returns the log-likelihood as in 'logit_loglik' while storing the
+    residual n_success - n_trial * sigmoid(logit_prob), from which the
+    gradient is obtained, in 'resid'. """
+    cdef Py_ssize_t i
+    cdef Py_ssize_t n = logit_prob.shape[0]
+    cdef double loglik = 0
+    cdef double x
+    for i in prange(n, nogil=True, schedule='static'):
+        x = logit_prob[i]
+        loglik += n_success[i] * x - n_trial[i] * softplus(x)
+        resid[i] = n_success[i] - n_trial[i] * sigmoid(x)
+    return loglik
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def logit_hessian_weight(const double[:] logit_prob, const double[:] n_trial,
+                         double[:] weight):
+    """ Stores n_trial * sigmoid(logit_prob) * (1 - sigmoid(logit_prob)) in
+    'weight'. """
+    cdef Py_ssize_t i
+    cdef Py_ssize_t n = logit_prob.shape[0]
+    cdef double prob
+    for i in prange(n, nogil=True, schedule='static'):
+        prob = sigmoid(logit_prob[i])
+        weight[i] = n_trial[i] * prob * (1. - prob)
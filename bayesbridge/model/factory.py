@@ -1,14 +1,19 @@
-from warnings import warn
+from warnings import warn, catch_warnings, simplefilter
+import numpy as np
 import scipy as sp
 
 from .linear_model import LinearModel
 from .logistic_model import LogisticModel
 from .cox_model import CoxModel
-from ..design_matrix import DenseDesignMatrix, SparseDesignMatrix
+from ..design_matrix import \
+    DenseDesignMatrix, SparseDesignMatrix, BinaryDesignMatrix
+from ..design_matrix.abstract_matrix import AbstractDesignMatrix
 
 def RegressionModel(
         outcome, X, family='linear',
-        add_intercept=None, center_predictor=True
+        add_intercept=None, center_predictor=True, scale_predictor=False,
+        reorder=None, compress_duplicate_rows=False, sufficient_stat=False,
+        group_ties=False
     ):
     """ Prepare input data to BayesBridge, with pre-processings as needed.
 
@@ -21,11 +26,40 @@ def RegressionModel(
         n_success or (n_success, n_trial) if family == 'logistic'. If
         the input is a single array, then outcome is assumed binary.
         (event_time, censoring_time) if family == 'cox'.
-    X : numpy array or scipy sparse matrix
+    X : numpy array, scipy sparse matrix, or design matrix object
+        A sparse matrix with all the non-zero entries equal to one is stored
+        as a binary (pattern-only) design matrix. A design matrix object
+        (e.g. CategoricalDesignMatrix) is used as is, in which case
+        'add_intercept' and 'center_predictor' have no effect; for the Cox
+        model, its rows must then already be ordered and filtered as by
+        'CoxModel.preprocess_data'.
     family : str, {'linear', 'logit', 'cox'}
     add_intercept : bool, None
         If None, add intercept except when family == 'cox'
     center_predictor : bool
+    scale_predictor : bool
+        If True, the predictors are standardized to have unit variance. The
+        scaling is applied lazily within the matrix operations without
+        making a scaled copy of X, and the regression coefficients are those
+        of the scaled predictors; use 'model.design.unscale_coef' to convert
+        them back to the original scale.
+    reorder : {None, 'rcm', 'nnz'}
+        Internal reordering of the rows and columns of a (non-binary) sparse X
+        for better memory locality; see SparseDesignMatrix. The coefficients
+        remain in the original order of the columns.
+    compress_duplicate_rows : bool
+        If True and family == 'logit', the identical rows of X are collapsed
+        into one with the binomial counts aggregated. The centering and
+        scaling are still based on the original rows, and the map from the
+        original observations to the compressed rows is kept as
+        'model.expansion_index'.
+    sufficient_stat : bool
+        If True and family == 'linear', X'X, X'y, and y'y are precomputed so
+        that the cost of each Gibbs iteration is (mostly) independent of n.
+    group_ties : bool
+        If True and family == 'cox', the tied events share a single risk set
+        under Breslow's approximation, so that the likelihood computations
+        scale with the number of unique event times; see CoxModel.
     """
 
     if add_intercept is None:
@@ -36,18 +70,84 @@ def RegressionModel(
             add_intercept = False
             warn("Intercept is not identifiable in Cox model and won't be added.")
         event_time, censoring_time = outcome
+        if isinstance(X, AbstractDesignMatrix):
+            # The rows of a design object cannot be permuted or removed, so
+            # the observations must already be as required by CoxModel.
+            row_index = np.arange(X.shape[0])
+            with catch_warnings():
+                simplefilter('ignore')
+                _, _, preprocessed_row_index = CoxModel.preprocess_data(
+                    event_time, censoring_time, row_index[:, np.newaxis]
+                )
+            if not np.array_equal(preprocessed_row_index.ravel(), row_index):
+                raise ValueError(
+                    "For the Cox model with a design matrix object, the "
+                    "observations must be pre-sorted and the uninformative "
+                    "ones removed; see CoxModel.preprocess_data."
+                )
         event_time, censoring_time, X = CoxModel.preprocess_data(
             event_time, censoring_time, X
         )
 
-    is_sparse = sp.sparse.issparse(X)
-    DesignMatrix = SparseDesignMatrix if is_sparse else DenseDesignMatrix
-    design = DesignMatrix(
-        X, add_intercept=add_intercept, center_predictor=center_predictor
-    )
+    if compress_duplicate_rows:
+        if family != 'logit':
+            raise ValueError(
+                "Compression of duplicate rows is only supported for the "
+                "logistic model."
+            )
+        if isinstance(X, AbstractDesignMatrix):
+            raise ValueError(
+                "Compression of duplicate rows requires X to be a numpy "
+                "array or scipy sparse matrix."
+            )
+        n_success, n_trial = \
+            outcome if isinstance(outcome, tuple) else (outcome, None)
+        col_mean, col_variance = \
+            AbstractDesignMatrix.compute_column_moments(X)
+        n_obs = X.shape[0]
+        n_success, n_trial, X, expansion_index = \
+            LogisticModel.compress_duplicate_rows(n_success, n_trial, X)
+        outcome = (n_success, n_trial)
+
+    if isinstance(X, AbstractDesignMatrix):
+        design = X
+    else:
+        if sp.sparse.issparse(X):
+            X = X.tocsr()
+            DesignMatrix = BinaryDesignMatrix \
+                if BinaryDesignMatrix.is_binary(X) else SparseDesignMatrix
+        else:
+            DesignMatrix = DenseDesignMatrix
+        kwargs = {}
+        if DesignMatrix is SparseDesignMatrix:
+            kwargs['reorder'] = reorder
+        elif reorder is not None:
+            warn("Reordering is only supported for non-binary sparse X; ignored.")
+        design = DesignMatrix(
+            X, add_intercept=add_intercept, center_predictor=center_predictor,
+            scale_predictor=scale_predictor, **kwargs
+        )
+        if compress_duplicate_rows:
+            # The column moments of the compressed rows are not weighted by
+            # the counts, so those of the original rows are used instead.
+            is_nonconstant = np.logical_not(
+                AbstractDesignMatrix.has_zero_variance(n_obs, col_variance)
+            )
+            if center_predictor:
+                design.column_offset = col_mean[is_nonconstant]
+            if scale_predictor:
+                design.column_scale = 1 / np.sqrt(col_variance[is_nonconstant])
+
+    if sufficient_stat and family != 'linear':
+        raise ValueError(
+            "The sufficient statistics mode is only supported for the linear model."
+        )
+
+    if group_ties and family != 'cox':
+        raise ValueError("Grouping of tied events is only supported for the Cox model.")
 
     if family == 'linear':
-        model = LinearModel(outcome, design)
+        model = LinearModel(outcome, design, use_sufficient_stat=sufficient_stat)
     elif family == 'logit':
         if isinstance(outcome, tuple):
             n_success, n_trial = outcome
@@ -55,8 +155,12 @@ def RegressionModel(
             n_success = outcome
             n_trial = None
         model = LogisticModel(n_success, n_trial, design)
+        if compress_duplicate_rows:
+            model.expansion_index = expansion_index
     elif family == 'cox':
-        model = CoxModel(event_time, censoring_time, design)
+        model = CoxModel(
+            event_time, censoring_time, design, group_ties=group_ties
+        )
     else:
         raise NotImplementedError()
 
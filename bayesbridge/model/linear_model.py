@@ -1,32 +1,97 @@
 from .abstract_model import AbstractModel
 import math
 import numpy as np
+import scipy as sp
+import scipy.linalg
 
 
 class LinearModel(AbstractModel):
 
-    def __init__(self, y, design):
+    def __init__(self, y, design, use_sufficient_stat=False):
+        """
+        Params:
+        ------
+        use_sufficient_stat : bool
+            If True, X'X, X'y, and y'y are computed once and the likelihood
+            and its derivatives are evaluated from them at O(p^2) cost
+            independent of n, at the price of holding X'X as a dense matrix.
+            A factor L of X'X = L L' is also computed once at O(p^3) cost so
+            that the CG sampler can draw its Gaussian target vectors without
+            touching X.
+        """
         self.y = y
         self.design = design
         self.name = 'linear'
+        self.sufficient_stat = None
+        if use_sufficient_stat:
+            self.compute_sufficient_stat()
+
+    def compute_sufficient_stat(self):
+        XtX = self.design.compute_fisher_info(np.ones(self.n_obs))
+        self.sufficient_stat = {
+            'XtX': XtX,
+            'XtX_sqrt': LinearModel.compute_psd_sqrt(XtX),
+            'Xty': self.design.Tdot(self.y),
+            'yty': np.inner(self.y, self.y)
+        }
+
+    @staticmethod
+    def compute_psd_sqrt(A):
+        """ Returns L with L L' = A, using the Cholesky factor if A is
+        positive definite and the eigen decomposition otherwise (e.g. when
+        the number of predictors exceeds that of the observations). """
+        try:
+            return sp.linalg.cholesky(A, lower=True)
+        except sp.linalg.LinAlgError:
+            eigval, eigvec = sp.linalg.eigh(A)
+            return eigvec * np.sqrt(np.maximum(eigval, 0.))
 
     def compute_loglik_and_gradient(self, beta, obs_prec, loglik_only=False):
-        X_beta = self.design.dot(beta)
+        if self.sufficient_stat is not None:
+            XtX_beta = self.sufficient_stat['XtX'].dot(beta)
+            resid_sq_norm = self.compute_resid_sq_norm(beta, XtX_beta)
+        else:
+            resid = self.design.dot(beta, out=self.workspace.get('resid', self.n_obs))
+            np.subtract(self.y, resid, out=resid)
+            resid_sq_norm = np.inner(resid, resid)
         loglik = (
             len(self.y) * math.log(obs_prec) / 2
-            - obs_prec * np.sum((self.y - X_beta) ** 2) / 2
+            - obs_prec * resid_sq_norm / 2
         )
         if loglik_only:
             grad = None
+        elif self.sufficient_stat is not None:
+            grad = self.sufficient_stat['Xty'] - XtX_beta
+            grad *= obs_prec
         else:
-            grad = obs_prec * self.design.Tdot(self.y - X_beta)
+            grad = self.design.Tdot(resid)
+            grad *= obs_prec
         return loglik, grad
 
+    def compute_resid_sq_norm(self, beta, XtX_beta=None):
+        if self.sufficient_stat is None:
+            resid = self.design.dot(beta, out=self.workspace.get('resid', self.n_obs))
+            np.subtract(self.y, resid, out=resid)
+            return np.inner(resid, resid)
+        if XtX_beta is None:
+            XtX_beta = self.sufficient_stat['XtX'].dot(beta)
+        resid_sq_norm = self.sufficient_stat['yty'] \
+            - 2 * np.inner(beta, self.sufficient_stat['Xty']) \
+            + np.inner(beta, XtX_beta)
+        return max(resid_sq_norm, 0.) # Guard against the cancellation error.
+
     def compute_hessian(self, beta):
         pass
 
     def get_hessian_matvec_operator(self, beta, obs_prec):
-        hessian_op = lambda v: - obs_prec * self.design.Tdot(self.design.dot(v))
+        if self.sufficient_stat is not None:
+            XtX = self.sufficient_stat['XtX']
+            return lambda v: - obs_prec * XtX.dot(v)
+        X_v = self.workspace.get('hessian_X_v', self.n_obs)
+        def hessian_op(v):
+            result = self.design.Tdot(self.design.dot(v, out=X_v))
+            result *= - obs_prec
+            return result
         return hessian_op
 
     @staticmethod
@@ -1,7 +1,15 @@
 from .abstract_model import AbstractModel
 import numpy as np
 import numpy.random
+import scipy as sp
+import scipy.sparse
 from warnings import warn
+from ..design_matrix import ShardedDesignMatrix
+try:
+    from .cython_kernel.logistic_kernel import \
+        logit_loglik, logit_loglik_and_resid, logit_hessian_weight
+except ImportError:
+    logit_loglik, logit_loglik_and_resid, logit_hessian_weight = None, None, None
 
 class LogisticModel(AbstractModel):
 
@@ -21,6 +29,74 @@ class LogisticModel(AbstractModel):
         self.n_success = n_success.astype('float64')
         self.design = design
         self.name = 'logit'
+        self.expansion_index = None
+            # Maps the original observations to the rows of the design when
+            # duplicate rows have been compressed.
+        self.use_cython = (logit_loglik_and_resid is not None)
+        self.is_sharded = isinstance(design, ShardedDesignMatrix)
+        if self.is_sharded:
+            design.set_logit_outcome(self.n_success, self.n_trial)
+
+    def expand_rows(self, v):
+        """ Maps a vector over the rows of the design, e.g. 'design.dot(beta)',
+        back to the original observations. """
+        if self.expansion_index is None:
+            return v
+        return v[self.expansion_index]
+
+    @staticmethod
+    def compress_duplicate_rows(n_success, n_trial, X, seed=0):
+        """ Collapses the identical rows of X into one, summing their numbers
+        of successes and trials.
+
+        The dense rows are compared by their byte representation, after
+        the negative zeros are normalized. The sparse
+        rows are grouped by random projections and then verified entry-wise,
+        with any mismatched row kept on its own, so the result is exact.
+
+        Returns
+        -------
+        n_success, n_trial, X : compressed outcomes and design
+        expansion_index : numpy array
+            Index of the compressed row for each original observation.
+        """
+        if n_trial is None:
+            n_trial = np.ones(len(n_success))
+        if sp.sparse.issparse(X):
+            X = X.tocsr(copy=True) # Not to modify the input in place.
+            X.sum_duplicates()
+            X.sort_indices()
+            random_gen = np.random.RandomState(seed)
+            row_key = np.column_stack((
+                np.diff(X.indptr),
+                X.dot(random_gen.randn(X.shape[1], 2))
+            ))
+            _, first_index, group_index = np.unique(
+                row_key, axis=0, return_index=True, return_inverse=True
+            )
+            group_index = group_index.ravel()
+            representative = first_index[group_index]
+            is_mismatched = np.asarray(
+                (X != X[representative]).sum(axis=1) > 0
+            ).ravel()
+            if np.any(is_mismatched):
+                group_index[is_mismatched] = len(first_index) \
+                    + np.arange(np.count_nonzero(is_mismatched))
+                _, first_index, group_index = np.unique(
+                    group_index, return_index=True, return_inverse=True
+                )
+        else:
+            X = np.ascontiguousarray(X + 0.)
+                # Adding zero turns -0.0 into 0.0 so that they have the same bytes.
+            row_bytes = X.view(np.dtype((np.void, X.dtype.itemsize * X.shape[1])))
+            _, first_index, group_index = np.unique(
+                row_bytes.ravel(), return_index=True, return_inverse=True
+            )
+        group_index = group_index.ravel()
+        n_group = len(first_index)
+        n_success = np.bincount(group_index, n_success, minlength=n_group)
+        n_trial = np.bincount(group_index, n_trial, minlength=n_group)
+        return n_success, n_trial, X[first_index], group_index
 
     def check_input_validity(self, n_success, n_trial, design):
 
@@ -47,30 +123,109 @@ class LogisticModel(AbstractModel):
                 "Number of successes cannot be larger than that of trials.")
 
     def compute_loglik_and_gradient(self, beta, loglik_only=False):
-        logit_prob = self.design.dot(beta)
-        predicted_prob = LogisticModel.convert_to_probability_scale(logit_prob)
-        loglik = np.sum(
-            self.n_success * logit_prob \
-            - self.n_trial * np.log(1 + np.exp(logit_prob))
-        )
-        if loglik_only:
-            grad = None
+        resid = None if loglik_only \
+            else self.workspace.get('loglik_work', self.n_obs)
+        if self.is_sharded:
+            # The workers compute the likelihood terms of their own shards.
+            loglik = self.design.compute_logit_loglik(beta, resid_out=resid)
         else:
-            grad = self.design.Tdot(self.n_success - self.n_trial * predicted_prob)
+            logit_prob = self.design.dot(
+                beta, out=self.workspace.get('logit_prob', self.n_obs)
+            )
+            loglik = LogisticModel.compute_loglik_from_logit(
+                logit_prob, self.n_success, self.n_trial, resid_out=resid,
+                use_cython=self.use_cython
+            )
+        grad = None if loglik_only else self.design.Tdot(resid)
         return loglik, grad
 
+    @staticmethod
+    def compute_loglik_from_logit(logit_prob, n_success, n_trial,
+                                  resid_out=None, use_cython=True):
+        """ Computes the log-likelihood and, if 'resid_out' is given, stores
+        the residual n_success - n_trial * predicted_prob in it, in a single
+        pass over the linear predictor when the compiled kernel is available.
+        """
+        if use_cython and logit_loglik is not None:
+            if resid_out is None:
+                return logit_loglik(logit_prob, n_success, n_trial)
+            return logit_loglik_and_resid(
+                logit_prob, n_success, n_trial, resid_out
+            )
+        work = np.empty(len(logit_prob)) if resid_out is None else resid_out
+        log_partition = LogisticModel.softplus(logit_prob, out=work)
+        loglik = np.inner(n_success, logit_prob) \
+                 - np.inner(n_trial, log_partition)
+        if resid_out is not None:
+            resid = LogisticModel.sigmoid(logit_prob, out=resid_out)
+            resid *= n_trial
+            np.subtract(n_success, resid, out=resid)
+        return loglik
+
+    def sample_polya_gamma(self, beta, rand_gen):
+        """ Samples the Polya-Gamma auxiliary variables given the regression
+        coefficients. """
+        if self.is_sharded:
+            return self.design.sample_polya_gamma(beta, rand_gen.np_random)
+        return rand_gen.polya_gamma(
+            self.n_trial.astype(np.intc),
+            self.design.dot(beta, out=self.workspace.get('logit_prob', self.n_obs))
+        )
+
+    def compute_hessian_weight(self, beta):
+        """ Returns n_trial * predicted_prob * (1 - predicted_prob), the
+        weights of the Fisher information, in a workspace buffer. """
+        logit_prob = self.design.dot(
+            beta, out=self.workspace.get('logit_prob', self.n_obs)
+        )
+        weight = self.workspace.get('hessian_weight', self.n_obs)
+        if self.use_cython:
+            logit_hessian_weight(logit_prob, self.n_trial, weight)
+        else:
+            predicted_prob = LogisticModel.sigmoid(logit_prob, out=weight)
+            weight *= 1 - predicted_prob
+            weight *= self.n_trial
+        return weight
+
     def compute_hessian(self, beta):
-        predicted_prob = LogisticModel.compute_predicted_prob(self.design, beta)
-        weight = predicted_prob * (1 - predicted_prob)
+        weight = self.compute_hessian_weight(beta)
         return - self.design.compute_fisher_info(weight)
 
     def get_hessian_matvec_operator(self, beta):
-        predicted_prob = LogisticModel.compute_predicted_prob(self.design, beta)
-        weight = predicted_prob * (1 - predicted_prob)
-        hessian_op = lambda v: \
-            - self.design.Tdot(self.n_trial * weight * self.design.dot(v))
+        weight = self.compute_hessian_weight(beta).copy()
+            # The workspace array is overwritten by the next weight computation.
+        X_v_buffer = self.workspace.get('hessian_X_v', self.n_obs)
+        def hessian_op(v):
+            weighted_X_v = self.design.dot(v, out=X_v_buffer)
+            weighted_X_v *= weight
+            result = self.design.Tdot(weighted_X_v)
+            result *= -1
+            return result
         return hessian_op
 
+    @staticmethod
+    def softplus(x, out=None):
+        """ Computes log(1 + exp(x)) as max(x, 0) + log(1 + exp(-|x|)), which
+        does not overflow for large x. """
+        out = np.abs(x, out=out)
+        np.negative(out, out=out)
+        np.exp(out, out=out)
+        np.log1p(out, out=out)
+        out += np.maximum(x, 0)
+        return out
+
+    @staticmethod
+    def sigmoid(x, out=None):
+        """ Computes 1 / (1 + exp(-x)) without overflow. """
+        out = np.abs(x, out=out)
+        np.negative(out, out=out)
+        np.exp(out, out=out)
+        is_negative = (x < 0)
+        numer = np.where(is_negative, out, 1.)
+        out += 1
+        np.divide(numer, out, out=out)
+        return out
+
     @staticmethod
     def compute_polya_gamma_mean(shape, tilt):
         min_magnitude = 1e-5
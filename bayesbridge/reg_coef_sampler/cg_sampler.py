@@ -3,16 +3,35 @@ import scipy as sp
 import scipy.sparse
 import scipy.linalg
 from warnings import warn
+from ..util.workspace import WorkspacePool
 
 class ConjugateGradientSampler():
 
-    def __init__(self, n_coef_wo_shrinkage):
+    def __init__(self, n_coef_wo_shrinkage, mixed_precision=False,
+                 max_refinement=10, inner_rtol=1e-4):
+        """
+        Param:
+        ------
+        mixed_precision : bool
+            If True, the linear system is solved by iterative refinement:
+            the corrections are computed by PCG with the design matrix and
+            weights in float32, while the residuals are computed in float64.
+        max_refinement : int
+            Maximum number of refinement steps in the mixed precision mode.
+        inner_rtol : float
+            Relative tolerance of each float32 PCG solve, which cannot be much
+            smaller than the float32 precision.
+        """
         self.n_coef_wo_shrinkage = n_coef_wo_shrinkage
+        self.mixed_precision = mixed_precision
+        self.max_refinement = max_refinement
+        self.inner_rtol = inner_rtol
 
     def sample(
             self, X, omega, prior_prec_sqrt, z,
             beta_init=None, precond_by='prior', beta_scaled_sd=None,
-            maxiter=None, atol=10e-6, seed=None):
+            maxiter=None, atol=10e-6, seed=None, workspace=None,
+            fisher_info=None, fisher_info_sqrt=None):
         """
         Generate a multi-variate Gaussian with the mean mu and covariance Sigma of the form
            Sigma^{-1} = X' Omega X + prior_prec_sqrt^2, mu = Sigma z
@@ -29,20 +48,43 @@ class ConjugateGradientSampler():
             Used to estimate a good preconditioning scale for the coefficient
             without shrinkage. Used only if precond_by == 'prior'.
         precond_by : {'prior', 'diag'}
+        workspace : None, WorkspacePool
+            Provides the arrays of length X.shape[0] reused across the calls.
+        fisher_info : None, numpy array
+            Precomputed X' Omega X, in which case the CG iterations multiply by
+            it instead of by X and X', and omega may be a scalar.
+        fisher_info_sqrt : None, numpy array
+            Factor L of fisher_info = L L'. If given along with fisher_info,
+            the likelihood part of the target vector, distributed as
+            X' Omega^{1/2} N(0, I), is drawn as L N(0, I) so that the cost of
+            the whole sampling step is independent of X.shape[0].
         """
 
         if seed is not None:
             np.random.seed(seed)
+        if workspace is None:
+            workspace = WorkspacePool()
 
         # Define a preconditioned linear operator.
         Phi_precond_op, precond_scale = \
             self.precondition_linear_system(
-                prior_prec_sqrt, omega, X, precond_by, beta_scaled_sd
+                prior_prec_sqrt, omega, X, precond_by, beta_scaled_sd, workspace,
+                fisher_info
             )
 
         # Draw a target vector.
-        v = X.Tdot(omega ** (1 / 2) * np.random.randn(X.shape[0])) \
-            + prior_prec_sqrt * np.random.randn(X.shape[1])
+        if fisher_info is not None and fisher_info_sqrt is not None:
+            v = fisher_info_sqrt.dot(np.random.randn(fisher_info_sqrt.shape[1]))
+        else:
+            noise = np.random.randn(X.shape[0])
+            if np.isscalar(omega):
+                noise *= np.sqrt(omega)
+            else:
+                noise *= np.sqrt(
+                    omega, out=workspace.get('cg_omega_sqrt', X.shape[0])
+                )
+            v = X.Tdot(noise)
+        v += prior_prec_sqrt * np.random.randn(X.shape[1])
         b = precond_scale * (z + v)
 
         # Callback function to count the number of PCG iterations.
@@ -50,12 +92,23 @@ class ConjugateGradientSampler():
         def cg_callback(x): cg_info['n_iter'] += 1
 
         # Run PCG.
-        rtol = atol / np.linalg.norm(b)
         beta_scaled_init = beta_init / precond_scale
-        beta_scaled, info = sp.sparse.linalg.cg(
-            Phi_precond_op, b, x0=beta_scaled_init, maxiter=maxiter, tol=rtol,
-            callback=cg_callback
-        )
+        X_single = X.as_single_precision() \
+            if self.mixed_precision and fisher_info is None else X
+        if X_single is not X:
+            Phi_precond_single_op = self.define_single_precision_operator(
+                X_single, omega, prior_prec_sqrt, precond_scale, workspace
+            )
+            beta_scaled, info = self.solve_by_iterative_refinement(
+                Phi_precond_op, Phi_precond_single_op, b, beta_scaled_init,
+                atol, maxiter, cg_callback
+            )
+        else:
+            rtol = atol / np.linalg.norm(b)
+            beta_scaled, info = sp.sparse.linalg.cg(
+                Phi_precond_op, b, x0=beta_scaled_init, maxiter=maxiter,
+                tol=rtol, callback=cg_callback
+            )
 
         if info != 0:
             warn(
@@ -71,35 +124,90 @@ class ConjugateGradientSampler():
         return beta, cg_info
 
     def precondition_linear_system(
-            self, prior_prec_sqrt, omega, X, precond_by, beta_scaled_sd):
+            self, prior_prec_sqrt, omega, X, precond_by, beta_scaled_sd,
+            workspace, fisher_info=None):
 
         # Compute the preconditioners.
         precond_scale = self.choose_preconditioner(
-            prior_prec_sqrt, omega, X, precond_by, beta_scaled_sd
+            prior_prec_sqrt, omega, X, precond_by, beta_scaled_sd, fisher_info
         )
 
         # Define a preconditioned linear operator.
         precond_prior_prec = (precond_scale * prior_prec_sqrt) ** 2
+        X_v_buffer = workspace.get('cg_X_v', X.shape[0])
         def Phi_precond(x):
-            Phi_x = precond_prior_prec * x \
-                    + precond_scale * X.Tdot(omega * X.dot(precond_scale * x))
+            if fisher_info is not None:
+                Phi_x = fisher_info.dot(precond_scale * x)
+            else:
+                weighted_X_v = X.dot(precond_scale * x, out=X_v_buffer)
+                weighted_X_v *= omega
+                Phi_x = X.Tdot(weighted_X_v)
+            Phi_x *= precond_scale
+            Phi_x += precond_prior_prec * x
             return Phi_x
         Phi_precond_op = sp.sparse.linalg.LinearOperator(
             (X.shape[1], X.shape[1]), matvec=Phi_precond
         )
         return Phi_precond_op, precond_scale
 
+    def define_single_precision_operator(
+            self, X, omega, prior_prec_sqrt, precond_scale, workspace):
+        """ Counterpart of the preconditioned operator with the products by X
+        computed in float32. """
+        precond_prior_prec = (precond_scale * prior_prec_sqrt) ** 2
+        omega_single = workspace.get('cg_omega_single', X.shape[0], np.float32)
+        omega_single[:] = omega
+        X_v_buffer = workspace.get('cg_X_v_single', X.shape[0], np.float32)
+        Xt_v_buffer = workspace.get('cg_Xt_v_single', X.shape[1], np.float32)
+        def Phi_precond(x):
+            weighted_X_v = X.dot(
+                (precond_scale * x).astype(np.float32), out=X_v_buffer
+            )
+            weighted_X_v *= omega_single
+            Phi_x = X.Tdot(weighted_X_v, out=Xt_v_buffer).astype(np.float64)
+            Phi_x *= precond_scale
+            Phi_x += precond_prior_prec * x
+            return Phi_x
+        return sp.sparse.linalg.LinearOperator(
+            (X.shape[1], X.shape[1]), matvec=Phi_precond, dtype=np.float64
+        )
+
+    def solve_by_iterative_refinement(
+            self, Phi_op, Phi_single_op, b, x0, atol, maxiter, callback):
+        """ Solves Phi x = b to the absolute tolerance 'atol' on the float64
+        residual, computing each correction with the float32 operator. The
+        returned info follows the convention of scipy's 'cg'.
+        """
+        x = x0.copy()
+        residual = b - Phi_op.matvec(x)
+        for _ in range(self.max_refinement):
+            residual_norm = np.linalg.norm(residual)
+            if residual_norm <= atol:
+                return x, 0
+            correction, info = sp.sparse.linalg.cg(
+                Phi_single_op, residual, maxiter=maxiter,
+                tol=max(self.inner_rtol, atol / residual_norm), atol=0.,
+                callback=callback
+            )
+            if info < 0:
+                return x, info
+            x += correction
+            residual = b - Phi_op.matvec(x)
+        converged = np.linalg.norm(residual) <= atol
+        return x, 0 if converged else self.max_refinement
+
     def choose_preconditioner(
-            self, prior_prec_sqrt, omega, X, precond_by, beta_scaled_sd):
+            self, prior_prec_sqrt, omega, X, precond_by, beta_scaled_sd,
+            fisher_info=None):
 
         precond_scale = self.choose_diag_preconditioner(
-            prior_prec_sqrt, omega, X, precond_by, beta_scaled_sd)
+            prior_prec_sqrt, omega, X, precond_by, beta_scaled_sd, fisher_info)
 
         return precond_scale
 
     def choose_diag_preconditioner(
             self, prior_prec_sqrt, omega, X, precond_by='diag',
-            beta_scaled_sd=None):
+            beta_scaled_sd=None, fisher_info=None):
         # Compute the diagonal (sqrt) preconditioner.
 
         if precond_by == 'prior':
@@ -115,7 +223,9 @@ class ConjugateGradientSampler():
                     target_sd_scale * beta_scaled_sd[:self.n_coef_wo_shrinkage]
 
         elif precond_by == 'diag':
-            diag = prior_prec_sqrt ** 2 + X.compute_fisher_info(weight=omega, diag_only=True)
+            fisher_info_diag = np.diag(fisher_info) if fisher_info is not None \
+                else X.compute_fisher_info(weight=omega, diag_only=True)
+            diag = prior_prec_sqrt ** 2 + fisher_info_diag
             precond_scale = 1 / np.sqrt(diag)
 
         elif precond_by is None:
@@ -2,7 +2,8 @@ import numpy as np
 import scipy as sp
 import scipy.sparse
 
-def generate_gaussian_with_weight(X, obs_prec, prior_prec_sqrt, z, rand_gen=None):
+def generate_gaussian_with_weight(X, obs_prec, prior_prec_sqrt, z, rand_gen=None,
+                                  fisher_info=None):
     """
     Generate a multi-variate Gaussian with the mean mu and covariance Sigma of the form
         mu = Sigma z,
@@ -12,12 +13,17 @@ def generate_gaussian_with_weight(X, obs_prec, prior_prec_sqrt, z, rand_gen=None
     ----------
         obs_prec : 1-d numpy array
         prior_prec_sqrt : 1-d numpy array
+        fisher_info : None, 2-d numpy array
+            Precomputed X' diag(obs_prec) X, if available.
     """
 
     diag_sqrt = prior_prec_sqrt.copy()
-    fisher_info = X.compute_fisher_info(weight=obs_prec, diag_only=True)
-    fisher_info[fisher_info < 0.] = 0.
-    fisher_info_sqrt = np.sqrt(fisher_info)
+    if fisher_info is None:
+        fisher_info = X.compute_fisher_info(obs_prec)
+    fisher_info_diag = np.diag(fisher_info).copy()
+        # Avoids a separate pass over X for the diagonal.
+    fisher_info_diag[fisher_info_diag < 0.] = 0.
+    fisher_info_sqrt = np.sqrt(fisher_info_diag)
     has_pos_prior_prec = (prior_prec_sqrt > 0)
     has_zero_prior_prec = np.logical_not(has_pos_prior_prec)
     diag_sqrt[has_pos_prior_prec] *= np.sqrt(
@@ -26,7 +32,7 @@ def generate_gaussian_with_weight(X, obs_prec, prior_prec_sqrt, z, rand_gen=None
     diag_sqrt[has_zero_prior_prec] = fisher_info_sqrt[has_zero_prior_prec]
     inv_sqrt_diag_scale = 1 / diag_sqrt
     Phi_scaled = inv_sqrt_diag_scale[:, np.newaxis] \
-        * X.compute_fisher_info(obs_prec) * inv_sqrt_diag_scale[np.newaxis, :]
+        * fisher_info * inv_sqrt_diag_scale[np.newaxis, :]
     Phi_scaled += np.diag((inv_sqrt_diag_scale * prior_prec_sqrt) ** 2)
     Phi_scaled_chol = sp.linalg.cholesky(Phi_scaled)
     mu = sp.linalg.cho_solve((Phi_scaled_chol, False), inv_sqrt_diag_scale * z)
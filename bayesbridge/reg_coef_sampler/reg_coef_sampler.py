@@ -5,8 +5,10 @@ import scipy.sparse
 from warnings import warn
 from functools import partial
 from .cg_sampler import ConjugateGradientSampler
+from ..util.workspace import WorkspacePool
 from .reg_coef_posterior_summarizer import RegressionCoeffficientPosteriorSummarizer
 from .direct_gaussian_sampler import generate_gaussian_with_weight
+from .sparse_cholesky_sampler import SparseCholeskySampler
 from .hamiltonian_monte_carlo import hmc
 from .hamiltonian_monte_carlo.nuts import NoUTurnSampler
 from .hamiltonian_monte_carlo.stepsize_adapter \
@@ -17,7 +19,8 @@ class SparseRegressionCoefficientSampler():
 
     def __init__(self, n_coef, prior_sd_for_unshrunk, sampling_method,
                  stability_estimate_stabilized=False,
-                 regularizing_slab_size=float('inf')):
+                 regularizing_slab_size=float('inf'),
+                 cg_mixed_precision=False):
 
         self.prior_sd_for_unshrunk = prior_sd_for_unshrunk
         self.n_unshrunk = len(prior_sd_for_unshrunk)
@@ -29,7 +32,11 @@ class SparseRegressionCoefficientSampler():
             pc_summary_method='average'
         )
         if sampling_method == 'cg':
-            self.cg_sampler = ConjugateGradientSampler(self.n_unshrunk)
+            self.cg_sampler = ConjugateGradientSampler(
+                self.n_unshrunk, mixed_precision=cg_mixed_precision
+            )
+        elif sampling_method == 'sparse_cholesky':
+            self.sparse_cholesky_sampler = SparseCholeskySampler()
         elif sampling_method in ['hmc', 'nuts']:
             self.stability_adjustment_adapter = \
                 HamiltonianBasedStepsizeAdapter(init_stepsize=.3, target_accept_prob=.95)
@@ -54,21 +61,39 @@ class SparseRegressionCoefficientSampler():
                 setattr(self, attr, state[attr])
 
     def sample_gaussian_posterior(
-            self, y, design, obs_prec, gscale, lscale, method='cg'):
+            self, y, design, obs_prec, gscale, lscale, method='cg',
+            workspace=None, fisher_info=None, fisher_info_sqrt=None, v=None):
         """
         Parameters
         ----------
         beta_init: vector
             Used when when method == 'cg' as the starting value of the
             preconditioned conjugate gradient algorithm.
-        method: {'cholesky', 'cg'}
+        method: {'cholesky', 'sparse_cholesky', 'cg'}
             If 'cholesky', a sample is generated using a cholesky method based on the
-            cholesky linear algebra. If 'cg', the preconditioned conjugate gradient
+            cholesky linear algebra. If 'sparse_cholesky', the same is done
+            with a sparse Cholesky factorization, which requires an uncentered
+            design. If 'cg', the preconditioned conjugate gradient
             sampler is used.
+        workspace: None, WorkspacePool
+        fisher_info: None, numpy array
+            Precomputed X' diag(obs_prec) X, e.g. from the sufficient statistics
+            of the linear model, in which case 'obs_prec' may be a scalar.
+        fisher_info_sqrt: None, numpy array
+            Factor L of fisher_info = L L', used by the CG sampler to draw
+            the target vector without multiplying by X'.
+        v: None, numpy array
+            Precomputed X' diag(obs_prec) y.
         """
         # TODO: Comment on the form of the posterior.
 
-        v = design.Tdot(obs_prec * y)
+        if workspace is None:
+            workspace = WorkspacePool()
+        if v is None:
+            weighted_y = np.multiply(
+                obs_prec, y, out=workspace.get('weighted_y', design.shape[0])
+            )
+            v = design.Tdot(weighted_y)
         prior_shrunk_scale = self.compute_prior_shrunk_scale(gscale, lscale)
         prior_sd = np.concatenate((
             self.prior_sd_for_unshrunk, prior_shrunk_scale
@@ -78,6 +103,10 @@ class SparseRegressionCoefficientSampler():
         info = {}
         if method == 'cholesky':
             beta = generate_gaussian_with_weight(
+                design, obs_prec, prior_prec_sqrt, v, fisher_info=fisher_info)
+
+        elif method == 'sparse_cholesky':
+            beta = self.sparse_cholesky_sampler.sample(
                 design, obs_prec, prior_prec_sqrt, v)
 
         elif method == 'cg':
@@ -89,7 +118,9 @@ class SparseRegressionCoefficientSampler():
                 beta_init=beta_condmean_guess,
                 precond_by='prior',
                 beta_scaled_sd=beta_precond_scale_sd,
-                maxiter=500, atol=10e-6 * np.sqrt(design.shape[1])
+                maxiter=500, atol=10e-6 * np.sqrt(design.shape[1]),
+                workspace=workspace, fisher_info=fisher_info,
+                fisher_info_sqrt=fisher_info_sqrt
             )
             self.regcoef_summarizer.update(beta, gscale, lscale)
             info['n_cg_iter'] = cg_info['n_iter']
@@ -292,15 +323,18 @@ class SparseRegressionCoefficientSampler():
         )
 
         beta_precond = beta / precond_scale
-        model.design.memoize_dot(True)
+        cache_in_use = model.design.memoized
+        if not cache_in_use:
+            model.design.memoize_dot(True)
+                # Avoid matrix-vector multiplication with the same input.
         model.design.reset_matvec_count()
-            # Avoid matrix-vector multiplication with the same input.
         optim_result = sp.optimize.minimize(
             compute_negative_logp, beta_precond, method=optim_method,
             jac=compute_negative_grad, hessp=precond_hessian_matvec,
             options=optim_options
         )
-        model.design.memoize_dot(False)
+        if not cache_in_use:
+            model.design.memoize_dot(False)
         if (not optim_result.success) and warn_optim_failure:
             warn(
                 "The regression coefficient mode (conditionally on the scale "
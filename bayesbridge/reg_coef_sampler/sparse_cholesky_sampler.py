@@ -0,0 +1,106 @@
+from warnings import warn
+import numpy as np
+import scipy as sp
+import scipy.sparse
+import scipy.sparse.linalg
+try:
+    from sksparse.cholmod import analyze as cholmod_analyze
+except ImportError:
+    cholmod_analyze = None
+
+
+class SparseCholeskySampler():
+    """
+    Generate a multi-variate Gaussian with the mean mu and covariance Sigma of
+    the form
+        mu = Sigma z,
+        Sigma^{-1} = X' diag(obs_prec) X + diag(prior_prec_sqrt) ** 2,
+    through a sparse Cholesky factorization of Sigma^{-1}.
+
+    The sparsity pattern of Sigma^{-1} stays the same across the Gibbs
+    iterations, so the fill-reducing ordering is computed on the first call and
+    reused afterward; with CHOLMOD, the whole symbolic analysis is reused and
+    only the numerical factorization is redone.
+    """
+
+    def __init__(self, use_cholmod=True):
+        if use_cholmod and cholmod_analyze is None:
+            warn("Could not load CHOLMOD from scikit-sparse. Will use Scipy's "
+                 "'splu' with a fixed fill-reducing ordering.")
+            use_cholmod = False
+        self.use_cholmod = use_cholmod
+        self._cholmod_factor = None
+        self._perm = None
+
+    def sample(self, X, obs_prec, prior_prec_sqrt, z, rand_gen=None):
+        """
+        Parameters
+        ----------
+            X : design matrix supporting 'compute_sparse_fisher_info'
+            obs_prec : 1-d numpy array
+            prior_prec_sqrt : 1-d numpy array
+        """
+        prec_mat = X.compute_sparse_fisher_info(obs_prec) \
+            + sp.sparse.diags(prior_prec_sqrt ** 2)
+        inv_sqrt_diag_scale = 1 / np.sqrt(prec_mat.diagonal())
+        diag_scale_mat = sp.sparse.diags(inv_sqrt_diag_scale)
+        Phi_scaled = sp.sparse.csc_matrix(
+            diag_scale_mat.dot(prec_mat).dot(diag_scale_mat)
+        )
+        if rand_gen is None:
+            gaussian_vec = np.random.randn(X.shape[1])
+        else:
+            gaussian_vec = rand_gen.np_random.randn(X.shape[1])
+
+        if self.use_cholmod:
+            beta_scaled = self.sample_via_cholmod(
+                Phi_scaled, inv_sqrt_diag_scale * z, gaussian_vec
+            )
+        else:
+            beta_scaled = self.sample_via_splu(
+                Phi_scaled, inv_sqrt_diag_scale * z, gaussian_vec
+            )
+        return inv_sqrt_diag_scale * beta_scaled
+
+    def sample_via_cholmod(self, Phi, z, gaussian_vec):
+        # CHOLMOD factorizes P Phi P' = L L'.
+        if self._cholmod_factor is None:
+            self._cholmod_factor = cholmod_analyze(Phi)
+        factor = self._cholmod_factor
+        factor.cholesky_inplace(Phi)
+        mu = factor(z)
+        noise = factor.apply_Pt(
+            factor.solve_Lt(gaussian_vec, use_LDLt_decomposition=False)
+        )
+        return mu + noise
+
+    def sample_via_splu(self, Phi, z, gaussian_vec):
+        if self._perm is None:
+            self._perm = self.compute_fill_reducing_ordering(Phi)
+        perm = self._perm
+        Phi_perm = Phi[perm, :][:, perm]
+
+        # Without pivoting, the LU of a positive definite matrix is of the form
+        # L (D L') and the symmetric factor is L D^{1/2}.
+        lu = sp.sparse.linalg.splu(
+            Phi_perm, permc_spec='NATURAL', diag_pivot_thresh=0.,
+            options={'SymmetricMode': True}
+        )
+        U = lu.U.tocsr()
+        beta_perm = lu.solve(z[perm])
+        beta_perm += sp.sparse.linalg.spsolve_triangular(
+            U, np.sqrt(U.diagonal()) * gaussian_vec[perm], lower=False
+        )
+        beta = np.empty(len(beta_perm))
+        beta[perm] = beta_perm
+        return beta
+
+    @staticmethod
+    def compute_fill_reducing_ordering(Phi):
+        """ Returns the minimum degree ordering on the pattern of Phi + Phi'
+        as chosen by SuperLU. """
+        lu = sp.sparse.linalg.splu(
+            sp.sparse.csc_matrix(Phi), permc_spec='MMD_AT_PLUS_A',
+            diag_pivot_thresh=0., options={'SymmetricMode': True}
+        )
+        return np.argsort(lu.perm_c)
@@ -0,0 +1,33 @@
+import numpy as np
+
+
+class WorkspacePool():
+    """ Named arrays reused as scratch space across the iterations, so that
+    the repeated likelihood and matrix-vector computations do not allocate
+    new vectors of the size of the data every time.
+
+    The content of an array is overwritten whenever the same name is
+    requested again; the callers must not hold onto the arrays beyond the
+    computation in which they are used.
+    """
+
+    def __init__(self):
+        self._arrays = {}
+
+    def get(self, name, shape, dtype=np.float64):
+        """ Returns an uninitialized array, reusing the one previously
+        allocated under 'name' if its shape and dtype match. """
+        if not hasattr(shape, '__len__'):
+            shape = (shape, )
+        arr = self._arrays.get(name)
+        if arr is None or arr.shape != tuple(shape) or arr.dtype != dtype:
+            arr = np.empty(shape, dtype=dtype)
+            self._arrays[name] = arr
+        return arr
+
+    def clear(self):
+        self._arrays.clear()
+
+    @property
+    def nbytes(self):
+        return sum(arr.nbytes for arr in self._arrays.values())
@@ -1,19 +1,52 @@
+import sys
 from setuptools import setup, find_packages
 from distutils.extension import Extension
 import numpy as np
+try:
+    from Cython.Build import cythonize
+except ImportError:
+    cythonize = None
+
+# The C sources are generated from the Cython ones at build time; without
+# Cython, they must have been generated beforehand (e.g. in a source
+# distribution).
+source_ext = '.c' if cythonize is None else '.pyx'
+
+# The parallel kernels fall back to serial loops when compiled without OpenMP,
+# which Apple's clang does not support out of the box.
+openmp_flags = [] if sys.platform == 'darwin' else ['-fopenmp']
 
 ext_modules = [
     Extension(
         "bayesbridge.random.tilted_stable.tilted_stable",
-        sources=["bayesbridge/random/tilted_stable/tilted_stable.c"],
+        sources=["bayesbridge/random/tilted_stable/tilted_stable" + source_ext],
         include_dirs=[np.get_include()]
     ),
     Extension(
         "bayesbridge.random.polya_gamma.polya_gamma",
-        sources=["bayesbridge/random/polya_gamma/polya_gamma.c"],
-        include_dirs=[np.get_include()]
+        sources=["bayesbridge/random/polya_gamma/polya_gamma" + source_ext],
+        include_dirs=[np.get_include(), "bayesbridge/random/polya_gamma"]
     )
 ]
+ext_modules += [
+    Extension(
+        "bayesbridge.{:s}.{:s}".format(package.replace('/', '.'), module),
+        sources=["bayesbridge/{:s}/{:s}{:s}".format(package, module, source_ext)],
+        include_dirs=[np.get_include()],
+        extra_compile_args=openmp_flags,
+        extra_link_args=openmp_flags
+    )
+    for package, module in [
+        ("design_matrix/cython_matmal", "binary_matmul"),
+        ("design_matrix/cython_matmal", "compact_matmul"),
+        ("design_matrix/cython_matmal", "sparse_fisher"),
+        ("model/cython_kernel", "logistic_kernel"),
+    ]
+]
+if cythonize is not None:
+    ext_modules = cythonize(
+        ext_modules, include_path=["bayesbridge/random/polya_gamma"]
+    )
 
 setup(
     name='bayesbridge',
@@ -0,0 +1,55 @@
+""" Times the Cox model construction, i.e. the sorting of the observations
+and the risk set computations, over a range of sample sizes. The time per
+observation should stay roughly constant, apart from the log factor of the
+sort, if the preprocessing scales linearly.
+
+Usage: python tests/manual_tests/benchmark_cox_preprocessing.py
+"""
+
+import sys
+sys.path.append(".")
+sys.path.append("../..")
+
+import time
+import warnings
+import numpy as np
+import scipy as sp
+import scipy.sparse
+from bayesbridge.model import CoxModel
+
+
+def simulate_coarse_survival_data(n_obs, n_unique_time=1000, censoring_frac=.5,
+                                  seed=0):
+    """ Simulates event and censoring times recorded on a coarse grid so that
+    the ties are common, as with dates in electronic health records. """
+    random_gen = np.random.RandomState(seed)
+    event_time = random_gen.randint(n_unique_time, size=n_obs).astype(float)
+    censoring_time = np.full(n_obs, float('inf'))
+    is_censored = random_gen.uniform(size=n_obs) < censoring_frac
+    censoring_time[is_censored] = event_time[is_censored]
+    event_time[is_censored] = float('inf')
+    X = sp.sparse.csr_matrix(random_gen.binomial(1, .1, size=(n_obs, 1)))
+    return event_time, censoring_time, X
+
+
+def time_model_construction(n_obs, n_repetition=3):
+    event_time, censoring_time, X = simulate_coarse_survival_data(n_obs)
+    elapsed_time = []
+    for _ in range(n_repetition):
+        start_time = time.perf_counter()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            event_time_sorted, censoring_time_sorted, X_sorted = \
+                CoxModel.preprocess_data(event_time, censoring_time, X)
+            CoxModel(event_time_sorted, censoring_time_sorted, X_sorted)
+        elapsed_time.append(time.perf_counter() - start_time)
+    return min(elapsed_time)
+
+
+if __name__ == '__main__':
+    print("{:>10s} {:>12s} {:>16s}".format('n_obs', 'time (sec)', 'usec per obs'))
+    for n_obs in [10 ** 4, 10 ** 5, 10 ** 6]:
+        elapsed_time = time_model_construction(n_obs)
+        print("{:>10d} {:>12.3f} {:>16.3f}".format(
+            n_obs, elapsed_time, 10 ** 6 * elapsed_time / n_obs
+        ))
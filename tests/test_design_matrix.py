@@ -1,9 +1,14 @@
+import pytest
 import numpy as np
 import scipy as sp
 import scipy.sparse
 
-from bayesbridge.design_matrix import SparseDesignMatrix, DenseDesignMatrix
-from simulate_data import simulate_design
+from bayesbridge.design_matrix import SparseDesignMatrix, DenseDesignMatrix, \
+    BinaryDesignMatrix, CategoricalDesignMatrix, ChunkedDesignMatrix, \
+    CompactSparseDesignMatrix, CompositeDesignMatrix, DesignMatrixBuilder, \
+    ShardedDesignMatrix, ColumnPartitionedDesignMatrix
+from bayesbridge.design_matrix.compact_matrix import csr_weighted_gram
+from simulate_data import simulate_design, simulate_binary_design
 
 atol = 10e-6
 rtol = 10e-6
@@ -34,6 +39,113 @@ def test_sparse_design_centered_fisher_info():
     X_ndarray = center_and_add_intercept(X.toarray())
     weight = np.random.exponential(size=n_obs)
     benchmark_fisher_info = X_ndarray.T.dot(weight[:, np.newaxis] * X_ndarray)
+    for use_cython in set([False, X_design.use_cython]):
+        X_design.use_cython = use_cython
+        assert np.allclose(
+            X_design.compute_fisher_info(weight),
+            benchmark_fisher_info,
+            atol=atol, rtol=rtol
+        )
+        assert np.allclose(
+            X_design.compute_fisher_info(weight, diag_only=True),
+            np.diag(benchmark_fisher_info),
+            atol=atol, rtol=rtol
+        )
+    X_squared = X_design.X_main_squared
+    assert np.shares_memory(X_squared.indices, X_design.X_main.indices)
+    assert X_squared is X_design.X_main_squared # Cached
+
+
+
+@pytest.mark.skipif(csr_weighted_gram is None, reason="Compiled kernel not available.")
+def test_csr_weighted_gram():
+
+    n_obs, n_pred = (50, 12)
+    X = simulate_design(n_obs, n_pred, binary_frac=.5, format_='sparse').tocsr()
+    # Append a duplicate entry to make the CSR matrix non-canonical.
+    X = sp.sparse.csr_matrix(
+        (np.append(X.data, 2.), np.append(X.indices, X.indices[0]),
+         np.append(X.indptr[:-1], X.nnz + 1)),
+        shape=X.shape
+    )
+    weight = np.random.exponential(size=n_obs)
+    X_ndarray = X.toarray()
+    for n_thread in [1, 3, n_pred + 1]:
+        gram, col_sum = csr_weighted_gram(
+            X.data, X.indices, X.indptr, weight, n_pred, n_thread=n_thread
+        )
+        assert np.allclose(gram, X_ndarray.T.dot(weight[:, np.newaxis] * X_ndarray))
+        assert np.allclose(col_sum, X_ndarray.T.dot(weight))
+
+def test_dense_design_intercept_and_centering():
+
+    n_obs, n_pred = (100, 10)
+    X = simulate_design(n_obs, n_pred, binary_frac=.5, format_='dense')
+    X_design = DenseDesignMatrix(X, center_predictor=True, add_intercept=True)
+    X_ndarray = center_and_add_intercept(X)
+    w, v = (np.random.randn(size) for size in X_design.shape)
+    assert np.allclose(
+        X_design.dot(v), X_ndarray.dot(v), atol=atol, rtol=rtol
+    )
+    assert np.allclose(
+        X_design.Tdot(w), X_ndarray.T.dot(w), atol=atol, rtol=rtol
+    )
+
+
+def test_binary_design_matvec_and_fisher_info():
+
+    n_obs, n_pred = (100, 10)
+    X = sp.sparse.csr_matrix(simulate_binary_design(n_obs, n_pred, .2))
+    X_design = BinaryDesignMatrix(X, center_predictor=True, add_intercept=True)
+    X_ndarray = center_and_add_intercept(X.toarray())
+    w, v = (np.random.randn(size) for size in X_design.shape)
+    weight = np.random.exponential(size=n_obs)
+    benchmark_fisher_info = X_ndarray.T.dot(weight[:, np.newaxis] * X_ndarray)
+    for use_cython in set([False, X_design.use_cython]):
+        X_design.use_cython = use_cython
+        assert np.allclose(
+            X_design.dot(v), X_ndarray.dot(v), atol=atol, rtol=rtol
+        )
+        assert np.allclose(
+            X_design.Tdot(w), X_ndarray.T.dot(w), atol=atol, rtol=rtol
+        )
+        assert np.allclose(
+            X_design.compute_fisher_info(weight),
+            benchmark_fisher_info,
+            atol=atol, rtol=rtol
+        )
+        assert np.allclose(
+            X_design.compute_fisher_info(weight, diag_only=True),
+            np.diag(benchmark_fisher_info),
+            atol=atol, rtol=rtol
+        )
+
+
+def test_categorical_design_matvec_and_fisher_info():
+
+    n_obs, n_category = (100, np.array([4, 3, 5]))
+    codes = np.stack([
+        np.random.randint(n_cat, size=n_obs) for n_cat in n_category
+    ], axis=1)
+    X_design = CategoricalDesignMatrix(
+        codes, n_category, center_predictor=True, add_intercept=True
+    )
+    one_hot = np.hstack([
+        (codes[:, [j]] == np.arange(1, n_cat)[np.newaxis, :]).astype(float)
+        for j, n_cat in enumerate(n_category)
+    ])
+    X_ndarray = center_and_add_intercept(one_hot)
+    assert np.allclose(X_design.toarray(), X_ndarray)
+
+    w, v = (np.random.randn(size) for size in X_design.shape)
+    assert np.allclose(
+        X_design.dot(v), X_ndarray.dot(v), atol=atol, rtol=rtol
+    )
+    assert np.allclose(
+        X_design.Tdot(w), X_ndarray.T.dot(w), atol=atol, rtol=rtol
+    )
+    weight = np.random.exponential(size=n_obs)
+    benchmark_fisher_info = X_ndarray.T.dot(weight[:, np.newaxis] * X_ndarray)
     assert np.allclose(
         X_design.compute_fisher_info(weight),
         benchmark_fisher_info,
@@ -45,29 +157,584 @@ def test_sparse_design_centered_fisher_info():
         atol=atol, rtol=rtol
     )
 
+    # Unobserved categories are dropped instead of giving all-zero columns.
+    codes = np.random.choice([0, 1, 3], size=(n_obs, 1))
+    with pytest.warns(UserWarning, match='Unobserved categories'):
+        X_design = CategoricalDesignMatrix(
+            codes, n_category=[5], scale_predictor=True, add_intercept=False
+        )
+    assert np.all(X_design.category_index[0] == np.array([1, 3]))
+    one_hot = (codes == np.array([[1, 3]])).astype(float)
+    one_hot /= np.std(one_hot, axis=0)
+    assert np.allclose(X_design.toarray(), one_hot)
+    v = np.random.randn(X_design.shape[1])
+    assert np.allclose(X_design.dot(v), one_hot.dot(v))
 
-def test_dense_design_intercept_and_centering():
+
+def test_dense_design_fisher_info():
 
     n_obs, n_pred = (100, 10)
     X = simulate_design(n_obs, n_pred, binary_frac=.5, format_='dense')
     X_design = DenseDesignMatrix(X, center_predictor=True, add_intercept=True)
     X_ndarray = center_and_add_intercept(X)
-    w, v = (np.random.randn(size) for size in X_design.shape)
-    assert np.allclose(
-        X_design.dot(v), X_ndarray.dot(v), atol=atol, rtol=rtol
-    )
-    assert np.allclose(
-        X_design.Tdot(w), X_ndarray.T.dot(w), atol=atol, rtol=rtol
-    )
+    for i in range(2): # Second time with the allocated workspace.
+        weight = np.random.exponential(size=n_obs)
+        benchmark_fisher_info = X_ndarray.T.dot(weight[:, np.newaxis] * X_ndarray)
+        assert np.allclose(
+            X_design.compute_fisher_info(weight),
+            benchmark_fisher_info,
+            atol=atol, rtol=rtol
+        )
+        assert np.allclose(
+            X_design.compute_fisher_info(weight, diag_only=True),
+            np.diag(benchmark_fisher_info),
+            atol=atol, rtol=rtol
+        )
 
 
 def center_and_add_intercept(X):
-    X -= X.mean(axis=0)[np.newaxis, :]
+    X = X - X.mean(axis=0)[np.newaxis, :]
     intercept_column = np.ones((X.shape[0], 1))
     X = np.hstack((intercept_column, X))
     return X
 
 
+def test_lazy_column_scaling():
+
+    n_obs, n_pred = (100, 10)
+    X = simulate_design(n_obs, n_pred, binary_frac=.5, format_='sparse')
+    X_ndarray = center_and_add_intercept(X.toarray())
+    col_sd = np.std(X_ndarray[:, 1:], axis=0)
+    X_ndarray[:, 1:] /= col_sd[np.newaxis, :]
+    X_binary = sp.sparse.csr_matrix(simulate_binary_design(n_obs, n_pred, .2))
+    X_binary_ndarray = center_and_add_intercept(X_binary.toarray())
+    X_binary_ndarray[:, 1:] /= np.std(X_binary_ndarray[:, 1:], axis=0)
+    test_cases = [
+        (SparseDesignMatrix(X, center_predictor=True, scale_predictor=True), X_ndarray),
+        (DenseDesignMatrix(X.toarray(), center_predictor=True, scale_predictor=True), X_ndarray),
+        (BinaryDesignMatrix(X_binary, center_predictor=True, scale_predictor=True), X_binary_ndarray)
+    ]
+    w, v = (np.random.randn(size) for size in X_ndarray.shape)
+    weight = np.random.exponential(size=n_obs)
+    for X_design, X_benchmark in test_cases:
+        benchmark_fisher_info \
+            = X_benchmark.T.dot(weight[:, np.newaxis] * X_benchmark)
+        assert np.allclose(X_design.toarray(), X_benchmark)
+        assert np.allclose(
+            X_design.dot(v), X_benchmark.dot(v), atol=atol, rtol=rtol
+        )
+        assert np.allclose(
+            X_design.Tdot(w), X_benchmark.T.dot(w), atol=atol, rtol=rtol
+        )
+        assert np.allclose(
+            X_design.compute_fisher_info(weight),
+            benchmark_fisher_info,
+            atol=atol, rtol=rtol
+        )
+        assert np.allclose(
+            X_design.compute_fisher_info(weight, diag_only=True),
+            np.diag(benchmark_fisher_info),
+            atol=atol, rtol=rtol
+        )
+
+    X_design = test_cases[0][0]
+    assert np.allclose(X_design.unscale_coef(v)[1:], v[1:] / col_sd)
+
+
+def test_compact_sparse_design(monkeypatch):
+
+    n_obs, n_pred = (100, 10)
+    X = simulate_design(n_obs, n_pred, binary_frac=.5, format_='sparse')
+    X.data = np.round(4 * X.data) # Small integer entries
+    X_ndarray = center_and_add_intercept(X.toarray())
+    w, v = (np.random.randn(size) for size in X_ndarray.shape)
+    weight = np.random.exponential(size=n_obs)
+    benchmark_fisher_info = X_ndarray.T.dot(weight[:, np.newaxis] * X_ndarray)
+    monkeypatch.setattr(CompactSparseDesignMatrix, 'max_block_width', 4)
+        # Test multiple column blocks.
+    monkeypatch.setattr(CompactSparseDesignMatrix, 'max_chunk_nnz', 50)
+        # Test multiple row chunks in the upcasting.
+    for data_dtype in [np.float32, np.int8]:
+        X_design = CompactSparseDesignMatrix(
+            X, data_dtype=data_dtype, center_predictor=True, add_intercept=True
+        )
+        assert len(X_design.blocks) == 3
+        for use_cython in set([False, X_design.use_cython]):
+            X_design.use_cython = use_cython
+            assert np.allclose(
+                X_design.dot(v), X_ndarray.dot(v), atol=atol, rtol=rtol
+            )
+            assert np.allclose(
+                X_design.Tdot(w), X_ndarray.T.dot(w), atol=atol, rtol=rtol
+            )
+            assert np.allclose(
+                X_design.compute_fisher_info(weight),
+                benchmark_fisher_info,
+                atol=atol, rtol=rtol
+            )
+            assert np.allclose(
+                X_design.compute_fisher_info(weight, diag_only=True),
+                np.diag(benchmark_fisher_info),
+                atol=atol, rtol=rtol
+            )
+        X_uncentered = CompactSparseDesignMatrix(X, data_dtype=data_dtype)
+        assert np.allclose(
+            X_uncentered.compute_sparse_fisher_info(weight).toarray(),
+            X_uncentered.compute_fisher_info(weight)
+        )
+
+    # Single column block, for which the Fisher information is computed
+    # directly from the compact storage.
+    monkeypatch.undo()
+    X_design = CompactSparseDesignMatrix(
+        X, data_dtype=np.int8, center_predictor=True, add_intercept=True
+    )
+    assert X_design.blocks[0][1].dtype == np.uint16
+    assert np.allclose(
+        X_design.compute_fisher_info(weight), benchmark_fisher_info,
+        atol=atol, rtol=rtol
+    )
+
+    X.data[0] = .5
+    with pytest.raises(ValueError):
+        CompactSparseDesignMatrix(X, data_dtype=np.uint8)
+
+
+def test_memory_mapped_design(tmp_path):
+
+    n_obs, n_pred = (100, 10)
+    X = simulate_design(n_obs, n_pred, binary_frac=.5, format_='sparse')
+    X_ndarray = center_and_add_intercept(X.toarray())
+    for name in ['data', 'indices', 'indptr']:
+        np.save(tmp_path / (name + '.npy'), getattr(X, name))
+    np.save(tmp_path / 'dense.npy', X.toarray())
+
+    X_sparse = SparseDesignMatrix.from_npy(
+        *[str(tmp_path / (name + '.npy')) for name in ['data', 'indices', 'indptr']],
+        shape=X.shape, center_predictor=True, add_intercept=True
+    )
+    X_dense = DenseDesignMatrix.from_npy(
+        str(tmp_path / 'dense.npy'), center_predictor=True, add_intercept=True
+    )
+    assert isinstance(X_dense.X_main, np.memmap)
+    assert not X_sparse.X_main.data.flags.writeable
+    X_dense.max_chunk_size = 3 * n_pred # Forces multiple chunks of rows.
+
+    w, v = (np.random.randn(size) for size in X_ndarray.shape)
+    weight = np.random.exponential(size=n_obs)
+    benchmark_fisher_info = X_ndarray.T.dot(weight[:, np.newaxis] * X_ndarray)
+    for X_design in [X_sparse, X_dense]:
+        assert np.allclose(
+            X_design.dot(v), X_ndarray.dot(v), atol=atol, rtol=rtol
+        )
+        assert np.allclose(
+            X_design.Tdot(w), X_ndarray.T.dot(w), atol=atol, rtol=rtol
+        )
+        assert np.allclose(
+            X_design.compute_fisher_info(weight),
+            benchmark_fisher_info,
+            atol=atol, rtol=rtol
+        )
+        assert np.allclose(
+            X_design.compute_fisher_info(weight, diag_only=True),
+            np.diag(benchmark_fisher_info),
+            atol=atol, rtol=rtol
+        )
+    # No in-memory copy of the memory-mapped X is retained.
+    assert X_dense._fisher_workspace is None
+    assert X_dense._X_main_squared is None
+
+
+def test_chunked_design(tmp_path):
+
+    n_obs, n_pred = (100, 10)
+    X = simulate_design(n_obs, n_pred, binary_frac=.5, format_='sparse')
+    X = sp.sparse.hstack([X, np.ones((n_obs, 1))]).tocsr()
+        # Constant column to be excluded.
+    X_ndarray = center_and_add_intercept(X.toarray()[:, :-1])
+    row_split = [0, 30, 31, 75, n_obs]
+    sparse_files, dense_files = [], []
+    for k in range(len(row_split) - 1):
+        X_shard = X[row_split[k]:row_split[k + 1], :]
+        sparse_files.append(str(tmp_path / 'shard{:d}.npz'.format(k)))
+        sp.sparse.save_npz(sparse_files[-1], X_shard)
+        dense_files.append(str(tmp_path / 'shard{:d}.npy'.format(k)))
+        np.save(dense_files[-1], X_shard.toarray())
+
+    w, v = (np.random.randn(size) for size in X_ndarray.shape)
+    weight = np.random.exponential(size=n_obs)
+    benchmark_fisher_info = X_ndarray.T.dot(weight[:, np.newaxis] * X_ndarray)
+    for shard_files in [sparse_files, dense_files]:
+        X_design = ChunkedDesignMatrix(
+            shard_files, center_predictor=True, add_intercept=True
+        )
+        assert X_design.shape == X_ndarray.shape
+        assert np.allclose(X_design.toarray(), X_ndarray)
+        assert np.allclose(
+            X_design.dot(v), X_ndarray.dot(v), atol=atol, rtol=rtol
+        )
+        assert np.allclose(
+            X_design.Tdot(w), X_ndarray.T.dot(w), atol=atol, rtol=rtol
+        )
+        assert np.allclose(
+            X_design.compute_fisher_info(weight),
+            benchmark_fisher_info,
+            atol=atol, rtol=rtol
+        )
+        assert np.allclose(
+            X_design.compute_fisher_info(weight, diag_only=True),
+            np.diag(benchmark_fisher_info),
+            atol=atol, rtol=rtol
+        )
+
+
+def test_streaming_column_moments():
+
+    n_obs, n_pred = (100, 10)
+    X = simulate_design(n_obs, n_pred, binary_frac=.5, format_='dense')
+    for X_input in [X, sp.sparse.csr_matrix(X)]:
+        col_mean, col_var = DenseDesignMatrix.compute_column_moments(
+            X_input, n_row_per_chunk=7
+        )
+        assert np.allclose(col_mean, np.mean(X, axis=0))
+        assert np.allclose(col_var, np.var(X, axis=0))
+
+
+def test_matvec_cache():
+
+    n_obs, n_pred = (20, 5)
+    X = simulate_design(n_obs, n_pred, binary_frac=.5, format_='sparse')
+    X_design = SparseDesignMatrix(X, center_predictor=True, add_intercept=True)
+    X_design.memoize_dot(True, cache_size=2)
+    v_list = [np.random.randn(n_pred + 1) for i in range(3)]
+    Xv_list = [X_design.dot(v) for v in v_list]
+    w = np.random.randn(n_obs)
+    Xw = X_design.Tdot(w)
+    assert X_design.cache_info().currsize == 2
+
+    Xv_list[2][:] = 0. # Cached results must not be affected.
+    assert np.allclose(X_design.dot(v_list[2]), X_design.toarray().dot(v_list[2]))
+    assert np.allclose(X_design.Tdot(w), Xw)
+    assert X_design.get_dot_count() == (3, 1)
+    X_design.dot(v_list[0]) # Evicted
+    assert X_design.get_dot_count() == (4, 1)
+    assert X_design.cache_info()[:2] == (2, 5)
+
+    X_design.memoize_dot(False)
+    assert X_design.cache_info() is None
+
+
+def test_matvec_with_output_array():
+
+    n_obs, n_pred = (20, 6)
+    X = simulate_design(n_obs, n_pred, binary_frac=.5, format_='sparse')
+    X_binary = sp.sparse.csr_matrix(simulate_binary_design(n_obs, n_pred, .2))
+    designs = [
+        SparseDesignMatrix(X, use_mkl=False, center_predictor=True),
+        DenseDesignMatrix(X.toarray(), center_predictor=True, scale_predictor=True),
+        BinaryDesignMatrix(X_binary, center_predictor=True),
+        CategoricalDesignMatrix(np.random.randint(3, size=(n_obs, 2))),
+    ]
+    for X_design in designs:
+        X_ndarray = X_design.toarray()
+        v = np.random.randn(X_design.shape[1])
+        w = np.random.randn(n_obs)
+        out = np.full(n_obs, np.nan)
+        assert X_design.dot(v, out=out) is out
+        assert np.allclose(out, X_ndarray.dot(v), atol=atol, rtol=rtol)
+        out = np.full(X_design.shape[1], np.nan)
+        assert X_design.Tdot(w, out=out) is out
+        assert np.allclose(out, X_ndarray.T.dot(w), atol=atol, rtol=rtol)
+
+
+def test_design_matrix_builder(monkeypatch):
+
+    n_obs, n_pred = (30, 6)
+    X = simulate_design(n_obs, n_pred, binary_frac=.5, format_='sparse').toarray()
+    X = np.hstack((X, np.ones((n_obs, 1)), np.zeros((n_obs, 1)), X[:, [2]]))
+    builder = DesignMatrixBuilder(X.shape[1])
+    builder.add_rows(X[:10])
+    builder.add_rows(sp.sparse.csr_matrix(X[10:25]))
+    # Non-canonical COO input with each entry split into two and with
+    # repeated entries cancelling out in the all-zero column.
+    X_coo = sp.sparse.coo_matrix(X[25:])
+    row = np.concatenate((X_coo.row, X_coo.row[::-1], [0, 0]))
+    col = np.concatenate((X_coo.col, X_coo.col[::-1], [n_pred + 1, n_pred + 1]))
+    data = np.concatenate((X_coo.data / 2, X_coo.data[::-1] / 2, [1., -1.]))
+    builder.add_coo(row, col, data, X_coo.shape[0])
+    assert np.allclose(builder.col_mean, np.mean(X, 0))
+    assert np.allclose(builder.col_variance, np.var(X, 0))
+    assert np.array_equal(builder._col_nnz, np.count_nonzero(X, axis=0))
+
+    with pytest.warns(UserWarning):
+        X_built = builder.build()
+    assert list(builder.removed_columns['constant']) == [n_pred]
+    assert list(builder.removed_columns['zero']) == [n_pred + 1]
+    assert builder.removed_columns['duplicate'] == {n_pred + 2: 2}
+    assert np.array_equal(builder.column_index, np.arange(n_pred))
+    assert np.array_equal(X_built.toarray(), X[:, :n_pred])
+    assert X_built.has_canonical_format
+
+    # The design matrix reuses the column moments computed by the builder.
+    builder = DesignMatrixBuilder(X.shape[1]).add_rows(X)
+    def fail(*args, **kwargs):
+        raise AssertionError("Column moments recomputed.")
+    monkeypatch.setattr(SparseDesignMatrix, 'compute_column_moments', fail)
+    with pytest.warns(UserWarning):
+        X_design = builder.build_design_matrix(
+            use_mkl=False, center_predictor=True, scale_predictor=True
+        )
+    assert np.allclose(
+        X_design.toarray()[:, 1:],
+        (X[:, :n_pred] - np.mean(X[:, :n_pred], 0)) / np.std(X[:, :n_pred], 0)
+    )
+
+
+def test_composite_design():
+
+    n_obs = 40
+    X_dense = np.random.randn(n_obs, 3)
+    X_sparse = simulate_design(n_obs, 8, binary_frac=.5, format_='sparse')
+    X_binary = sp.sparse.csr_matrix(simulate_binary_design(n_obs, 5, .2))
+    blocks = [
+        DenseDesignMatrix(X_dense, center_predictor=True, add_intercept=False),
+        SparseDesignMatrix(
+            X_sparse, use_mkl=False, center_predictor=True,
+            add_intercept=False, scale_predictor=True
+        ),
+        BinaryDesignMatrix(X_binary, add_intercept=False),
+        CategoricalDesignMatrix(np.random.randint(3, size=(n_obs, 2)), add_intercept=False),
+    ]
+    X_design = CompositeDesignMatrix(blocks, add_intercept=True)
+    X_ndarray = np.hstack(
+        [np.ones((n_obs, 1))] + [block.toarray() for block in blocks]
+    )
+    assert np.allclose(X_design.toarray(), X_ndarray)
+
+    v = np.random.randn(X_design.shape[1])
+    w = np.random.randn(n_obs)
+    assert np.allclose(X_design.dot(v), X_ndarray.dot(v), atol=atol, rtol=rtol)
+    assert np.allclose(X_design.Tdot(w), X_ndarray.T.dot(w), atol=atol, rtol=rtol)
+
+    weight = np.random.exponential(size=n_obs)
+    benchmark_fisher_info = X_ndarray.T.dot(weight[:, np.newaxis] * X_ndarray)
+    assert np.allclose(
+        X_design.compute_fisher_info(weight), benchmark_fisher_info,
+        atol=atol, rtol=rtol
+    )
+    X_design.max_cross_workspace_size = 2 * n_obs # Forces the chunking.
+    assert np.allclose(
+        X_design.compute_fisher_info(weight), benchmark_fisher_info,
+        atol=atol, rtol=rtol
+    )
+    assert np.allclose(
+        X_design.compute_fisher_info(weight, diag_only=True),
+        np.diag(benchmark_fisher_info), atol=atol, rtol=rtol
+    )
+    with pytest.raises(ValueError):
+        CompositeDesignMatrix([DenseDesignMatrix(X_dense)])
+
+
+def test_block_matvec(tmp_path):
+
+    n_obs, n_pred, n_vec = (25, 6, 3)
+    X = simulate_design(n_obs, n_pred, binary_frac=.5, format_='sparse')
+    X_binary = sp.sparse.csr_matrix(simulate_binary_design(n_obs, n_pred, .2))
+    shard_files = []
+    for k, rows in enumerate([slice(0, 10), slice(10, n_obs)]):
+        filename = str(tmp_path / 'shard{:d}.npz'.format(k))
+        sp.sparse.save_npz(filename, X[rows])
+        shard_files.append(filename)
+    designs = [
+        SparseDesignMatrix(X, use_mkl=False, center_predictor=True, scale_predictor=True),
+        DenseDesignMatrix(X.toarray(), center_predictor=True),
+        BinaryDesignMatrix(X_binary, center_predictor=True),
+        CategoricalDesignMatrix(np.random.randint(3, size=(n_obs, 2))),
+        CompactSparseDesignMatrix(X, center_predictor=True),
+        ChunkedDesignMatrix(shard_files, center_predictor=True),
+        CompositeDesignMatrix([
+            DenseDesignMatrix(X.toarray(), add_intercept=False),
+            BinaryDesignMatrix(X_binary, add_intercept=False)
+        ]),
+    ]
+    for X_design in designs:
+        X_ndarray = X_design.toarray()
+        V = np.random.randn(X_design.shape[1], n_vec)
+        U = np.random.randn(n_obs, n_vec)
+        assert np.allclose(
+            X_design.dot_block(V), X_ndarray.dot(V), atol=atol, rtol=rtol
+        )
+        assert np.allclose(
+            X_design.Tdot_block(U), X_ndarray.T.dot(U), atol=atol, rtol=rtol
+        )
+
+
+def test_int64_index(monkeypatch):
+    # A design actually exceeding 2 ** 31 non-zeros would take tens of GB,
+    # so the 64-bit code paths are exercised on small matrices instead.
+
+    n_obs, n_pred = (30, 8)
+    X = simulate_design(n_obs, n_pred, binary_frac=.5, format_='sparse')
+    X.indices = X.indices.astype(np.int64)
+    X.indptr = X.indptr.astype(np.int64)
+    X_design = SparseDesignMatrix(X, center_predictor=True, add_intercept=True)
+    assert X_design.X_main.indices.dtype == np.int64
+    assert not X_design.use_mkl
+    X_ndarray = X_design.toarray()
+    v = np.random.randn(X_design.shape[1])
+    w = np.random.exponential(size=n_obs)
+    for use_cython in set([False, X_design.use_cython]):
+        X_design.use_cython = use_cython
+        X_design.use_matvec_kernel = \
+            use_cython and X_design.is_supported_by_matvec_kernel(X)
+        assert np.allclose(X_design.dot(v), X_ndarray.dot(v))
+        assert np.allclose(X_design.Tdot(w), X_ndarray.T.dot(w))
+        assert np.allclose(
+            X_design.compute_fisher_info(w),
+            X_ndarray.T.dot(w[:, np.newaxis] * X_ndarray)
+        )
+
+    monkeypatch.setattr(SparseDesignMatrix, 'max_int32_index', 10)
+    X_binary = sp.sparse.csr_matrix(simulate_binary_design(n_obs, n_pred, .2))
+    X_design = BinaryDesignMatrix(X_binary, add_intercept=False)
+    assert X_design.indices.dtype == np.int64
+    for use_cython in set([False, X_design.use_cython]):
+        X_design.use_cython = use_cython
+        assert np.allclose(X_design.dot(v[1:]), X_binary.dot(v[1:]))
+        assert np.allclose(X_design.Tdot(w), X_binary.T.dot(w))
+
+
+@pytest.mark.parametrize('reorder', ['rcm', 'nnz'])
+def test_reordered_sparse_design(reorder):
+
+    n_obs, n_pred = (60, 15)
+    X = simulate_design(n_obs, n_pred, binary_frac=.5, format_='sparse')
+    X_ref = SparseDesignMatrix(
+        X, center_predictor=True, scale_predictor=True, add_intercept=True
+    )
+    X_design = SparseDesignMatrix(
+        X, center_predictor=True, scale_predictor=True, add_intercept=True,
+        reorder=reorder
+    )
+    assert X_design.col_perm is not None
+    assert np.all(np.diff(X_design.X_main.indptr) >= 0)
+    assert X_design.X_main.has_sorted_indices
+    X_ndarray = X_ref.toarray()
+    assert np.allclose(X_design.toarray(), X_ndarray)
+
+    v = np.random.randn(X_design.shape[1])
+    w = np.random.exponential(size=n_obs)
+    assert np.allclose(X_design.dot(v), X_ndarray.dot(v))
+    assert np.allclose(X_design.Tdot(w), X_ndarray.T.dot(w))
+    assert np.allclose(
+        X_design.compute_fisher_info(w),
+        X_ndarray.T.dot(w[:, np.newaxis] * X_ndarray)
+    )
+    assert np.allclose(
+        X_design.compute_fisher_info(w, diag_only=True),
+        np.sum(w[:, np.newaxis] * X_ndarray ** 2, axis=0)
+    )
+    V = np.random.randn(X_design.shape[1], 3)
+    U = np.random.randn(n_obs, 3)
+    assert np.allclose(X_design.dot_block(V), X_ndarray.dot(V))
+    assert np.allclose(X_design.Tdot_block(U), X_ndarray.T.dot(U))
+
+
+@pytest.mark.parametrize('format_', ['sparse', 'dense'])
+def test_sharded_design(format_):
+
+    n_obs, n_pred = (50, 8)
+    X = simulate_design(n_obs, n_pred, binary_frac=.5, format_=format_)
+    X_ref = (SparseDesignMatrix if format_ == 'sparse' else DenseDesignMatrix)(
+        X, center_predictor=True, scale_predictor=True, add_intercept=True
+    )
+    X_ndarray = X_ref.toarray()
+    v = np.random.randn(X_ref.shape[1])
+    w = np.random.exponential(size=n_obs)
+    with ShardedDesignMatrix(
+            X, n_worker=3, center_predictor=True, scale_predictor=True,
+            add_intercept=True) as X_design:
+        assert X_design.n_worker == 3
+        assert np.allclose(X_design.toarray(), X_ndarray)
+        assert np.allclose(X_design.dot(v), X_ndarray.dot(v))
+        assert np.allclose(X_design.Tdot(w), X_ndarray.T.dot(w))
+        assert np.allclose(
+            X_design.compute_fisher_info(w),
+            X_ndarray.T.dot(w[:, np.newaxis] * X_ndarray)
+        )
+        assert np.allclose(
+            X_design.compute_fisher_info(w, diag_only=True),
+            np.sum(w[:, np.newaxis] * X_ndarray ** 2, axis=0)
+        )
+    with pytest.raises(RuntimeError):
+        X_design.dot(v)
+
+
+def test_sharded_logistic_likelihood():
+
+    from bayesbridge.model import LogisticModel
+    from bayesbridge.random import BasicRandom
+    n_obs, n_pred = (60, 8)
+    X = simulate_design(n_obs, n_pred, binary_frac=.5, format_='sparse')
+    n_trial = np.random.randint(1, 4, size=n_obs).astype(float)
+    n_success = np.random.binomial(n_trial.astype(int), .5).astype(float)
+    beta = np.random.randn(n_pred + 1)
+    design_kwargs = {
+        'center_predictor': True, 'scale_predictor': True, 'add_intercept': True
+    }
+    model_ref = LogisticModel(
+        n_success, n_trial, SparseDesignMatrix(X, **design_kwargs)
+    )
+    loglik_ref, grad_ref = model_ref.compute_loglik_and_gradient(beta)
+    with ShardedDesignMatrix(X, n_worker=3, **design_kwargs) as X_design:
+        model = LogisticModel(n_success, n_trial, X_design)
+        loglik, grad = model.compute_loglik_and_gradient(beta)
+        assert np.allclose(loglik, loglik_ref)
+        assert np.allclose(grad, grad_ref)
+        assert np.allclose(
+            model.compute_loglik_and_gradient(beta, loglik_only=True)[0],
+            loglik_ref
+        )
+        omega = model.sample_polya_gamma(beta, BasicRandom(seed=0))
+        assert omega.shape == (n_obs,)
+        assert np.all(np.isfinite(omega)) and np.all(omega > 0)
+
+
+def test_column_partitioned_design():
+
+    n_obs, n_pred = (20, 60)
+    X = simulate_design(n_obs, n_pred, binary_frac=.5, format_='sparse')
+    X_ref = SparseDesignMatrix(
+        X, use_mkl=False, center_predictor=True, scale_predictor=True
+    )
+    X_design = ColumnPartitionedDesignMatrix(
+        X, n_thread=4, center_predictor=True, scale_predictor=True
+    )
+    assert X_design.n_block == 4
+    assert all(sp.sparse.isspmatrix_csc(X_block) for X_block in X_design.blocks)
+    X_ndarray = X_ref.toarray()
+    assert np.allclose(X_design.toarray(), X_ndarray)
+
+    v = np.random.randn(X_design.shape[1])
+    w = np.random.exponential(size=n_obs)
+    assert np.allclose(X_design.dot(v), X_ndarray.dot(v))
+    assert np.allclose(X_design.Tdot(w), X_ndarray.T.dot(w))
+    Tdot_result = np.empty(X_design.shape[1])
+    assert X_design.Tdot(w, out=Tdot_result) is Tdot_result
+    assert np.allclose(
+        X_design.compute_fisher_info(w),
+        X_ndarray.T.dot(w[:, np.newaxis] * X_ndarray)
+    )
+    assert np.allclose(
+        X_design.compute_fisher_info(w, diag_only=True),
+        np.sum(w[:, np.newaxis] * X_ndarray ** 2, axis=0)
+    )
+    V = np.random.randn(X_design.shape[1], 3)
+    U = np.random.randn(n_obs, 3)
+    assert np.allclose(X_design.dot_block(V), X_ndarray.dot(V))
+    assert np.allclose(X_design.Tdot_block(U), X_ndarray.T.dot(U))
+
+
 def test_intercept_removal():
 
     n_obs, n_pred = (100, 10)
@@ -2,15 +2,19 @@ import sys
 sys.path.append(".") # needed if pytest called from the parent directory
 sys.path.append("..") # needed if pytest called from this directory.
 
+import pytest
 import numpy as np
 import numpy.random
 import scipy as sp
 import scipy.sparse
+import scipy.special
 from functools import partial
 from .derivative_tester \
     import numerical_grad_is_close, numerical_direc_deriv_is_close
 from .helper import simulate_data
-from bayesbridge.model import LinearModel, LogisticModel, CoxModel
+from bayesbridge.model import LinearModel, LogisticModel, CoxModel, \
+    RegressionModel
+from bayesbridge.design_matrix import DenseDesignMatrix
 
 
 def test_linear_model_gradient_and_hessian():
@@ -23,6 +27,23 @@ def test_linear_model_gradient_and_hessian():
     assert numerical_direc_deriv_is_close(f, beta, hessian_matvec, seed=0)
 
 
+def test_linear_model_sufficient_stat():
+    y, X, beta = simulate_data(model='linear', seed=0, return_design_mat=True)
+    obs_prec = 2.
+    linear_model = LinearModel(y, X)
+    suff_stat_model = LinearModel(y, X, use_sufficient_stat=True)
+    loglik, grad = linear_model.compute_loglik_and_gradient(beta, obs_prec)
+    suff_stat_loglik, suff_stat_grad = \
+        suff_stat_model.compute_loglik_and_gradient(beta, obs_prec)
+    assert np.allclose(loglik, suff_stat_loglik)
+    assert np.allclose(grad, suff_stat_grad)
+    v = np.random.randn(len(beta))
+    assert np.allclose(
+        linear_model.get_hessian_matvec_operator(beta, obs_prec)(v),
+        suff_stat_model.get_hessian_matvec_operator(beta, obs_prec)(v)
+    )
+
+
 def test_logitstic_model_hessian_matvec():
     y, X, beta = simulate_data(model='logit', seed=0, return_design_mat=True)
     n_success, n_trial = y
@@ -31,6 +52,45 @@ def test_logitstic_model_hessian_matvec():
     hessian_matvec = logit_model.get_hessian_matvec_operator(beta)
     assert numerical_direc_deriv_is_close(f, beta, hessian_matvec, seed=0)
 
+    # The operator keeps using the weights at its own beta.
+    v = np.random.randn(len(beta))
+    hessian_v = hessian_matvec(v)
+    logit_model.get_hessian_matvec_operator(2 * beta)
+    assert np.allclose(hessian_matvec(v), hessian_v)
+
+
+@pytest.mark.parametrize('use_cython', [True, False])
+def test_logistic_model_fused_kernels(use_cython):
+    logit_prob = np.concatenate((
+        [-800., -40., 0., 40., 800.], np.random.RandomState(0).randn(20)
+    ))
+    n_trial = np.random.RandomState(1).randint(1, 5, size=len(logit_prob))
+    n_success = np.floor(n_trial / 2)
+    design = DenseDesignMatrix(logit_prob[:, np.newaxis], add_intercept=False)
+    logit_model = LogisticModel(n_success, n_trial, design)
+    if use_cython and not logit_model.use_cython:
+        pytest.skip("The compiled logistic kernels are not available.")
+    logit_model.use_cython = use_cython
+    beta = np.ones(1)
+
+    log_partition = np.logaddexp(0, logit_prob)
+    predicted_prob = sp.special.expit(logit_prob)
+    loglik, grad = logit_model.compute_loglik_and_gradient(beta)
+    assert np.isfinite(loglik)
+    assert np.allclose(
+        loglik, np.inner(n_success, logit_prob) - np.inner(n_trial, log_partition)
+    )
+    assert np.allclose(
+        grad, logit_prob.dot(n_success - n_trial * predicted_prob)
+    )
+    assert np.allclose(
+        loglik, logit_model.compute_loglik_and_gradient(beta, loglik_only=True)[0]
+    )
+    assert np.allclose(
+        logit_model.compute_hessian(beta),
+        - np.sum(n_trial * predicted_prob * (1 - predicted_prob) * logit_prob ** 2)
+    )
+
 
 def set_up_cox_model_test(seed=0):
     y, X, beta = simulate_data(model='cox', seed=seed, return_design_mat=True)
@@ -97,6 +157,12 @@ def test_cox_model_sum_over_risk_set():
     assert np.all(
         CoxModel._sum_over_start_end(arr, start_index, end_index) == np.array([6, 3])
     )
+    tied_start_index = np.array([0, 0, 1])
+    tied_end_index = np.array([2, 2, 1])
+    assert np.all(
+        CoxModel._sum_over_start_end(arr, tied_start_index, tied_end_index) \
+            == np.array([6, 6, 3])
+    )
 
 def text_cox_model_sum_over_events():
 
@@ -125,4 +191,106 @@ def test_cox_model_hessian_matvec():
     cox_model, beta = set_up_cox_model_test()
     f = cox_model.compute_loglik_and_gradient
     hessian_matvec = cox_model.get_hessian_matvec_operator(beta)
-    assert numerical_direc_deriv_is_close(f, beta, hessian_matvec, seed=0)
\ No newline at end of file
+    assert numerical_direc_deriv_is_close(f, beta, hessian_matvec, seed=0)
+
+
+def test_cox_model_with_design_object():
+    np.random.seed(0)
+    X = np.random.randn(50, 3)
+    event_time, censoring_time = CoxModel.simulate_outcome(X, np.random.randn(3))
+    with pytest.raises(ValueError, match='pre-sorted'):
+        RegressionModel(
+            (event_time, censoring_time),
+            DenseDesignMatrix(X, add_intercept=False), family='cox'
+        )
+    event_time, censoring_time, X = \
+        CoxModel.preprocess_data(event_time, censoring_time, X)
+    cox_model = RegressionModel(
+        (event_time, censoring_time),
+        DenseDesignMatrix(X, add_intercept=False), family='cox'
+    )
+    assert cox_model.n_obs == X.shape[0]
+    assert np.isfinite(cox_model.compute_loglik_and_gradient(np.ones(3))[0])
+
+def test_cox_model_grouped_ties():
+    np.random.seed(0)
+    n_obs, n_pred = (200, 5)
+    X = np.random.randn(n_obs, n_pred)
+    event_time, censoring_time = CoxModel.simulate_outcome(
+        X, np.random.randn(n_pred), censoring_frac=.5
+    )
+    # Round the times to a coarse grid to create ties.
+    grid_size = np.quantile(event_time[event_time < np.inf], .1)
+    event_time = np.ceil(event_time / grid_size)
+    censoring_time = np.ceil(censoring_time / grid_size)
+    event_time, censoring_time, X = \
+        CoxModel.preprocess_data(event_time, censoring_time, X)
+    X = DenseDesignMatrix(X, add_intercept=False)
+
+    cox_model = CoxModel(event_time, censoring_time, X)
+    grouped_model = CoxModel(event_time, censoring_time, X, group_ties=True)
+    n_unique_time = len(np.unique(event_time[event_time < np.inf]))
+    assert len(grouped_model.risk_set_start_index) == n_unique_time
+    assert np.sum(grouped_model.n_tied_event) == cox_model.n_event
+
+    beta = np.random.randn(n_pred)
+    loglik, grad = cox_model.compute_loglik_and_gradient(beta)
+    grouped_loglik, grouped_grad = grouped_model.compute_loglik_and_gradient(beta)
+    assert np.allclose(loglik, grouped_loglik)
+    assert np.allclose(grad, grouped_grad)
+    v = np.random.randn(n_pred)
+    assert np.allclose(
+        cox_model.get_hessian_matvec_operator(beta)(v),
+        grouped_model.get_hessian_matvec_operator(beta)(v)
+    )
+    f = grouped_model.compute_loglik_and_gradient
+    assert numerical_grad_is_close(f, beta)
+
+
+@pytest.mark.parametrize('format_', ['dense', 'sparse'])
+def test_logistic_model_duplicate_row_compression(format_):
+    np.random.seed(0)
+    n_unique, n_pred = (20, 5)
+    X_unique = np.random.binomial(1, .3, size=(n_unique, n_pred)) \
+        * np.random.randn(n_unique, n_pred)
+    expansion_index = np.random.randint(n_unique, size=200)
+    X = X_unique[expansion_index]
+    if format_ == 'sparse':
+        X = sp.sparse.csr_matrix(X)
+    y = np.random.binomial(1, .5, size=X.shape[0])
+
+    model = RegressionModel(
+        y, X, family='logit', center_predictor=True, scale_predictor=True
+    )
+    compressed_model = RegressionModel(
+        y, X, family='logit', center_predictor=True, scale_predictor=True,
+        compress_duplicate_rows=True
+    )
+    assert compressed_model.n_obs <= n_unique
+    assert np.sum(compressed_model.n_trial) == X.shape[0]
+
+    beta = np.random.randn(model.n_pred)
+    loglik, grad = model.compute_loglik_and_gradient(beta)
+    compressed_loglik, compressed_grad = \
+        compressed_model.compute_loglik_and_gradient(beta)
+    assert np.allclose(loglik, compressed_loglik)
+    assert np.allclose(grad, compressed_grad)
+    assert np.allclose(
+        compressed_model.expand_rows(compressed_model.design.dot(beta)),
+        model.design.dot(beta)
+    )
+
+    # The input is not modified and the negative zeros match the positive.
+    if format_ == 'sparse':
+        X_unsorted = sp.sparse.csr_matrix(
+            (np.ones(3), np.array([2, 0, 1]), np.array([0, 2, 3])), shape=(2, 3)
+        )
+        LogisticModel.compress_duplicate_rows(np.ones(2), None, X_unsorted)
+        assert np.all(X_unsorted.indices == np.array([2, 0, 1]))
+    else:
+        X_signed_zero = np.array([[0., 1.], [-0., 1.]])
+        _, n_trial, X_compressed, _ = LogisticModel.compress_duplicate_rows(
+            np.ones(2), None, X_signed_zero
+        )
+        assert X_compressed.shape[0] == 1
+        assert np.all(n_trial == np.array([2.]))
@@ -0,0 +1,157 @@
+import sys
+sys.path.append(".") # needed if pytest called from the parent directory
+sys.path.append("..") # needed if pytest called from this directory.
+
+import numpy as np
+import scipy as sp
+import scipy.sparse
+import scipy.linalg
+import pytest
+from bayesbridge import BayesBridge, RegressionModel, RegressionCoefPrior
+from bayesbridge.design_matrix import SparseDesignMatrix, DenseDesignMatrix, \
+    BinaryDesignMatrix, CategoricalDesignMatrix, ChunkedDesignMatrix
+from bayesbridge.reg_coef_sampler.cg_sampler import ConjugateGradientSampler
+from bayesbridge.reg_coef_sampler.sparse_cholesky_sampler \
+    import SparseCholeskySampler
+
+
+class FixedGaussianGenerator():
+    """ Mimics BasicRandom to feed a given vector in place of the Gaussian. """
+
+    def __init__(self, gaussian_vec):
+        self.np_random = self
+        self.gaussian_vec = gaussian_vec
+
+    def randn(self, size):
+        return self.gaussian_vec.copy()
+
+
+def test_sparse_cholesky_sampler():
+
+    n_obs, n_pred = (100, 30)
+    X = sp.sparse.random(n_obs, n_pred, density=.1, format='csr', random_state=0)
+    X_design = SparseDesignMatrix(
+        X, use_mkl=False, center_predictor=False, scale_predictor=True,
+        add_intercept=True
+    )
+    obs_prec = np.random.exponential(size=n_obs)
+    prior_prec_sqrt = np.random.exponential(size=X_design.shape[1])
+    prior_prec_sqrt[0] = 0.
+    z = np.random.randn(X_design.shape[1])
+
+    X_ndarray = X_design.toarray()
+    prec_mat = X_ndarray.T.dot(obs_prec[:, np.newaxis] * X_ndarray) \
+        + np.diag(prior_prec_sqrt ** 2)
+    assert np.allclose(
+        X_design.compute_sparse_fisher_info(obs_prec).toarray(),
+        prec_mat - np.diag(prior_prec_sqrt ** 2)
+    )
+    cov = sp.linalg.inv(prec_mat)
+
+    # The mean is obtained with the zero Gaussian vector, and the covariance
+    # from the responses to the unit vectors.
+    sampler = SparseCholeskySampler(use_cholmod=False)
+    def sample(gaussian_vec):
+        return sampler.sample(
+            X_design, obs_prec, prior_prec_sqrt, z,
+            rand_gen=FixedGaussianGenerator(gaussian_vec)
+        )
+    mean = sample(np.zeros(len(z)))
+    assert np.allclose(mean, cov.dot(z))
+    noise_map = np.column_stack([
+        sample(e_i) - mean for e_i in np.eye(len(z))
+    ])
+    assert np.allclose(noise_map.dot(noise_map.T), cov)
+
+
+def test_sparse_cholesky_gibbs(tmp_path):
+
+    np.random.seed(0)
+    n_obs = 200
+    codes = np.column_stack((
+        np.random.randint(4, size=n_obs), np.random.randint(3, size=n_obs)
+    ))
+    X_design = CategoricalDesignMatrix(codes)
+    y = X_design.dot(np.random.randn(X_design.shape[1])) + np.random.randn(n_obs)
+    assert np.allclose(
+        X_design.compute_sparse_fisher_info(np.ones(n_obs)).toarray(),
+        X_design.compute_fisher_info(np.ones(n_obs))
+    )
+
+    prior = RegressionCoefPrior(bridge_exponent=.5)
+    model = RegressionModel(y, X_design, family='linear')
+    mcmc_output = BayesBridge(model, prior).gibbs(
+        0, 5, coef_sampler_type='sparse_cholesky', seed=0
+    )
+    assert mcmc_output['options']['coef_sampler_type'] == 'sparse_cholesky'
+    assert np.all(np.isfinite(mcmc_output['samples']['coef']))
+
+    # Falls back to the dense Cholesky for the designs without the sparse
+    # Fisher information.
+    shard_file = str(tmp_path / 'shard.npz')
+    sp.sparse.save_npz(shard_file, X_design.to_indicator_matrix())
+    model = RegressionModel(y, ChunkedDesignMatrix([shard_file]), family='linear')
+    with pytest.warns(UserWarning, match='sparse Fisher information'):
+        mcmc_output = BayesBridge(model, prior).gibbs(
+            0, 5, coef_sampler_type='sparse_cholesky', seed=0
+        )
+    assert mcmc_output['options']['coef_sampler_type'] == 'cholesky'
+
+
+def test_sufficient_stat_cg_gibbs():
+
+    np.random.seed(0)
+    n_obs, n_pred = (300, 10)
+    X = np.random.randn(n_obs, n_pred)
+    y = X.dot(np.random.randn(n_pred)) + np.random.randn(n_obs)
+    X_design = DenseDesignMatrix(X, add_intercept=True)
+    model = RegressionModel(y, X_design, family='linear', sufficient_stat=True)
+    XtX_sqrt = model.sufficient_stat['XtX_sqrt']
+    assert np.allclose(XtX_sqrt.dot(XtX_sqrt.T), model.sufficient_stat['XtX'])
+
+    # The Gibbs iterations are carried out without multiplying by X, so the
+    # count after the initialization does not grow with the iterations.
+    prior = RegressionCoefPrior(bridge_exponent=.5)
+    matvec_count = []
+    for n_iter in [1, 10]:
+        mcmc_output = BayesBridge(model, prior).gibbs(
+            0, n_iter, coef_sampler_type='cg', seed=0
+        )
+        matvec_count.append(X_design.get_dot_count())
+    assert np.all(np.isfinite(mcmc_output['samples']['coef']))
+    assert matvec_count[0] == matvec_count[1]
+
+
+def test_mixed_precision_cg_sampler():
+
+    n_obs, n_pred = (500, 40)
+    X = sp.sparse.random(n_obs, n_pred, density=.2, format='csr', random_state=0)
+    obs_prec = np.random.exponential(size=n_obs)
+    prior_prec_sqrt = np.random.exponential(size=n_pred + 1)
+    z = np.random.randn(n_pred + 1)
+    atol = 1e-8
+
+    for X_design in [
+            SparseDesignMatrix(X, use_mkl=False, center_predictor=True),
+            DenseDesignMatrix(X.toarray(), center_predictor=True)]:
+        X_single = X_design.as_single_precision()
+        assert X_single.X_main.dtype == np.float32
+        v = np.random.randn(n_pred + 1).astype(np.float32)
+        assert np.allclose(
+            X_single.dot(v, out=np.empty(n_obs, dtype=np.float32)),
+            X_design.dot(v.astype(np.float64)), rtol=1e-4, atol=1e-4
+        )
+
+        beta = {}
+        for mixed_precision in [False, True]:
+            cg_sampler = ConjugateGradientSampler(0, mixed_precision)
+            beta[mixed_precision], info = cg_sampler.sample(
+                X_design, obs_prec, prior_prec_sqrt, z,
+                beta_init=np.zeros(n_pred + 1), precond_by='diag',
+                atol=atol, seed=0
+            )
+            assert info['converged']
+        assert np.allclose(beta[True], beta[False], rtol=0, atol=1e-6)
+
+    X_binary = BinaryDesignMatrix((X > 0).astype(np.float64))
+    assert X_binary.as_single_precision() is X_binary